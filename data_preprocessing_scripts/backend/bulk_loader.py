@@ -0,0 +1,110 @@
+import io
+
+
+# ON CONFLICT clause that only overwrites existing rows whose modified timestamp changed;
+# overwritten rows get a new loaded_at, new rows get it from the column default
+def upsert_clause(table, key, columns):
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns.split(", ") if column != key)
+    return (
+        f"ON CONFLICT ({key}) DO UPDATE SET {updates}, loaded_at = now() "
+        f"WHERE {table}.modified IS DISTINCT FROM EXCLUDED.modified"
+    )
+
+
+# Quotes a Python list as a PostgreSQL array literal
+def array_literal(values):
+    items = []
+    for value in values:
+        if value is None:
+            items.append("NULL")
+        else:
+            items.append('"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"')
+    return "{" + ",".join(items) + "}"
+
+
+# Formats one value for COPY's text format
+def copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (list, tuple)):
+        value = array_literal(value)
+    else:
+        value = str(value)
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_rows(rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join([copy_value(value) for value in row]))
+        buffer.write("\n")
+    buffer.seek(0)
+    return buffer
+
+
+# Streams a batch of rows into a session-local staging table with COPY and merges it
+# into the target table with a single INSERT ... SELECT ... ON CONFLICT.
+# The statements are built once per table; calling the object returns the number of
+# inserted or updated rows, merge() returns the returning columns (default: the key) of
+# these rows. The caller commits.
+class BulkUpsert:
+    def __init__(self, table, key, columns, returning=None):
+        self.table = table
+        stage = f"stage_{table}"
+        self.create_stage = f"CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {table} INCLUDING DEFAULTS)"
+        self.copy = f"COPY {stage} ({columns}) FROM STDIN"
+        # DISTINCT ON: an object appearing twice in one batch may only be merged once
+        self.merge_statement = f"""
+        INSERT INTO {table} ({columns})
+        SELECT DISTINCT ON ({key}) {columns} FROM {stage}
+        ORDER BY {key}, modified DESC NULLS LAST
+        {upsert_clause(table, key, columns)}
+        RETURNING {returning or key}
+        """
+        self.truncate = f"TRUNCATE {stage}"
+
+    def merge(self, cur, rows):
+        if not rows:
+            return []
+        cur.execute(self.create_stage)
+        cur.copy_expert(self.copy, copy_rows(rows))
+        cur.execute(self.merge_statement)
+        merged = cur.fetchall()
+        cur.execute(self.truncate)
+        return merged
+
+    def __call__(self, cur, rows):
+        return len(self.merge(cur, rows))
+
+
+def bulk_upsert(cur, table, key, columns, rows):
+    return BulkUpsert(table, key, columns)(cur, rows)
+
+
+# Replaces all rows belonging to the given keys, e.g. the links of one page of objects:
+# the old rows are deleted and the new ones are copied in through a staging table.
+# Keys without new rows end up with no rows at all. The caller commits.
+class BulkReplace:
+    def __init__(self, table, key, columns):
+        self.table = table
+        stage = f"stage_{table}"
+        self.create_stage = f"CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {table} INCLUDING DEFAULTS)"
+        self.copy = f"COPY {stage} ({columns}) FROM STDIN"
+        self.delete = f"DELETE FROM {table} WHERE {key} = ANY(%s)"
+        self.insert = f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {stage} ON CONFLICT DO NOTHING"
+        self.truncate = f"TRUNCATE {stage}"
+
+    def __call__(self, cur, keys, rows):
+        if not keys:
+            return 0
+        cur.execute(self.delete, (list(keys),))
+        if not rows:
+            return 0
+        cur.execute(self.create_stage)
+        cur.copy_expert(self.copy, copy_rows(rows))
+        cur.execute(self.insert)
+        inserted = cur.rowcount
+        cur.execute(self.truncate)
+        return inserted
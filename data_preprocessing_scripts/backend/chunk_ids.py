@@ -0,0 +1,14 @@
+import hashlib
+import uuid
+
+# Namespace of the chunk IDs; changing it changes every ID and re-inserts all chunks
+CHUNK_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://web1.karlsruhe.de/ris/oparl/chunks")
+
+
+# Deterministic ID of a chunk (doc store key and ID of its summary vector): the same
+# chunk of the same PDF gets the same ID in every run, so writing it again updates the
+# existing rows instead of adding a copy. A changed chunk gets a new ID, and the old IDs
+# of the file that are not produced again are stale.
+def chunk_id(filename, index, content):
+    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{filename}\0{index}\0{content_hash}"))
@@ -1,27 +1,212 @@
-from sqlalchemy import create_engine, Column, String, LargeBinary, select, delete
+from sqlalchemy import create_engine, inspect, text, or_, Column, Index, String, LargeBinary, func, select, delete, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.ext.declarative import declarative_base
-import pickle
 import hashlib
+import threading
+import time
 from collections import OrderedDict
 from langchain_core.stores import BaseStore
 from langchain_core.documents.base import Document
 
+from backend.value_codec import FORMAT_PICKLE, JsonCodec, fingerprint_by_name
+
 Base = declarative_base()
 
 class ByteStore(Base):
     __tablename__ = 'bytestore'
+    # A key is unique within a collection (get/mget/mdelete look rows up by it)
     collection_name = Column(String, primary_key=True)
     key = Column(String, primary_key=True)
     value = Column(LargeBinary)
     value_hash = Column(String)  # New field for storing the hash of the value
-    filename = Column(String, primary_key=True)  # Include filename as part of the primary key
+    filename = Column(String, nullable=False)
+    __table_args__ = (
+        # Rows of a file, for the stale key deletion of conditional_mset
+        Index('bytestore_collection_filename_idx', 'collection_name', 'filename'),
+        # Prefix scans of yield_keys (LIKE 'prefix%'), whatever the collation of the database
+        Index('bytestore_key_pattern_idx', 'collection_name', 'key', postgresql_ops={'key': 'text_pattern_ops'}),
+    )
+
+
+# Schema migrations of the bytestore table, applied in order by migrate_schema() to tables
+# created by earlier versions (create_all only creates missing tables). The applied steps
+# are recorded in bytestore_schema; new steps are appended, never changed.
+def _add_filename_index(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS bytestore_collection_filename_idx ON bytestore (collection_name, filename)"))
+
+
+def _add_key_pattern_index(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS bytestore_key_pattern_idx ON bytestore (collection_name, key text_pattern_ops)"))
+
+
+# Primary key (collection_name, key) instead of (collection_name, key, filename). Keys that
+# occur for several files of a collection are ambiguous for get/mget and are not resolved
+# automatically.
+def _key_unique_per_collection(conn):
+    if inspect(conn).get_pk_constraint('bytestore')['constrained_columns'] == ['collection_name', 'key']:
+        return
+    duplicates = conn.execute(text("""
+    SELECT count(*) FROM (
+        SELECT 1 FROM bytestore GROUP BY collection_name, key HAVING count(*) > 1
+    ) duplicate_keys
+    """)).scalar()
+    if duplicates:
+        raise RuntimeError(
+            f"bytestore has {duplicates} keys stored for more than one file of a collection; "
+            "delete the outdated rows before the primary key can be changed to (collection_name, key)"
+        )
+    conn.execute(text("CREATE UNIQUE INDEX bytestore_collection_key_idx ON bytestore (collection_name, key)"))
+    conn.execute(text("ALTER TABLE bytestore DROP CONSTRAINT bytestore_pkey"))
+    conn.execute(text("ALTER TABLE bytestore ADD CONSTRAINT bytestore_pkey PRIMARY KEY USING INDEX bytestore_collection_key_idx"))
+    conn.execute(text("ALTER TABLE bytestore ALTER COLUMN filename SET NOT NULL"))
+
+
+# Collections whose values reencode_values has rewritten completely; pickled values of the
+# other collections are still read (see PostgresByteStore.allow_pickle)
+def _add_reencoded_table(conn):
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS bytestore_reencoded (
+        collection_name VARCHAR PRIMARY KEY,
+        codec VARCHAR NOT NULL,
+        reencoded_at TIMESTAMPTZ DEFAULT now()
+    )
+    """))
+
+
+SCHEMA_MIGRATIONS = [_add_filename_index, _add_key_pattern_index, _key_unique_per_collection, _add_reencoded_table]
+
+
+# Applies the missing migrations in one transaction; the advisory lock keeps processes that
+# start at the same time from migrating twice. Returns the names of the applied steps.
+def migrate_schema(engine):
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('bytestore_schema'))"))
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS bytestore_schema (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMPTZ DEFAULT now()
+        )
+        """))
+        version = conn.execute(text("SELECT coalesce(max(version), 0) FROM bytestore_schema")).scalar()
+        applied = []
+        for number, migration in enumerate(SCHEMA_MIGRATIONS[version:], version + 1):
+            migration(conn)
+            conn.execute(
+                text("INSERT INTO bytestore_schema (version, name) VALUES (:version, :name)"),
+                {"version": number, "name": migration.__name__.lstrip('_')},
+            )
+            applied.append(migration.__name__.lstrip('_'))
+        return applied
+
+# Read-through cache for PostgresByteStore.mget/amget, in front of the database for the
+# chunks the retriever asks for again and again. The store caches the encoded values and
+# decodes them on every hit, so each caller gets its own Document to modify. Bounded by the
+# size of the cached values; the least recently used entries are evicted first, entries
+# older than ttl seconds are not returned. Writes and deletes through the store invalidate
+# their keys; rows written by other processes (the PDF pipeline) are seen after at most ttl
+# seconds.
+# The lock is only held for dictionary operations, never across a query or an await, so one
+# cache serves threads and asyncio tasks alike. A fill is dropped if keys were invalidated
+# while its query ran, so a concurrent write is never overwritten by the value read before it.
+class ReadCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=300.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    # Cached values of keys and the generation to pass to fill() with the missing ones
+    def lookup(self, keys):
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[2] <= now:
+                    self._remove(key)
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[0]
+                    self.hits += 1
+            return found, self._generation
+
+    # items: (key, value, size of the stored value)
+    def fill(self, items, generation):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            if generation != self._generation:
+                return
+            for key, value, size in items:
+                if size > self.max_bytes:
+                    continue
+                self._remove(key)
+                self._entries[key] = (value, size, expires_at)
+                self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if self._remove(key):
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+        return entry is not None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = f"{self.hits / lookups:.0%}" if lookups else "-"
+        return (
+            f"read cache: {len(self._entries)} entries, {self.bytes / 1e6:.1f} of {self.max_bytes / 1e6:.1f} MB, "
+            f"{self.hits} hits, {self.misses} misses ({hit_rate} hits), {self.evictions} evicted, "
+            f"{self.expirations} expired, {self.invalidations} invalidated"
+        )
+
 
 class PostgresByteStore(BaseStore):
-    def __init__(self, conninfo, collection_name):
+    # codec: encoding of new values (backend/value_codec.py); values of every format are read.
+    # hashing: what value_hash is computed from, "blake2b" or "xxh3" of the canonical bytes
+    # (content and metadata) or "content-sha256" (SHA-256 of page_content only, as before).
+    # A collection switched to another hashing reports its rows as updated once.
+    # cache: optional ReadCache for mget/amget.
+    # Pickled values (written before the codecs) are read until reencode_values has rewritten
+    # the collection and recorded it in bytestore_reencoded; from then on reading a pickle
+    # raises PickleDecodeError. The record is read once, when the store is created. A store
+    # writing pickles removes it again.
+    def __init__(self, conninfo, collection_name, codec=None, hashing="blake2b", cache=None):
         self.conninfo = conninfo
         self.collection_name = collection_name
+        self.cache = cache
+        self.codec = codec or JsonCodec()
+        self.hashing = hashing
+        self.fingerprint = None if hashing == "content-sha256" else fingerprint_by_name(hashing)
 
         # Engines for synchronous and asynchronous operations
         self.engine = create_engine(conninfo)
@@ -30,6 +215,8 @@ class PostgresByteStore(BaseStore):
         # Metadata setup
         Base.metadata.bind = self.engine
         Base.metadata.create_all(self.engine)
+        migrate_schema(self.engine)
+        self.allow_pickle = self.load_allow_pickle()
 
         # Session factories for synchronous and asynchronous operations
         self.Session = scoped_session(sessionmaker(bind=self.engine))
@@ -40,18 +227,33 @@ class PostgresByteStore(BaseStore):
         hash_obj = hashlib.sha256(content.encode('utf-8'))
         return hash_obj.hexdigest()
 
-    # Helper function to serialize value with consistent ordering
+    # Helper function to serialize value with consistent ordering (the codecs sort dict keys)
     def serialize_value(self, value):
-        return pickle.dumps(self.recursive_ordered_dict(value))
-
-    # Recursive function to convert dictionaries to OrderedDicts
-    def recursive_ordered_dict(self, obj):
-        if isinstance(obj, dict):
-            return OrderedDict((k, self.recursive_ordered_dict(v)) for k, v in sorted(obj.items()))
-        elif isinstance(obj, list):
-            return [self.recursive_ordered_dict(v) for v in obj]
-        else:
-            return obj
+        return self.codec.encode(value)
+
+    def deserialize_value(self, data):
+        return self.codec.decode(data, allow_pickle=self.allow_pickle)
+
+    def load_allow_pickle(self):
+        with self.engine.begin() as conn:
+            if FORMAT_PICKLE in self.codec.formats:
+                conn.execute(
+                    text("DELETE FROM bytestore_reencoded WHERE collection_name = :collection"),
+                    {"collection": self.collection_name},
+                )
+                return True
+            return conn.execute(
+                text("SELECT 1 FROM bytestore_reencoded WHERE collection_name = :collection"),
+                {"collection": self.collection_name},
+            ).first() is None
+
+    # Records that no value of the collection is pickled any more
+    def record_reencoded(self):
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+            INSERT INTO bytestore_reencoded (collection_name, codec) VALUES (:collection, :codec)
+            ON CONFLICT (collection_name) DO UPDATE SET codec = EXCLUDED.codec, reencoded_at = now()
+            """), {"collection": self.collection_name, "codec": self.codec.name})
 
     # Extracts the relevant part of the value to be hashed
     def extract_hashable_content(self, value):
@@ -62,41 +264,146 @@ class PostgresByteStore(BaseStore):
         else:
             return str(value)
 
+    # Canonical bytes of a value and its hash, from one serialization pass
+    def encode(self, value):
+        canonical = self.codec.canonical(value)
+        if self.fingerprint is None:
+            return canonical, self.compute_hash(self.extract_hashable_content(value))
+        return canonical, self.fingerprint(canonical)
+
+    def row(self, key, filename, canonical, value_hash):
+        return dict(
+            collection_name=self.collection_name,
+            key=key,
+            value=self.codec.pack(canonical),
+            value_hash=value_hash,
+            filename=filename,
+        )
+
+    # Rows for an upsert; a key given twice within one call keeps its last value, since
+    # ON CONFLICT cannot update the same row twice in one statement
+    def upsert_rows(self, items):
+        rows = {}
+        for key, value, filename in items:
+            rows[key] = self.row(key, filename, *self.encode(value))
+        return list(rows.values())
+
+    # INSERT ... ON CONFLICT DO UPDATE on the primary key; rows whose compare column and
+    # filename did not change are not written at all (and not returned by RETURNING)
+    def upsert_statement(self, compare=ByteStore.value):
+        statement = insert(ByteStore)
+        return statement.on_conflict_do_update(
+            index_elements=[ByteStore.collection_name, ByteStore.key],
+            set_={
+                "value": statement.excluded.value,
+                "value_hash": statement.excluded.value_hash,
+                "filename": statement.excluded.filename,
+            },
+            where=or_(
+                compare.is_distinct_from(getattr(statement.excluded, compare.key)),
+                ByteStore.filename.is_distinct_from(statement.excluded.filename),
+            ),
+        )
+
+    # Statements of conditional_mset: only the rows of the batch (and of its files) are read,
+    # never the whole collection, and the hashes are compared without loading the values.
+    # key -> (filename, canonical bytes, hash) of the items; the last value of a repeated
+    # key wins. Only the changed rows are packed (compressed) afterwards.
+    def hashed_items(self, items):
+        hashed = {}
+        for key, value, filename in items:
+            hashed[key] = (filename, *self.encode(value))
+        return hashed
+
+    # Deletes the keys of the batch's files that are not in the batch
+    def stale_delete_statement(self, hashed):
+        return delete(ByteStore).where(
+            ByteStore.collection_name == self.collection_name,
+            ByteStore.filename.in_({filename for filename, _, _ in hashed.values()}),
+            ByteStore.key.not_in(list(hashed)),
+        ).returning(ByteStore.key)
+
+    def stored_hashes_statement(self, hashed):
+        return select(ByteStore.key, ByteStore.filename, ByteStore.value_hash).where(
+            ByteStore.collection_name == self.collection_name,
+            ByteStore.key.in_(list(hashed)),
+        )
+
+    # Rows whose hash changed or that moved to another file
+    def changed_rows(self, hashed, stored):
+        return [
+            self.row(key, filename, canonical, value_hash)
+            for key, (filename, canonical, value_hash) in hashed.items()
+            if stored.get(key) != (filename, value_hash)
+        ]
+
+    def conditional_report(self, deleted, hashed, stored, written):
+        report = [(key, 'DEL') for key in deleted]
+        for key in hashed:
+            if key not in written:
+                report.append((key, 'SKIP'))
+            else:
+                report.append((key, 'UPD' if key in stored else 'INS'))
+        return report
+
+    # Drops written or deleted keys from the read cache; called after the commit
+    def invalidate(self, keys):
+        if self.cache is not None:
+            self.cache.invalidate(keys)
+
+    # Cached values of keys and the keys to query, see ReadCache
+    def cache_lookup(self, keys):
+        if self.cache is None:
+            return {}, keys, None
+        found, generation = self.cache.lookup(keys)
+        missing = [key for key in keys if key not in found]
+        return {key: self.deserialize_value(data) for key, data in found.items()}, missing, generation
+
+    def cache_fill(self, fetched, generation):
+        if self.cache is not None:
+            self.cache.fill(fetched, generation)
+
+    def mget_statement(self, keys):
+        return select(ByteStore.key, ByteStore.value).where(ByteStore.collection_name == self.collection_name, ByteStore.key.in_(keys))
+
     # Synchronous methods
     def get(self, key):
         with self.Session() as session:
             result = session.execute(select(ByteStore).filter_by(collection_name=self.collection_name, key=key)).scalar()
-            return pickle.loads(result.value) if result else None
+            return self.deserialize_value(result.value) if result else None
 
     def set(self, key, value, filename):
         with self.Session() as session:
-            serialized_value = self.serialize_value(value)
-            hashable_content = self.extract_hashable_content(value)
-            entry = ByteStore(collection_name=self.collection_name, key=key, value=serialized_value, value_hash=self.compute_hash(hashable_content), filename=filename)
+            entry = ByteStore(**self.row(key, filename, *self.encode(value)))
             session.merge(entry)
             session.commit()
+        self.invalidate([key])
 
     def mget(self, keys):
-        results = {}
-        with self.Session() as session:
-            query_results = session.execute(select(ByteStore).where(ByteStore.collection_name == self.collection_name, ByteStore.key.in_(keys))).scalars()
-            for result in query_results:
-                results[result.key] = pickle.loads(result.value)
+        results, missing, generation = self.cache_lookup(keys)
+        if missing:
+            fetched = []
+            with self.Session() as session:
+                for key, value in session.execute(self.mget_statement(missing)):
+                    results[key] = self.deserialize_value(value)
+                    fetched.append((key, value, len(value)))
+            self.cache_fill(fetched, generation)
         return [results.get(key) for key in keys]
 
     def mset(self, items):
+        rows = self.upsert_rows(items)
+        if not rows:
+            return
         with self.Session() as session:
-            for key, value, filename in items:
-                serialized_value = self.serialize_value(value)
-                hashable_content = self.extract_hashable_content(value)
-                entry = ByteStore(collection_name=self.collection_name, key=key, value=serialized_value, value_hash=self.compute_hash(hashable_content), filename=filename)
-                session.merge(entry)
+            session.execute(self.upsert_statement(), rows)
             session.commit()
+        self.invalidate([row['key'] for row in rows])
 
     def mdelete(self, keys):
         with self.Session() as session:
             session.execute(delete(ByteStore).where(ByteStore.collection_name == self.collection_name, ByteStore.key.in_(keys)))
             session.commit()
+        self.invalidate(keys)
 
     def yield_keys(self, prefix=None):
         with self.Session() as session:
@@ -106,42 +413,82 @@ class PostgresByteStore(BaseStore):
             for row in session.execute(query):
                 yield row.key
 
+    # Re-encodes the values of the collection that are not in a format of the store's codec
+    # (e.g. pickles written before the codecs), batch_size rows per transaction, in key
+    # order; an interrupted run continues where it stopped. Their value_hash is recomputed
+    # with the store's hashing. Yields the number of rows re-encoded per batch. A complete
+    # run into a codec other than pickle is recorded, so pickles are no longer read.
+    def reencode_values(self, batch_size=1000):
+        last = ''
+        while True:
+            with self.Session() as session:
+                rows = session.execute(
+                    select(ByteStore.key, ByteStore.filename, ByteStore.value).where(
+                        ByteStore.collection_name == self.collection_name,
+                        ByteStore.key > last,
+                        func.length(ByteStore.value) > 0,
+                        func.get_byte(ByteStore.value, 0).not_in(self.codec.formats),
+                    ).order_by(ByteStore.key).limit(batch_size)
+                ).all()
+                if not rows:
+                    if FORMAT_PICKLE not in self.codec.formats:
+                        self.record_reencoded()
+                    return
+                # ORM bulk UPDATE by primary key
+                session.execute(update(ByteStore), [
+                    self.row(key, filename, *self.encode(self.codec.decode(value, allow_pickle=True)))
+                    for key, filename, value in rows
+                ])
+                session.commit()
+            self.invalidate([row.key for row in rows])
+            last = rows[-1].key
+            yield len(rows)
+
+    # Keys stored for a file that are not among keys, i.e. chunks of an earlier version of the file
+    def stale_keys(self, filename, keys):
+        with self.Session() as session:
+            stored = session.execute(select(ByteStore.key).where(ByteStore.collection_name == self.collection_name, ByteStore.filename == filename)).scalars()
+            return sorted(set(stored) - set(keys))
+
     # Asynchronous methods
     async def aget(self, key):
         async with self.async_session_factory() as session:
             result = await session.execute(select(ByteStore).filter_by(collection_name=self.collection_name, key=key))
             byte_store = result.scalars().first()
-            return pickle.loads(byte_store.value) if byte_store else None
+            return self.deserialize_value(byte_store.value) if byte_store else None
 
     async def aset(self, key, value, filename):
         async with self.async_session_factory() as session:
-            serialized_value = self.serialize_value(value)
-            hashable_content = self.extract_hashable_content(value)
-            entry = ByteStore(collection_name=self.collection_name, key=key, value=serialized_value, value_hash=self.compute_hash(hashable_content), filename=filename)
-            session.merge(entry)
+            entry = ByteStore(**self.row(key, filename, *self.encode(value)))
+            await session.merge(entry)
             await session.commit()
+        self.invalidate([key])
 
     async def amget(self, keys):
-        results = {}
-        async with self.async_session_factory() as session:
-            query_results = await session.execute(select(ByteStore).where(ByteStore.collection_name == self.collection_name, ByteStore.key.in_(keys)))
-            for result in query_results.scalars():
-                results[result.key] = pickle.loads(result.value)
+        results, missing, generation = self.cache_lookup(keys)
+        if missing:
+            fetched = []
+            async with self.async_session_factory() as session:
+                for key, value in await session.execute(self.mget_statement(missing)):
+                    results[key] = self.deserialize_value(value)
+                    fetched.append((key, value, len(value)))
+            self.cache_fill(fetched, generation)
         return [results.get(key) for key in keys]
 
     async def amset(self, items):
+        rows = self.upsert_rows(items)
+        if not rows:
+            return
         async with self.async_session_factory() as session:
-            for key, value, filename in items:
-                serialized_value = self.serialize_value(value)
-                hashable_content = self.extract_hashable_content(value)
-                entry = ByteStore(collection_name=self.collection_name, key=key, value=serialized_value, value_hash=self.compute_hash(hashable_content), filename=filename)
-                session.merge(entry)
+            await session.execute(self.upsert_statement(), rows)
             await session.commit()
+        self.invalidate([row['key'] for row in rows])
 
     async def amdelete(self, keys):
         async with self.async_session_factory() as session:
             await session.execute(delete(ByteStore).where(ByteStore.collection_name == self.collection_name, ByteStore.key.in_(keys)))
             await session.commit()
+        self.invalidate(keys)
 
     async def ayield_keys(self, prefix=None):
         async with self.async_session_factory() as session:
@@ -151,135 +498,76 @@ class PostgresByteStore(BaseStore):
             async for row in session.stream(query):
                 yield row.key
 
+    async def astale_keys(self, filename, keys):
+        async with self.async_session_factory() as session:
+            stored = (await session.execute(select(ByteStore.key).where(ByteStore.collection_name == self.collection_name, ByteStore.filename == filename))).scalars()
+            return sorted(set(stored) - set(keys))
+
     # New synchronous methods with hash checking
     def conditional_set(self, key, value, filename):
-        serialized_value = self.serialize_value(value)
-        hashable_content = self.extract_hashable_content(value)
-        new_hash = self.compute_hash(hashable_content)
+        canonical, new_hash = self.encode(value)
         with self.Session() as session:
-            result = session.execute(select(ByteStore).filter_by(collection_name=self.collection_name, key=key, filename=filename)).scalar()
+            result = session.execute(select(ByteStore).filter_by(collection_name=self.collection_name, key=key)).scalar()
             if result:
-                if result.value_hash == new_hash:
+                if result.value_hash == new_hash and result.filename == filename:
                     return key, 'SKIP'  # No update needed
                 operation = 'UPD'
             else:
                 operation = 'INS'
-            entry = ByteStore(collection_name=self.collection_name, key=key, value=serialized_value, value_hash=new_hash, filename=filename)
+            entry = ByteStore(**self.row(key, filename, canonical, new_hash))
             session.merge(entry)
             session.commit()
-            return key, operation
+        self.invalidate([key])
+        return key, operation
 
+    # Deletes the keys of the items' files that are not among the items, then inserts new
+    # and updates changed rows (by value_hash) in one upsert; returns (key, INS/UPD/SKIP/DEL)
     def conditional_mset(self, items):
-        modified_keys = []
-        item_keys = {(key, filename) for key, _, filename in items}
+        if not items:
+            return []
+        hashed = self.hashed_items(items)
         with self.Session() as session:
-            # Process deletions first
-            existing_keys = session.execute(
-                select(ByteStore.key).where(
-                    ByteStore.collection_name == self.collection_name,
-                    ByteStore.filename == items[0][2]
-                )
-            ).scalars().all()
-
-            keys_to_delete = set(existing_keys) - {key for key, _, _ in items}
-            if keys_to_delete:
-                session.execute(
-                    delete(ByteStore).where(
-                        ByteStore.collection_name == self.collection_name,
-                        ByteStore.filename == items[0][2],
-                        ByteStore.key.in_(keys_to_delete)
-                    )
-                )
-                modified_keys.extend([(key, 'DEL') for key in keys_to_delete])
-            session.commit()
-
-            existing_records = session.execute(select(ByteStore).filter_by(collection_name=self.collection_name)).scalars().all()
-            existing_record_map = {(record.key, record.filename): record for record in existing_records}
-
-            # Process inserts and updates
-            for key, value, filename in items:
-                serialized_value = self.serialize_value(value)
-                hashable_content = self.extract_hashable_content(value)
-                new_hash = self.compute_hash(hashable_content)
-                if (key, filename) in existing_record_map:
-                    existing_hash = existing_record_map[(key, filename)].value_hash
-                    if existing_hash == new_hash:
-                        modified_keys.append((key, 'SKIP'))
-                    else:
-                        entry = ByteStore(collection_name=self.collection_name, key=key, value=serialized_value, value_hash=new_hash, filename=filename)
-                        session.merge(entry)
-                        modified_keys.append((key, 'UPD'))
-                else:
-                    entry = ByteStore(collection_name=self.collection_name, key=key, value=serialized_value, value_hash=new_hash, filename=filename)
-                    session.add(entry)
-                    modified_keys.append((key, 'INS'))
-
+            deleted = session.execute(self.stale_delete_statement(hashed)).scalars().all()
+            stored = {key: (filename, value_hash) for key, filename, value_hash in session.execute(self.stored_hashes_statement(hashed))}
+            rows = self.changed_rows(hashed, stored)
+            written = set()
+            if rows:
+                statement = self.upsert_statement(ByteStore.value_hash).returning(ByteStore.key)
+                written = set(session.execute(statement, rows).scalars())
             session.commit()
-        return modified_keys
+        self.invalidate([*deleted, *written])
+        return self.conditional_report(deleted, hashed, stored, written)
 
     # New asynchronous methods with hash checking
     async def aconditional_set(self, key, value, filename):
-        serialized_value = self.serialize_value(value)
-        hashable_content = self.extract_hashable_content(value)
-        new_hash = self.compute_hash(hashable_content)
+        canonical, new_hash = self.encode(value)
         async with self.async_session_factory() as session:
-            result = await session.execute(select(ByteStore).filter_by(collection_name=self.collection_name, key=key, filename=filename))
+            result = await session.execute(select(ByteStore).filter_by(collection_name=self.collection_name, key=key))
             result = result.scalars().first()
             if result:
-                if result.value_hash == new_hash:
+                if result.value_hash == new_hash and result.filename == filename:
                     return key, 'SKIP'  # No update needed
                 operation = 'UPD'
             else:
                 operation = 'INS'
-            entry = ByteStore(collection_name=self.collection_name, key=key, value=serialized_value, value_hash=new_hash, filename=filename)
-            session.merge(entry)
+            entry = ByteStore(**self.row(key, filename, canonical, new_hash))
+            await session.merge(entry)
             await session.commit()
-            return key, operation
+        self.invalidate([key])
+        return key, operation
 
     async def aconditional_mset(self, items):
-        modified_keys = []
-        item_keys = {(key, filename) for key, _, filename in items}
+        if not items:
+            return []
+        hashed = self.hashed_items(items)
         async with self.async_session_factory() as session:
-            # Process deletions first
-            existing_keys = (await session.execute(
-                select(ByteStore.key).where(
-                    ByteStore.collection_name == self.collection_name,
-                    ByteStore.filename == items[0][2]
-                )
-            )).scalars().all()
-
-            keys_to_delete = set(existing_keys) - {key for key, _, _ in items}
-            if keys_to_delete:
-                await session.execute(
-                    delete(ByteStore).where(
-                        ByteStore.collection_name == self.collection_name,
-                        ByteStore.filename == items[0][2],
-                        ByteStore.key.in_(keys_to_delete)
-                    )
-                )
-                modified_keys.extend([(key, 'DEL') for key in keys_to_delete])
-            await session.commit()
-
-            existing_records = (await session.execute(select(ByteStore).filter_by(collection_name=self.collection_name))).scalars().all()
-            existing_record_map = {(record.key, record.filename): record for record in existing_records}
-
-            # Process inserts and updates
-            for key, value, filename in items:
-                serialized_value = self.serialize_value(value)
-                hashable_content = self.extract_hashable_content(value)
-                new_hash = self.compute_hash(hashable_content)
-                if (key, filename) in existing_record_map:
-                    existing_hash = existing_record_map[(key, filename)].value_hash
-                    if existing_hash == new_hash:
-                        modified_keys.append((key, 'SKIP'))
-                    else:
-                        entry = ByteStore(collection_name=self.collection_name, key=key, value=serialized_value, value_hash=new_hash, filename=filename)
-                        session.merge(entry)
-                        modified_keys.append((key, 'UPD'))
-                else:
-                    entry = ByteStore(collection_name=self.collection_name, key=key, value=serialized_value, value_hash=new_hash, filename=filename)
-                    session.add(entry)
-                    modified_keys.append((key, 'INS'))
-
+            deleted = (await session.execute(self.stale_delete_statement(hashed))).scalars().all()
+            stored = {key: (filename, value_hash) for key, filename, value_hash in await session.execute(self.stored_hashes_statement(hashed))}
+            rows = self.changed_rows(hashed, stored)
+            written = set()
+            if rows:
+                statement = self.upsert_statement(ByteStore.value_hash).returning(ByteStore.key)
+                written = set((await session.execute(statement, rows)).scalars())
             await session.commit()
-        return modified_keys
\ No newline at end of file
+        self.invalidate([*deleted, *written])
+        return self.conditional_report(deleted, hashed, stored, written)
@@ -0,0 +1,79 @@
+import hashlib
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+
+# Embeddings wrapper with a content-addressed cache in PostgreSQL: the key is the hash of
+# model and text, the vector is stored as packed float32 (4 bytes per dimension instead of
+# a float8[] or JSON). Only texts missing from the cache are sent to the wrapped model,
+# each distinct text once. Queries are not cached. The lookup is committed before the
+# model is called, so no transaction stays open during the API request.
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings, conn, model):
+        self.embeddings = embeddings
+        self.conn = conn
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+
+    def create_table(self):
+        with self.conn.cursor() as cur:
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                key CHAR(64) PRIMARY KEY,
+                model VARCHAR(255) NOT NULL,
+                dimensions INTEGER NOT NULL,
+                vector BYTEA NOT NULL,
+                created_at TIMESTAMPTZ DEFAULT now()
+            )
+            """)
+        self.conn.commit()
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        keys = [self.key(text) for text in texts]
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT key, vector FROM embedding_cache WHERE key = ANY(%s)", (list(set(keys)),))
+            vectors = {key: _decode(vector) for key, vector in cur.fetchall()}
+        self.conn.commit()
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            new = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            with self.conn.cursor() as cur:
+                cur.executemany("""
+                INSERT INTO embedding_cache (key, model, dimensions, vector)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (key) DO NOTHING
+                """, [(key, self.model, len(vector), _encode(vector)) for key, vector in new.items()])
+            self.conn.commit()
+            vectors.update(new)
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"embedding cache: {self.hits} hits, {self.misses} misses ({rate:.0%} hit rate)"
+
+
+def _encode(vector):
+    return array("f", vector).tobytes()
+
+
+def _decode(data):
+    vector = array("f")
+    vector.frombytes(bytes(data))
+    return vector.tolist()
@@ -0,0 +1,394 @@
+# Metadata table joining every file with its paper, consultations, agenda items and
+# meetings. The join is kept as a view; the table is a copy of the view that is
+# maintained incrementally, keyed on pdf_name and the 'loaded_at' columns of the
+# source tables (see backend/oparl_schema.py).
+# Relations are joined through the link tables written by the extraction (paper_file,
+# meeting_file, agenda_item_file, meeting_organization, consultation_organization) instead
+# of "= ANY(array)" or "array[1]", so the planner can use hash joins on the ids and a file
+# attached to several papers gets a row for each paper. Organizations stay limited to the
+# first one (position = 1) to keep the aggregated arrays aligned. The LEFT JOINs followed
+# by "IS NOT NULL" filters of the original query are written as the inner joins they are.
+# Every branch is already unique through its GROUP BY and its own file_type, so the
+# branches are combined with UNION ALL instead of sorting all rows again.
+TABLE = "formatted_data_v2_turmbergbahn_extended"
+SOURCE_VIEW = f"{TABLE}_source"
+OWNER_VIEW = f"{TABLE}_owner_source"
+OWNER_TABLE = f"{TABLE}_owner"
+
+SOURCE_QUERY = """
+    SELECT
+        'paper_file' AS file_type,
+        file.file_name AS pdf_name,
+        file.name AS file_title,
+        file.access_url AS access_url,
+        paper.reference AS reference,
+        paper.paper_type AS paper_type,
+        ARRAY_AGG(consultation.role) AS role,
+        ARRAY_AGG(organization.name) AS organization_name,
+        paper.name AS agenda_item,
+        ARRAY_AGG(agenda_item.result) AS result,
+        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date) AS meeting_date,
+        STRING_AGG(
+            organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', '
+        ) AS sitzungen
+    FROM paper_file
+    JOIN file ON file.file_id = paper_file.file_id
+    JOIN paper ON paper.paper_id = paper_file.paper_id
+    LEFT JOIN consultation ON paper.paper_id = consultation.paper_id
+    LEFT JOIN consultation_organization
+        ON consultation_organization.consultation_id = consultation.consultation_id
+        AND consultation_organization.position = 1
+    LEFT JOIN organization ON consultation_organization.organization_id = organization.organization_id
+    LEFT JOIN agenda_item ON consultation.agenda_item_id = agenda_item.agenda_item_id
+    LEFT JOIN meeting ON agenda_item.meeting_id = meeting.meeting_id
+    GROUP BY file.file_name, file.name, file.access_url, paper.reference, paper.paper_type, paper.name
+
+    UNION ALL
+
+    SELECT
+        'agenda_item_auxiliary_file' AS file_type,
+        file.file_name AS pdf_name,
+        file.name AS file_title,
+        file.access_url AS access_url,
+        NULL AS reference,
+        NULL AS paper_type,
+        NULL AS role,
+        ARRAY_AGG(organization.name) AS organization_name,
+        agenda_item.name AS agenda_item,
+        ARRAY_AGG(agenda_item.result) AS result,
+        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date) AS meeting_date,
+        STRING_AGG(
+            organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', '
+        ) AS sitzungen
+    FROM agenda_item_file
+    JOIN file ON file.file_id = agenda_item_file.file_id
+    JOIN agenda_item ON agenda_item.agenda_item_id = agenda_item_file.agenda_item_id
+    LEFT JOIN meeting ON agenda_item.meeting_id = meeting.meeting_id
+    LEFT JOIN meeting_organization
+        ON meeting_organization.meeting_id = meeting.meeting_id AND meeting_organization.position = 1
+    LEFT JOIN organization ON meeting_organization.organization_id = organization.organization_id
+    GROUP BY file.file_name, file.name, file.access_url, agenda_item.name
+
+    UNION ALL
+
+    SELECT
+        'meeting_auxiliary_file' AS file_type,
+        file.file_name AS pdf_name,
+        file.name AS file_title,
+        file.access_url AS access_url,
+        NULL AS reference,
+        NULL AS paper_type,
+        NULL AS role,
+        ARRAY_AGG(organization.name) AS organization_name,
+        NULL AS agenda_item,
+        NULL AS result,
+        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date) AS meeting_date,
+        STRING_AGG(
+            organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', '
+        ) AS sitzungen
+    FROM meeting_file
+    JOIN file ON file.file_id = meeting_file.file_id
+    JOIN meeting ON meeting.meeting_id = meeting_file.meeting_id
+    LEFT JOIN meeting_organization
+        ON meeting_organization.meeting_id = meeting.meeting_id AND meeting_organization.position = 1
+    LEFT JOIN organization ON meeting_organization.organization_id = organization.organization_id
+    GROUP BY file.file_name, file.name, file.access_url
+
+    UNION ALL
+
+    SELECT
+        'verbatim_protocol_file' AS file_type,
+        file.file_name AS pdf_name,
+        file.name AS file_title,
+        file.access_url AS access_url,
+        NULL AS reference,
+        NULL AS paper_type,
+        NULL AS role,
+        ARRAY_AGG(organization.name) AS organization_name,
+        NULL AS agenda_item,
+        NULL AS result,
+        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date) AS meeting_date,
+        STRING_AGG(
+            organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', '
+        ) AS sitzungen
+    FROM file
+    JOIN meeting ON file.file_id = meeting.verbatim_protocol_id
+    LEFT JOIN meeting_organization
+        ON meeting_organization.meeting_id = meeting.meeting_id AND meeting_organization.position = 1
+    LEFT JOIN organization ON meeting_organization.organization_id = organization.organization_id
+    GROUP BY file.file_name, file.name, file.access_url
+
+    UNION ALL
+
+    SELECT
+        'results_protocol_file' AS file_type,
+        file.file_name AS pdf_name,
+        file.name AS file_title,
+        file.access_url AS access_url,
+        NULL AS reference,
+        NULL AS paper_type,
+        NULL AS role,
+        ARRAY_AGG(organization.name) AS organization_name,
+        NULL AS agenda_item,
+        NULL AS result,
+        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date) AS meeting_date,
+        STRING_AGG(
+            organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', '
+        ) AS sitzungen
+    FROM file
+    JOIN meeting ON file.file_id = meeting.results_protocol_id
+    LEFT JOIN meeting_organization
+        ON meeting_organization.meeting_id = meeting.meeting_id AND meeting_organization.position = 1
+    LEFT JOIN organization ON meeting_organization.organization_id = organization.organization_id
+    GROUP BY file.file_name, file.name, file.access_url
+
+    UNION ALL
+
+    SELECT
+        'invitation_file' AS file_type,
+        file.file_name AS pdf_name,
+        file.name AS file_title,
+        file.access_url AS access_url,
+        NULL AS reference,
+        NULL AS paper_type,
+        NULL AS role,
+        ARRAY_AGG(organization.name) AS organization_name,
+        NULL AS agenda_item,
+        NULL AS result,
+        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date) AS meeting_date,
+        STRING_AGG(
+            organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', '
+        ) AS sitzungen
+    FROM file
+    JOIN meeting ON file.file_id = meeting.invitation_id
+    LEFT JOIN meeting_organization
+        ON meeting_organization.meeting_id = meeting.meeting_id AND meeting_organization.position = 1
+    LEFT JOIN organization ON meeting_organization.organization_id = organization.organization_id
+    GROUP BY file.file_name, file.name, file.access_url
+"""
+
+# Paper, agenda item or meeting every pdf_name is attached to directly. OWNER_TABLE keeps
+# these pairs as of the last refresh, so a file is recomputed when one of its former owners
+# changes, even if the changed owner dropped the link to it.
+OWNER_QUERY = """
+    SELECT file.file_name AS pdf_name, paper_file.paper_id AS owner_id
+    FROM paper_file
+    JOIN file ON file.file_id = paper_file.file_id
+    UNION ALL
+    SELECT file.file_name, agenda_item_file.agenda_item_id
+    FROM agenda_item_file
+    JOIN file ON file.file_id = agenda_item_file.file_id
+    UNION ALL
+    SELECT file.file_name, meeting_file.meeting_id
+    FROM meeting_file
+    JOIN file ON file.file_id = meeting_file.file_id
+    UNION ALL
+    SELECT file.file_name, meeting.meeting_id
+    FROM file
+    JOIN meeting ON file.file_id IN (meeting.verbatim_protocol_id, meeting.results_protocol_id, meeting.invitation_id)
+"""
+
+# pdf_names whose row depends on a row loaded at or after %(since)s. Follows the same join
+# paths as SOURCE_QUERY: file -> paper -> consultation -> organization / agenda_item ->
+# meeting, and file -> agenda_item / meeting -> organization, including the link rows.
+# Removed links leave no row behind, so the owners recorded in OWNER_TABLE are checked as
+# well; a file that drops out of the view entirely is found by VANISHED_PDF_NAMES.
+AFFECTED_PDF_NAMES = f"""
+    WITH changed_meeting AS (
+        SELECT meeting.meeting_id
+        FROM meeting
+        LEFT JOIN meeting_organization
+            ON meeting_organization.meeting_id = meeting.meeting_id AND meeting_organization.position = 1
+        LEFT JOIN organization ON meeting_organization.organization_id = organization.organization_id
+        WHERE meeting.loaded_at >= %(since)s
+           OR meeting_organization.loaded_at >= %(since)s
+           OR organization.loaded_at >= %(since)s
+    ),
+    changed_agenda_item AS (
+        SELECT agenda_item.agenda_item_id
+        FROM agenda_item
+        WHERE agenda_item.loaded_at >= %(since)s
+           OR agenda_item.meeting_id IN (SELECT meeting_id FROM changed_meeting)
+    ),
+    changed_paper AS (
+        SELECT paper.paper_id FROM paper WHERE paper.loaded_at >= %(since)s
+        UNION
+        SELECT consultation.paper_id
+        FROM consultation
+        LEFT JOIN consultation_organization
+            ON consultation_organization.consultation_id = consultation.consultation_id
+            AND consultation_organization.position = 1
+        LEFT JOIN organization ON consultation_organization.organization_id = organization.organization_id
+        WHERE consultation.loaded_at >= %(since)s
+           OR consultation_organization.loaded_at >= %(since)s
+           OR organization.loaded_at >= %(since)s
+           OR consultation.agenda_item_id IN (SELECT agenda_item_id FROM changed_agenda_item)
+    )
+    SELECT file.file_name FROM file WHERE file.loaded_at >= %(since)s
+    UNION
+    SELECT file.file_name
+    FROM paper_file
+    JOIN file ON file.file_id = paper_file.file_id
+    WHERE paper_file.loaded_at >= %(since)s
+       OR paper_file.paper_id IN (SELECT paper_id FROM changed_paper)
+    UNION
+    SELECT file.file_name
+    FROM agenda_item_file
+    JOIN file ON file.file_id = agenda_item_file.file_id
+    WHERE agenda_item_file.loaded_at >= %(since)s
+       OR agenda_item_file.agenda_item_id IN (SELECT agenda_item_id FROM changed_agenda_item)
+    UNION
+    SELECT file.file_name
+    FROM meeting_file
+    JOIN file ON file.file_id = meeting_file.file_id
+    WHERE meeting_file.loaded_at >= %(since)s
+       OR meeting_file.meeting_id IN (SELECT meeting_id FROM changed_meeting)
+    UNION
+    SELECT file.file_name
+    FROM meeting
+    JOIN changed_meeting USING (meeting_id)
+    CROSS JOIN LATERAL unnest(
+        ARRAY[meeting.verbatim_protocol_id, meeting.results_protocol_id, meeting.invitation_id]::TEXT[]
+    ) AS protocol_file(file_id)
+    JOIN file ON file.file_id = protocol_file.file_id
+    UNION
+    SELECT pdf_name
+    FROM {OWNER_TABLE}
+    WHERE owner_id IN (
+        SELECT meeting_id FROM changed_meeting
+        UNION ALL
+        SELECT agenda_item_id FROM changed_agenda_item
+        UNION ALL
+        SELECT paper_id FROM changed_paper
+    )
+"""
+
+# pdf_names in the table that the view no longer produces, e.g. after a file was renamed or
+# lost its last paper or meeting. Only the inner joins of SOURCE_QUERY decide whether a
+# pdf_name exists, so this skips the aggregation of the full view.
+VANISHED_PDF_NAMES = f"""
+    SELECT DISTINCT pdf_name
+    FROM {TABLE}
+    WHERE pdf_name IS NOT NULL AND NOT EXISTS (
+        SELECT 1
+        FROM (
+            SELECT file.file_name
+            FROM paper_file
+            JOIN file ON file.file_id = paper_file.file_id
+            JOIN paper ON paper.paper_id = paper_file.paper_id
+            UNION ALL
+            SELECT file.file_name
+            FROM agenda_item_file
+            JOIN file ON file.file_id = agenda_item_file.file_id
+            JOIN agenda_item ON agenda_item.agenda_item_id = agenda_item_file.agenda_item_id
+            UNION ALL
+            SELECT file.file_name
+            FROM meeting_file
+            JOIN file ON file.file_id = meeting_file.file_id
+            JOIN meeting ON meeting.meeting_id = meeting_file.meeting_id
+            UNION ALL
+            SELECT file.file_name
+            FROM file
+            JOIN meeting ON file.file_id IN (meeting.verbatim_protocol_id, meeting.results_protocol_id, meeting.invitation_id)
+        ) AS source (file_name)
+        WHERE source.file_name = {TABLE}.pdf_name
+    )
+"""
+
+# Latest load time over all source tables, used as watermark of the last refresh. Unlike
+# the server's 'modified', it only grows in the order rows are written, as long as the
+# extraction does not write while the refresh runs.
+SOURCE_LOADED_AT = """
+    SELECT GREATEST(
+        (SELECT max(loaded_at) FROM file),
+        (SELECT max(loaded_at) FROM paper),
+        (SELECT max(loaded_at) FROM consultation),
+        (SELECT max(loaded_at) FROM organization),
+        (SELECT max(loaded_at) FROM agenda_item),
+        (SELECT max(loaded_at) FROM meeting),
+        (SELECT max(loaded_at) FROM paper_file),
+        (SELECT max(loaded_at) FROM agenda_item_file),
+        (SELECT max(loaded_at) FROM meeting_file),
+        (SELECT max(loaded_at) FROM meeting_organization),
+        (SELECT max(loaded_at) FROM consultation_organization)
+    )
+"""
+
+
+def create_formatted_table(cur):
+    cur.execute(f"CREATE OR REPLACE VIEW {SOURCE_VIEW} AS {SOURCE_QUERY}")
+    cur.execute(f"CREATE OR REPLACE VIEW {OWNER_VIEW} AS {OWNER_QUERY}")
+    cur.execute("SELECT to_regclass(%s) IS NULL", (OWNER_TABLE,))
+    owner_table_missing = cur.fetchone()[0]
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} AS SELECT * FROM {SOURCE_VIEW} WITH NO DATA;
+    CREATE INDEX IF NOT EXISTS {TABLE}_pdf_name_idx ON {TABLE} (pdf_name);
+    CREATE TABLE IF NOT EXISTS {OWNER_TABLE} AS SELECT * FROM {OWNER_VIEW} WITH NO DATA;
+    CREATE INDEX IF NOT EXISTS {OWNER_TABLE}_owner_id_idx ON {OWNER_TABLE} (owner_id);
+    CREATE INDEX IF NOT EXISTS {OWNER_TABLE}_pdf_name_idx ON {OWNER_TABLE} (pdf_name);
+    CREATE TABLE IF NOT EXISTS formatted_data_refresh (
+        table_name VARCHAR(255) PRIMARY KEY,
+        source_loaded_at TIMESTAMPTZ,
+        refreshed_at TIMESTAMPTZ DEFAULT now()
+    );
+    -- the watermark used to be the highest 'modified'; without it the next refresh rebuilds
+    ALTER TABLE formatted_data_refresh ADD COLUMN IF NOT EXISTS source_loaded_at TIMESTAMPTZ;
+    ALTER TABLE formatted_data_refresh DROP COLUMN IF EXISTS source_modified;
+    """)
+    # A table refreshed before the owners were recorded is rebuilt once to fill them
+    if owner_table_missing:
+        cur.execute("DELETE FROM formatted_data_refresh WHERE table_name = %s", (TABLE,))
+
+
+# Metadata columns of many PDFs in one query (served by the pdf_name index) instead of one
+# query per PDF, as {pdf_name: row}. A file attached to several papers or meetings has
+# several rows; the first one in column order is used, so the choice is the same in every run.
+def fetch_metadata(cur, pdf_names, columns):
+    column_list = ", ".join(columns)
+    cur.execute(f"""
+    SELECT DISTINCT ON (pdf_name) pdf_name, {column_list}
+    FROM {TABLE}
+    WHERE pdf_name = ANY(%s)
+    ORDER BY pdf_name, {column_list}
+    """, (list(pdf_names),))
+    return {row[0]: row[1:] for row in cur.fetchall()}
+
+
+# Brings the table up to date and returns the number of recomputed pdf_names (None for a
+# full rebuild). Rows are replaced with DELETE/INSERT inside the caller's transaction, so
+# readers keep seeing the previous state until the caller commits. pdf_names the view no
+# longer produces are recomputed as well, which removes their rows. OWNER_TABLE is
+# replaced for the same pdf_names.
+def refresh_formatted_table(cur, full=False):
+    cur.execute("SELECT source_loaded_at FROM formatted_data_refresh WHERE table_name = %s", (TABLE,))
+    row = cur.fetchone()
+    since = row[0] if row else None
+    cur.execute(SOURCE_LOADED_AT)
+    source_loaded_at = cur.fetchone()[0]
+
+    if full or since is None:
+        cur.execute(f"DELETE FROM {TABLE}")
+        cur.execute(f"INSERT INTO {TABLE} SELECT * FROM {SOURCE_VIEW}")
+        cur.execute(f"DELETE FROM {OWNER_TABLE}")
+        cur.execute(f"INSERT INTO {OWNER_TABLE} SELECT * FROM {OWNER_VIEW}")
+        recomputed = None
+    else:
+        cur.execute(AFFECTED_PDF_NAMES, {"since": since})
+        pdf_names = {name for name, in cur.fetchall()}
+        cur.execute(VANISHED_PDF_NAMES)
+        pdf_names.update(name for name, in cur.fetchall())
+        pdf_names = sorted(name for name in pdf_names if name is not None)
+        if pdf_names:
+            cur.execute(f"DELETE FROM {TABLE} WHERE pdf_name = ANY(%s)", (pdf_names,))
+            cur.execute(f"INSERT INTO {TABLE} SELECT * FROM {SOURCE_VIEW} WHERE pdf_name = ANY(%s)", (pdf_names,))
+            cur.execute(f"DELETE FROM {OWNER_TABLE} WHERE pdf_name = ANY(%s)", (pdf_names,))
+            cur.execute(f"INSERT INTO {OWNER_TABLE} SELECT * FROM {OWNER_VIEW} WHERE pdf_name = ANY(%s)", (pdf_names,))
+        recomputed = len(pdf_names)
+
+    cur.execute("""
+    INSERT INTO formatted_data_refresh (table_name, source_loaded_at, refreshed_at)
+    VALUES (%s, %s, now())
+    ON CONFLICT (table_name) DO UPDATE
+    SET source_loaded_at = EXCLUDED.source_loaded_at, refreshed_at = now()
+    """, (TABLE, source_loaded_at))
+    return recomputed
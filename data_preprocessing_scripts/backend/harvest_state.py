@@ -0,0 +1,76 @@
+from datetime import datetime
+from urllib.parse import urlencode
+
+
+# Per-endpoint bookkeeping of the OParl harvest, stored next to the harvested tables
+def create_state_tables(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sync_watermark (
+        endpoint VARCHAR(255) PRIMARY KEY,
+        modified TIMESTAMPTZ NOT NULL,
+        updated_at TIMESTAMPTZ DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS harvest_checkpoint (
+        endpoint VARCHAR(255) PRIMARY KEY,
+        next_url TEXT,
+        max_modified TIMESTAMPTZ,
+        finished BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at TIMESTAMPTZ DEFAULT now()
+    );
+    """)
+
+
+# Returns {endpoint: highest modified timestamp seen so far}
+def load_watermarks(cur):
+    cur.execute("SELECT endpoint, modified FROM sync_watermark")
+    return dict(cur.fetchall())
+
+
+# Moves the watermark of an endpoint forward, never backwards
+def save_watermark(cur, endpoint, modified):
+    cur.execute("""
+    INSERT INTO sync_watermark (endpoint, modified, updated_at)
+    VALUES (%s, %s, now())
+    ON CONFLICT (endpoint) DO UPDATE
+    SET modified = GREATEST(sync_watermark.modified, EXCLUDED.modified), updated_at = now()
+    """, (endpoint, modified))
+
+
+# Returns {endpoint: (next_url, max_modified, finished)} of an interrupted harvest
+def load_checkpoints(cur):
+    cur.execute("SELECT endpoint, next_url, max_modified, finished FROM harvest_checkpoint")
+    return {endpoint: (next_url, modified, finished) for endpoint, next_url, modified, finished in cur.fetchall()}
+
+
+# Records the link of the next page after a page has been loaded; meant to run in the
+# same transaction as that page's rows so that both are committed together
+def save_checkpoint(cur, endpoint, next_url, modified):
+    cur.execute("""
+    INSERT INTO harvest_checkpoint (endpoint, next_url, max_modified, finished, updated_at)
+    VALUES (%s, %s, %s, %s, now())
+    ON CONFLICT (endpoint) DO UPDATE
+    SET next_url = EXCLUDED.next_url, max_modified = EXCLUDED.max_modified,
+        finished = EXCLUDED.finished, updated_at = now()
+    """, (endpoint, next_url, modified, next_url is None))
+
+
+# Called after a complete harvest, the next run starts from the first page again
+def clear_checkpoints(cur):
+    cur.execute("DELETE FROM harvest_checkpoint")
+
+
+# Adds OParl's modified_since filter to the first page of an endpoint
+def modified_since_url(url, modified):
+    separator = "&" if "?" in url else "?"
+    return f"{url}{separator}{urlencode({'modified_since': modified.isoformat()})}"
+
+
+# Highest modified timestamp of a page of OParl objects, None if no object carries one
+def max_modified(objects, current=None):
+    for obj in objects:
+        value = obj.get("modified")
+        if value:
+            modified = datetime.fromisoformat(value)
+            if current is None or modified > current:
+                current = modified
+    return current
@@ -0,0 +1,53 @@
+import asyncio
+
+from langchain_core.documents import Document
+from langchain_postgres.vectorstores import PGVector
+
+from backend.ingest_writer import collection_uuid
+from backend.vector_index import search
+
+
+# PGVector whose similarity searches go through backend.vector_index.search(), i.e. order by
+# the same cast expression as the index of ensure_vector_index, so the partial HNSW/IVFFlat
+# index serves them. PGVector itself orders by the raw embedding column, which no index
+# covers (it has no dimensions), and scans the whole collection. similarity_search,
+# similarity_search_by_vector, similarity_search_with_score and the relevance-score search
+# of a MultiVectorRetriever all end in similarity_search_with_score_by_vector.
+# Searches with a metadata filter, the MMR search and an async-only store keep the exact
+# search of PGVector. ef_search (HNSW) and probes (IVFFlat) are set for every search.
+class IndexedPGVector(PGVector):
+    def __init__(self, *args, ef_search=None, probes=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ef_search = ef_search
+        self.probes = probes
+        self._collection_id = None
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        if filter is not None or self._engine is None:
+            return super().similarity_search_with_score_by_vector(embedding, k=k, filter=filter, **kwargs)
+        distance = getattr(self._distance_strategy, "value", self._distance_strategy)
+        conn = self._engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            if self._collection_id is None:
+                self._collection_id = collection_uuid(cur, self.collection_name)
+            rows = search(
+                cur, self._collection_id, len(embedding), embedding, k=k, distance=distance,
+                ef_search=self.ef_search, probes=self.probes,
+            )
+            cur.close()
+        finally:
+            # ends the transaction the search settings were local to
+            conn.rollback()
+            conn.close()
+        return [
+            (Document(id=str(id), page_content=document, metadata=metadata or {}), score)
+            for id, document, metadata, score in rows
+        ]
+
+    async def asimilarity_search_with_score_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        if filter is not None or self._engine is None:
+            return await super().asimilarity_search_with_score_by_vector(embedding, k=k, filter=filter, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.similarity_search_with_score_by_vector(embedding, k=k)
+        )
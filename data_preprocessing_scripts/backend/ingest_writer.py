@@ -0,0 +1,109 @@
+import json
+
+# Summary vectors and original chunks of the PDFs live in the same database: the vectors in
+# the tables of langchain_postgres (langchain_pg_embedding, collection "summaries"), the
+# chunks in the bytestore table of PostgresByteStore. Writing both through their own
+# clients means two transactions on two connections, and a crash in between leaves vectors
+# pointing at missing chunks or chunks without a vector. IngestWriter writes both (and
+# whatever else the caller does on the cursor, e.g. the processing manifest) in the
+# caller's transaction instead, so a PDF is stored completely or not at all.
+# The row formats are those of PGVector and PostgresByteStore, so both keep reading them.
+
+
+# Expression index for the lookups and anti-joins on the doc_id of a summary vector
+def create_doc_id_index(cur):
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS langchain_pg_embedding_doc_id_idx
+    ON langchain_pg_embedding ((cmetadata->>'doc_id'))
+    """)
+
+
+def collection_uuid(cur, collection_name):
+    cur.execute("SELECT uuid FROM langchain_pg_collection WHERE name = %s", (collection_name,))
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError(f"Vector store collection {collection_name!r} does not exist")
+    return row[0]
+
+
+def _vector_literal(vector):
+    return "[" + ",".join(repr(float(value)) for value in vector) + "]"
+
+
+class IngestWriter:
+    def __init__(self, cur, docstore, collection_name, id_key="doc_id"):
+        self.docstore = docstore
+        self.collection_id = collection_uuid(cur, collection_name)
+        self.id_key = id_key
+        create_doc_id_index(cur)
+
+    # documents: (doc_id, Document, filename) as for PostgresByteStore.mset; summaries:
+    # Documents whose metadata holds the doc_id, with their vectors. Upserts on the IDs,
+    # then removes chunks and vectors of the file that were not written again (an earlier
+    # version of it). Returns the number of removed chunks. Does not commit.
+    def write_file(self, cur, filename, documents, summaries, vectors):
+        rows = self.docstore.upsert_rows(documents)
+        cur.executemany("""
+        INSERT INTO bytestore (collection_name, key, value, value_hash, filename)
+        VALUES (%(collection_name)s, %(key)s, %(value)s, %(value_hash)s, %(filename)s)
+        ON CONFLICT (collection_name, key) DO UPDATE
+        SET value = EXCLUDED.value, value_hash = EXCLUDED.value_hash, filename = EXCLUDED.filename
+        WHERE bytestore.value IS DISTINCT FROM EXCLUDED.value
+           OR bytestore.filename IS DISTINCT FROM EXCLUDED.filename
+        """, rows)
+
+        cur.executemany("""
+        INSERT INTO langchain_pg_embedding (id, collection_id, embedding, document, cmetadata)
+        VALUES (%s, %s, %s::vector, %s, %s::jsonb)
+        ON CONFLICT (id) DO UPDATE
+        SET collection_id = EXCLUDED.collection_id, embedding = EXCLUDED.embedding,
+            document = EXCLUDED.document, cmetadata = EXCLUDED.cmetadata
+        """, [
+            (summary.metadata[self.id_key], self.collection_id, _vector_literal(vector),
+             summary.page_content, json.dumps(summary.metadata))
+            for summary, vector in zip(summaries, vectors)
+        ])
+
+        cur.execute("""
+        SELECT key FROM bytestore
+        WHERE collection_name = %s AND filename = %s AND NOT (key = ANY(%s))
+        """, (self.docstore.collection_name, filename, [row["key"] for row in rows]))
+        stale = [key for key, in cur.fetchall()]
+        if stale:
+            cur.execute("""
+            DELETE FROM langchain_pg_embedding
+            WHERE collection_id = %s AND cmetadata->>'doc_id' = ANY(%s)
+            """, (self.collection_id, stale))
+            cur.execute("""
+            DELETE FROM bytestore WHERE collection_name = %s AND key = ANY(%s)
+            """, (self.docstore.collection_name, stale))
+        return len(stale)
+
+
+# Orphans left by earlier versions of the pipeline or by interrupted runs: summary vectors
+# whose doc_id has no chunk in the doc store, and chunks no summary vector points to.
+# Both are removed with one set-based anti-join each; with dry_run they are only counted.
+# Returns (orphaned vectors, orphaned chunks). Does not commit.
+def collect_orphans(cur, collection_name, docstore_collection, dry_run=False):
+    collection_id = collection_uuid(cur, collection_name)
+    create_doc_id_index(cur)
+    action = "SELECT count(*)" if dry_run else "DELETE"
+    cur.execute(f"""
+    {action} FROM langchain_pg_embedding e
+    WHERE e.collection_id = %s
+      AND NOT EXISTS (
+          SELECT 1 FROM bytestore b
+          WHERE b.collection_name = %s AND b.key = e.cmetadata->>'doc_id'
+      )
+    """, (collection_id, docstore_collection))
+    vectors = cur.fetchone()[0] if dry_run else cur.rowcount
+    cur.execute(f"""
+    {action} FROM bytestore b
+    WHERE b.collection_name = %s
+      AND NOT EXISTS (
+          SELECT 1 FROM langchain_pg_embedding e
+          WHERE e.collection_id = %s AND e.cmetadata->>'doc_id' = b.key
+      )
+    """, (docstore_collection, collection_id))
+    chunks = cur.fetchone()[0] if dry_run else cur.rowcount
+    return vectors, chunks
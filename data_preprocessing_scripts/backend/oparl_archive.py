@@ -0,0 +1,70 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from backend.oparl_harvester import Page
+
+
+# Local archive of raw OParl pages.
+# Every page body is stored once under the SHA-256 of its canonical JSON
+# (objects/ab/abcdef....json.gz); a JSONL manifest per endpoint records the order in
+# which pages were fetched. Re-harvesting unchanged pages only appends manifest lines.
+class PageArchive:
+    def __init__(self, root, compresslevel=6):
+        self.root = root
+        self.compresslevel = compresslevel
+        self._manifest_lock = threading.Lock()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "manifests"), exist_ok=True)
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], f"{digest}.json.gz")
+
+    def _manifest_path(self, endpoint):
+        return os.path.join(self.root, "manifests", f"{endpoint}.jsonl")
+
+    # Stores one page as returned by the API; safe to call from several crawler threads
+    def store(self, endpoint, url, page):
+        payload = json.dumps(page, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        digest = hashlib.sha256(payload).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, "wb", compresslevel=self.compresslevel) as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        with self._manifest_lock, open(self._manifest_path(endpoint), "a", encoding="utf-8") as f:
+            f.write(json.dumps({"url": url, "digest": digest}) + "\n")
+        return digest
+
+    def load(self, digest):
+        with gzip.open(self._object_path(digest), "rb") as f:
+            return json.loads(f.read())
+
+    # Digests of an endpoint in fetch order, pages archived by several runs only once
+    def digests(self, endpoint):
+        path = self._manifest_path(endpoint)
+        if not os.path.exists(path):
+            return []
+        seen = set()
+        entries = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry["digest"] not in seen:
+                    seen.add(entry["digest"])
+                    entries.append(entry)
+        return entries
+
+    # Yields the archived pages like OParlHarvester.harvest, without any network access.
+    # The last page of each endpoint has next_url None.
+    def replay(self, endpoints):
+        for endpoint in endpoints:
+            entries = self.digests(endpoint)
+            for i, entry in enumerate(entries):
+                page = self.load(entry["digest"])
+                next_url = entries[i + 1]["url"] if i + 1 < len(entries) else None
+                yield Page(endpoint, entry["url"], page["data"], next_url)
@@ -0,0 +1,139 @@
+import queue
+import random
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# One fetched page of an OParl list endpoint; next_url is None on the last page
+Page = namedtuple("Page", ["endpoint", "url", "data", "next_url"])
+
+# Marker a crawler thread puts on the queue once its endpoint is exhausted
+_DONE = object()
+
+# Responses worth another attempt; every other non-2xx status fails immediately
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class OParlHarvester:
+    def __init__(self, max_per_host=4, queue_size=20, timeout=60, link_rewrite=None,
+                 max_retries=5, backoff_base=1.0, backoff_max=60.0, archive=None):
+        self.max_per_host = max_per_host
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.link_rewrite = link_rewrite
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Optional PageArchive receiving every fetched page
+        self.archive = archive
+
+        # One keep-alive session shared by all crawler threads, sized to the per-host cap
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_per_host)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._host_limits = {}
+        self._host_limits_lock = threading.Lock()
+
+    # Semaphore limiting the number of concurrent requests against one host
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_limits[host]
+
+    def _next_link(self, data):
+        url = data.get("links", {}).get("next")
+        if url and self.link_rewrite:
+            url = self.link_rewrite(url)
+        return url
+
+    # Exponential backoff with jitter, a Retry-After header of the server takes precedence
+    def _retry_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    # Fetches one page; timeouts, connection errors and the statuses in RETRY_STATUS are
+    # retried up to max_retries times, after that the error is raised
+    def fetch_page(self, url):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._host_limit(url):
+                    response = self.session.get(url, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                reason = type(exc).__name__
+            else:
+                if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    response.raise_for_status()
+                    return response.json()
+                delay = self._retry_delay(attempt, response)
+                reason = f"HTTP {response.status_code}"
+            print(f"{reason} for {url}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+            time.sleep(delay)
+
+    # Puts an item on the page queue without blocking forever once the consumer has stopped
+    def _put(self, pages, stop, item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    # Crawls one endpoint page by page; runs in its own thread
+    def _crawl(self, endpoint, url, pages, stop):
+        try:
+            while url and not stop.is_set():
+                data = self.fetch_page(url)
+                if self.archive is not None:
+                    self.archive.store(endpoint, url, data)
+                next_url = self._next_link(data)
+                self._put(pages, stop, Page(endpoint, url, data["data"], next_url))
+                url = next_url
+        except Exception as exc:
+            self._put(pages, stop, exc)
+        finally:
+            self._put(pages, stop, _DONE)
+
+    # Crawls all endpoints in parallel and yields their pages in the calling thread.
+    # While the caller processes page N, the crawler threads already fetch the following
+    # pages; the bounded queue stops them from running too far ahead.
+    def harvest(self, endpoints):
+        pages = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=self._crawl, args=(endpoint, url, pages, stop), daemon=True)
+            for endpoint, url in endpoints.items()
+        ]
+        for thread in threads:
+            thread.start()
+
+        remaining = len(threads)
+        try:
+            while remaining:
+                item = pages.get()
+                if item is _DONE:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,396 @@
+import json
+from collections import namedtuple
+
+from backend.bulk_loader import BulkReplace, BulkUpsert
+
+# Extraction rules for a field of an OParl object
+VALUE = "value"        # obj.get(source, default)
+REF = "ref"            # embedded object, only its id is stored
+REF_LIST = "ref_list"  # list of embedded objects, stored as TEXT[] of their ids
+JSON = "json"          # stored as JSON text
+
+# source: key in the OParl object, column/type: target column, transform: applied to the extracted value
+Field = namedtuple("Field", ["source", "column", "type", "rule", "default", "transform"])
+Field.__new__.__defaults__ = (VALUE, None, None)
+
+# Secondary index; expression is a column or a parenthesized expression such as "(paper_id[1])"
+Index = namedtuple("Index", ["name", "expression", "method"])
+Index.__new__.__defaults__ = ("btree",)
+
+# Link table (owner key, target, position) normalizing the id array in column of the entity,
+# e.g. Link("paper_file", "paper_id", "paper_id") on file -> paper_file(file_id, paper_id, position)
+Link = namedtuple("Link", ["table", "column", "target"])
+
+# Time the row was last written by the extraction (set by the upsert and the link
+# replacement), independent of the server's 'modified'. backend/formatted_data.py uses it
+# as watermark, so rows loaded late (resumed or replayed runs, backfilled links) are seen
+# even if their 'modified' is older than the last refresh.
+LOADED_AT = "loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+
+
+# Download links of files still point to the old path without /ris
+def fix_ris_url(url):
+    return url.replace('web1.karlsruhe.de/oparl', 'web1.karlsruhe.de/ris/oparl') if url else url
+
+
+# Builds the function extracting one column value from an OParl object
+def compile_getter(field):
+    source, default = field.source, field.default
+    if field.rule == VALUE:
+        getter = lambda obj: obj.get(source, default)
+    elif field.rule == REF:
+        getter = lambda obj: (obj.get(source) or {}).get('id')
+    elif field.rule == REF_LIST:
+        getter = lambda obj: [ref['id'] for ref in obj.get(source) or []]
+    elif field.rule == JSON:
+        getter = lambda obj: json.dumps(obj.get(source))
+    else:
+        raise ValueError(f"Unknown extraction rule {field.rule!r} for field {source!r}")
+    if field.transform:
+        transform = field.transform
+        return lambda obj: transform(getter(obj))
+    return getter
+
+
+class Entity:
+    def __init__(self, table, endpoint, fields, indexes=(), links=()):
+        self.table = table
+        self.endpoint = endpoint
+        self.fields = fields
+        self.indexes = indexes
+        self.links = links
+        self.key = fields[0].column
+        self.columns = ", ".join(field.column for field in fields)
+        self.getters = [compile_getter(field) for field in fields]
+        # The merge returns the key and the link columns of the rows it wrote
+        self.upsert = BulkUpsert(
+            table, self.key, self.columns, returning=", ".join([self.key] + [link.column for link in links])
+        )
+        self.link_loaders = [
+            (column, BulkReplace(link.table, self.key, f"{self.key}, {link.target}, position"))
+            for column, link in enumerate(links, 1)
+        ]
+
+    def ddl(self):
+        columns = ",\n        ".join(f"{field.column} {field.type}" for field in self.fields)
+        statements = [
+            f"CREATE TABLE IF NOT EXISTS {self.table} (\n        {columns},\n        {LOADED_AT}\n    );",
+            # tables created before the column existed
+            f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS {LOADED_AT};",
+            f"CREATE INDEX IF NOT EXISTS {self.table}_loaded_at_idx ON {self.table} (loaded_at);",
+        ]
+        for index in self.indexes:
+            statements.append(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_{index.name}_idx "
+                f"ON {self.table} USING {index.method} ({index.expression});"
+            )
+        for link in self.links:
+            statements.append(f"""CREATE TABLE IF NOT EXISTS {link.table} (
+        {self.key} VARCHAR(255) NOT NULL,
+        {link.target} VARCHAR(255) NOT NULL,
+        position INTEGER NOT NULL,
+        {LOADED_AT},
+        PRIMARY KEY ({self.key}, {link.target})
+    );
+ALTER TABLE {link.table} ADD COLUMN IF NOT EXISTS {LOADED_AT};
+CREATE INDEX IF NOT EXISTS {link.table}_{link.target}_idx ON {link.table} ({link.target});
+CREATE INDEX IF NOT EXISTS {link.table}_loaded_at_idx ON {link.table} (loaded_at);""")
+        return "\n".join(statements)
+
+    # Fills empty link tables from the array columns, for tables loaded before the links existed
+    def backfill_links(self, cur):
+        for link in self.links:
+            cur.execute(f"""
+            INSERT INTO {link.table} ({self.key}, {link.target}, position)
+            SELECT {self.table}.{self.key}, target.id, target.position
+            FROM {self.table}
+            CROSS JOIN LATERAL unnest({self.table}.{link.column}) WITH ORDINALITY AS target(id, position)
+            WHERE target.id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {link.table})
+            ON CONFLICT DO NOTHING
+            """)
+
+    def extract_rows(self, objects):
+        getters = self.getters
+        return [tuple([get(obj) for get in getters]) for obj in objects]
+
+    # Writes one page of OParl objects and replaces the links of the objects that were
+    # inserted or changed, from the row version that was merged; links of unchanged objects
+    # are left alone, so their loaded_at stays as well. The caller commits.
+    def load(self, cur, objects):
+        merged = self.upsert.merge(cur, self.extract_rows(objects))
+        if merged and self.link_loaders:
+            keys = [row[0] for row in merged]
+            for column, replace in self.link_loaders:
+                replace(cur, keys, [
+                    (row[0], target, position)
+                    for row in merged
+                    for position, target in enumerate(row[column] or [], 1)
+                    if target is not None
+                ])
+        return len(merged)
+
+
+PERSON = Entity("person", "people", [
+    Field('id', 'person_id', 'VARCHAR(255) PRIMARY KEY'),
+    Field('type', 'type_id', 'VARCHAR(255) NOT NULL'),
+    Field('body', 'body_id', 'VARCHAR(255) NOT NULL'),
+    Field('name', 'name', 'VARCHAR(255)'),
+    Field('familyName', 'familyName', 'VARCHAR(255)'),
+    Field('givenName', 'givenName', 'VARCHAR(255)'),
+    Field('formOfAddress', 'formOfAddress', 'VARCHAR(255)'),
+    Field('affix', 'affix', 'VARCHAR(255)'),
+    Field('title', 'title', 'TEXT[]'),
+    Field('gender', 'gender', 'VARCHAR(50)'),
+    Field('phone', 'phone', 'TEXT[]'),
+    Field('email', 'email', 'TEXT[]'),
+    Field('location', 'location_id', 'VARCHAR(255)'),
+    Field('status', 'status', 'TEXT[]'),
+    Field('membership', 'membership_id', 'TEXT[]', REF_LIST),
+    Field('life', 'life', 'TEXT'),
+    Field('lifeSource', 'lifeSource', 'VARCHAR(255)'),
+    Field('license', 'license', 'VARCHAR(255)'),
+    Field('keyword', 'keyword', 'TEXT[]'),
+    Field('created', 'created', 'TIMESTAMPTZ'),
+    Field('modified', 'modified', 'TIMESTAMPTZ'),
+    Field('web', 'web', 'VARCHAR(255)'),
+    Field('deleted', 'deleted', 'BOOLEAN DEFAULT FALSE', default=False),
+])
+
+MEMBERSHIP = Entity("membership", "memberships", [
+    Field('id', 'membership_id', 'VARCHAR(255) PRIMARY KEY'),
+    Field('type', 'type_id', 'VARCHAR(255) NOT NULL'),
+    Field('person', 'person_id', 'VARCHAR(255)'),
+    Field('organization', 'organization_id', 'VARCHAR(255)'),
+    Field('role', 'role', 'VARCHAR(255)'),
+    Field('votingRight', 'votingRight', 'BOOLEAN'),
+    Field('startDate', 'startDate', 'DATE'),
+    Field('endDate', 'endDate', 'DATE'),
+    Field('onBehalfOf', 'onBehalfOf', 'VARCHAR(255)'),
+    Field('license', 'license', 'VARCHAR(255)'),
+    Field('keyword', 'keyword', 'TEXT[]'),
+    Field('created', 'created', 'TIMESTAMPTZ'),
+    Field('modified', 'modified', 'TIMESTAMPTZ'),
+    Field('web', 'web', 'VARCHAR(255)'),
+    Field('deleted', 'deleted', 'BOOLEAN DEFAULT FALSE', default=False),
+])
+
+ORGANIZATION = Entity("organization", "organizations", [
+    Field('id', 'organization_id', 'VARCHAR(255) PRIMARY KEY'),
+    Field('type', 'type_id', 'VARCHAR(255) NOT NULL'),
+    Field('body', 'body_id', 'VARCHAR(255) NOT NULL'),
+    Field('name', 'name', 'VARCHAR(255)'),
+    Field('membership', 'membership_id', 'TEXT[]'),
+    Field('meeting', 'meetings_of_organization_id', 'VARCHAR(255)'),
+    Field('consultation', 'consultation_id', 'TEXT[]'),
+    Field('shortName', 'shortName', 'VARCHAR(255)'),
+    Field('post', 'post', 'TEXT[]'),
+    Field('subOrganizationOfUrl', 'subOrganizationOfUrl', 'VARCHAR(255)'),
+    Field('organizationType', 'organizationType', 'VARCHAR(255)'),
+    Field('classification', 'classification', 'VARCHAR(255)'),
+    Field('startDate', 'startDate', 'DATE'),
+    Field('endDate', 'endDate', 'DATE'),
+    Field('website', 'website', 'VARCHAR(255)'),
+    Field('location', 'location_id', 'VARCHAR(255)', REF),
+    Field('externalBody', 'externalBody', 'BOOLEAN'),
+    Field('license', 'license', 'VARCHAR(255)'),
+    Field('keyword', 'keyword', 'TEXT[]'),
+    Field('created', 'created', 'TIMESTAMPTZ'),
+    Field('modified', 'modified', 'TIMESTAMPTZ'),
+    Field('web', 'web', 'VARCHAR(255)'),
+    Field('deleted', 'deleted', 'BOOLEAN DEFAULT FALSE', default=False),
+], links=[
+    Link("organization_membership", "membership_id", "membership_id"),
+])
+
+MEETING = Entity("meeting", "meetings", [
+    Field('id', 'meeting_id', 'VARCHAR(255) PRIMARY KEY'),
+    Field('type', 'type_id', 'VARCHAR(255) NOT NULL'),
+    Field('name', 'name', 'VARCHAR(255)'),
+    Field('start', 'start', 'TIMESTAMPTZ'),
+    Field('end', '"end"', 'TIMESTAMPTZ'),
+    Field('location', 'location_id', 'VARCHAR(255)', REF),
+    Field('organization', 'organization', 'TEXT[]'),
+    Field('invitation', 'invitation_id', 'VARCHAR(255)', REF),
+    Field('resultsProtocol', 'results_protocol_id', 'VARCHAR(255)', REF),
+    Field('verbatimProtocol', 'verbatim_protocol_id', 'VARCHAR(255)', REF),
+    Field('auxiliaryFile', 'auxiliary_file', 'TEXT[]', REF_LIST),
+    Field('agendaItem', 'agenda_item', 'TEXT[]', REF_LIST),
+    Field('created', 'created', 'TIMESTAMPTZ'),
+    Field('modified', 'modified', 'TIMESTAMPTZ'),
+    Field('web', 'web', 'VARCHAR(255)'),
+    Field('deleted', 'deleted', 'BOOLEAN DEFAULT FALSE', default=False),
+    Field('meetingState', 'meetingState', 'VARCHAR(255)'),
+    Field('cancelled', 'cancelled', 'BOOLEAN', default=False),
+    Field('participant', 'participant', 'TEXT[]', REF_LIST),
+    Field('license', 'license', 'VARCHAR(255)'),
+    Field('keyword', 'keyword', 'TEXT[]'),
+], indexes=[
+    Index("auxiliary_file", "auxiliary_file", "gin"),
+    Index("invitation", "invitation_id"),
+    Index("results_protocol", "results_protocol_id"),
+    Index("verbatim_protocol", "verbatim_protocol_id"),
+], links=[
+    Link("meeting_organization", "organization", "organization_id"),
+    Link("meeting_file", "auxiliary_file", "file_id"),
+    Link("meeting_agenda_item", "agenda_item", "agenda_item_id"),
+])
+
+AGENDA_ITEM = Entity("agenda_item", "agendaItems", [
+    Field('id', 'agenda_item_id', 'VARCHAR(255) PRIMARY KEY'),
+    Field('type', 'type_id', 'VARCHAR(255) NOT NULL'),
+    Field('meeting', 'meeting_id', 'VARCHAR(255)'),
+    Field('number', 'number', 'VARCHAR(50)'),
+    Field('order', '"order"', 'INTEGER'),
+    Field('name', 'name', 'VARCHAR(255)'),
+    Field('public', 'public', 'BOOLEAN'),
+    Field('consultation', 'consultation_id', 'VARCHAR(255)'),
+    Field('result', 'result', 'VARCHAR(255)'),
+    Field('resolutionText', 'resolution_text', 'TEXT'),
+    Field('resolutionFile', 'resolution_file_id', 'VARCHAR(255)', REF),
+    Field('auxiliaryFile', 'auxiliary_file_id', 'TEXT[]', REF_LIST),
+    Field('created', 'created', 'TIMESTAMPTZ'),
+    Field('modified', 'modified', 'TIMESTAMPTZ'),
+    Field('keyword', 'keyword', 'TEXT[]'),
+    Field('deleted', 'deleted', 'BOOLEAN DEFAULT FALSE', default=False),
+], indexes=[
+    Index("auxiliary_file", "auxiliary_file_id", "gin"),
+    Index("meeting", "meeting_id"),
+], links=[
+    Link("agenda_item_file", "auxiliary_file_id", "file_id"),
+])
+
+CONSULTATION = Entity("consultation", "consultations", [
+    Field('id', 'consultation_id', 'VARCHAR(255) PRIMARY KEY'),
+    Field('type', 'type_id', 'VARCHAR(255) NOT NULL'),
+    Field('paper', 'paper_id', 'VARCHAR(255)'),
+    Field('agendaItem', 'agenda_item_id', 'VARCHAR(255)'),
+    Field('meeting', 'meeting_id', 'VARCHAR(255)'),
+    Field('organization', 'organization_id', 'TEXT[]'),
+    Field('authoritative', 'authoritative', 'BOOLEAN', default=False),
+    Field('role', 'role', 'VARCHAR(255)'),
+    Field('created', 'created', 'TIMESTAMPTZ'),
+    Field('modified', 'modified', 'TIMESTAMPTZ'),
+    Field('license', 'license', 'VARCHAR(255)'),
+    Field('keyword', 'keyword', 'TEXT[]'),
+    Field('web', 'web', 'VARCHAR(255)'),
+    Field('deleted', 'deleted', 'BOOLEAN DEFAULT FALSE', default=False),
+], indexes=[
+    Index("paper", "paper_id"),
+    Index("agenda_item", "agenda_item_id"),
+    Index("meeting", "meeting_id"),
+], links=[
+    Link("consultation_organization", "organization_id", "organization_id"),
+])
+
+PAPER = Entity("paper", "papers", [
+    Field('id', 'paper_id', 'VARCHAR(255) PRIMARY KEY'),
+    Field('type', 'type_id', 'VARCHAR(255) NOT NULL'),
+    Field('body', 'body_id', 'VARCHAR(255)'),
+    Field('name', 'name', 'VARCHAR(255)'),
+    Field('reference', 'reference', 'VARCHAR(255)'),
+    Field('date', 'date', 'DATE'),
+    Field('paperType', 'paper_type', 'VARCHAR(255)'),
+    Field('relatedPaper', 'related_paper_id', 'TEXT[]'),
+    Field('superordinatedPaper', 'superordinated_paper_id', 'TEXT[]'),
+    Field('subordinatedPaper', 'subordinated_paper_id', 'TEXT[]'),
+    Field('mainFile', 'main_file_id', 'VARCHAR(255)', REF),
+    Field('auxiliaryFile', 'auxiliary_file_id', 'TEXT[]', REF_LIST),
+    Field('location', 'location_id', 'TEXT[]', REF_LIST),
+    Field('originatorPerson', 'originator_person', 'TEXT[]'),
+    Field('underDirectionOf', 'under_direction_of', 'TEXT[]'),
+    Field('originatorOrganization', 'originator_organization', 'TEXT[]'),
+    Field('consultation', 'consultation_id', 'TEXT[]', REF_LIST),
+    Field('license', 'license', 'VARCHAR(255)'),
+    Field('keyword', 'keyword', 'TEXT[]'),
+    Field('created', 'created', 'TIMESTAMPTZ'),
+    Field('modified', 'modified', 'TIMESTAMPTZ'),
+    Field('web', 'web', 'VARCHAR(255)'),
+    Field('deleted', 'deleted', 'BOOLEAN DEFAULT FALSE', default=False),
+], links=[
+    Link("paper_consultation", "consultation_id", "consultation_id"),
+])
+
+FILE = Entity("file", "files", [
+    Field('id', 'file_id', 'VARCHAR(255) PRIMARY KEY'),
+    Field('type', 'type_id', 'VARCHAR(255) NOT NULL'),
+    Field('name', 'name', 'VARCHAR(255)'),
+    Field('fileName', 'file_name', 'VARCHAR(255)'),
+    Field('mimeType', 'mime_type', 'VARCHAR(255)'),
+    Field('date', 'date', 'DATE'),
+    Field('size', 'size', 'INTEGER'),
+    Field('sha1Checksum', 'sha1_checksum', 'VARCHAR(255)'),
+    Field('sha512Checksum', 'sha512_checksum', 'VARCHAR(255)'),
+    Field('text', 'text', 'TEXT'),
+    Field('accessUrl', 'access_url', 'VARCHAR(255)', default='', transform=fix_ris_url),
+    Field('downloadUrl', 'download_url', 'VARCHAR(255)', default='', transform=fix_ris_url),
+    Field('externalServiceUrl', 'external_service_url', 'VARCHAR(255)'),
+    Field('masterFile', 'master_file', 'VARCHAR(255)'),
+    Field('derivativeFile', 'derivative_file', 'TEXT[]'),
+    Field('fileLicense', 'file_license', 'VARCHAR(255)'),
+    Field('meeting', 'meeting_id', 'TEXT[]'),
+    Field('agendaItem', 'agenda_item_id', 'TEXT[]'),
+    Field('paper', 'paper_id', 'TEXT[]'),
+    Field('license', 'license', 'VARCHAR(255)'),
+    Field('keyword', 'keyword', 'TEXT[]'),
+    Field('created', 'created', 'TIMESTAMPTZ'),
+    Field('modified', 'modified', 'TIMESTAMPTZ'),
+    Field('web', 'web', 'VARCHAR(255)'),
+    Field('deleted', 'deleted', 'BOOLEAN DEFAULT FALSE', default=False),
+], indexes=[
+    Index("paper", "paper_id", "gin"),
+    Index("file_name", "file_name"),
+], links=[
+    Link("paper_file", "paper_id", "paper_id"),
+])
+
+LOCATION = Entity("location", "locations", [
+    Field('id', 'location_id', 'VARCHAR(255) PRIMARY KEY'),
+    Field('type', 'type_id', 'VARCHAR(255) NOT NULL'),
+    Field('description', 'description', 'TEXT'),
+    Field('geojson', 'geojson', 'JSONB', JSON),
+    Field('streetAddress', 'street_address', 'VARCHAR(255)'),
+    Field('room', 'room', 'VARCHAR(255)'),
+    Field('postalCode', 'postal_code', 'VARCHAR(50)'),
+    Field('subLocality', 'sub_locality', 'VARCHAR(255)'),
+    Field('locality', 'locality', 'VARCHAR(255)'),
+    Field('bodies', 'bodies', 'TEXT[]'),
+    Field('organizations', 'organizations_id', 'TEXT[]'),
+    Field('persons', 'persons_id', 'TEXT[]'),
+    Field('meetings', 'meetings_id', 'TEXT[]'),
+    Field('papers', 'papers_id', 'TEXT[]'),
+    Field('license', 'license', 'VARCHAR(255)'),
+    Field('keyword', 'keyword', 'TEXT[]'),
+    Field('created', 'created', 'TIMESTAMPTZ'),
+    Field('modified', 'modified', 'TIMESTAMPTZ'),
+    Field('web', 'web', 'VARCHAR(255)'),
+    Field('deleted', 'deleted', 'BOOLEAN DEFAULT FALSE', default=False),
+])
+
+LEGISLATIVE_TERM = Entity("legislative_term", "legislativeTerms", [
+    Field('id', 'legislative_term_id', 'VARCHAR(255) PRIMARY KEY'),
+    Field('type', 'type_id', 'VARCHAR(255) NOT NULL'),
+    Field('body', 'body_id', 'VARCHAR(255)'),
+    Field('name', 'name', 'VARCHAR(255)'),
+    Field('startDate', 'start_date', 'DATE'),
+    Field('endDate', 'end_date', 'DATE'),
+    Field('license', 'license', 'VARCHAR(255)'),
+    Field('keyword', 'keyword', 'TEXT[]'),
+    Field('created', 'created', 'TIMESTAMPTZ'),
+    Field('modified', 'modified', 'TIMESTAMPTZ'),
+    Field('web', 'web', 'VARCHAR(255)'),
+    Field('deleted', 'deleted', 'BOOLEAN DEFAULT FALSE', default=False),
+])
+
+ENTITIES = [
+    PERSON, MEMBERSHIP, ORGANIZATION, MEETING, AGENDA_ITEM,
+    CONSULTATION, PAPER, FILE, LOCATION, LEGISLATIVE_TERM,
+]
+
+
+def schema_ddl():
+    return "\n".join(entity.ddl() for entity in ENTITIES)
+
+
+def backfill_links(cur):
+    for entity in ENTITIES:
+        entity.backfill_links(cur)
@@ -0,0 +1,51 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from unstructured.staging.base import elements_from_dicts, elements_to_dicts
+
+
+# On-disk cache of partition_pdf results.
+# The chunks of a PDF are stored as element dicts (including metadata such as
+# text_as_html) in gzip-compressed JSON under a key made of the SHA-256 of the PDF and
+# the partition parameters (objects/ab/abcdef....json.gz). A new prompt or embedding
+# model therefore reuses the chunks; other partition parameters get their own entries.
+class PartitionCache:
+    def __init__(self, root, compresslevel=6):
+        self.root = root
+        self.compresslevel = compresslevel
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+
+    def _object_path(self, key):
+        return os.path.join(self.root, "objects", key[:2], f"{key}.json.gz")
+
+    # sha256: hex digest of the PDF if the caller already has it (e.g. from the processing
+    # manifest), otherwise the file is read and hashed here
+    def key(self, pdf_path, partition_kwargs, sha256=None):
+        if sha256 is None:
+            digest = hashlib.sha256()
+            with open(pdf_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            sha256 = digest.hexdigest()
+        params = json.dumps(partition_kwargs, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(f"{sha256}:{params}".encode("utf-8")).hexdigest()
+
+    # Returns the cached chunks or None
+    def load(self, key):
+        path = self._object_path(key)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rb") as f:
+            return elements_from_dicts(json.loads(f.read()))
+
+    def store(self, key, chunks):
+        path = self._object_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = json.dumps(elements_to_dicts(chunks), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=self.compresslevel) as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
@@ -0,0 +1,197 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import time
+from collections import deque, namedtuple
+
+from unstructured.partition.pdf import partition_pdf
+
+# partition_pdf settings of the pipeline (hi_res layout detection with table structure)
+PARTITION_KWARGS = dict(
+    extract_images_in_pdf=False,
+    infer_table_structure=True,
+    chunking_strategy="by_title",
+    strategy="hi_res",
+    max_characters=4000,
+    new_after_n_chars=3800,
+    combine_text_under_n_chars=2000,
+)
+
+# Result for one PDF; chunks is None and error is set if partitioning failed or timed out
+Partitioned = namedtuple("Partitioned", ["pdf_path", "chunks", "error"])
+
+
+def partition_file(pdf_path, **kwargs):
+    return partition_pdf(filename=pdf_path, image_output_dir_path=os.path.dirname(pdf_path), **kwargs)
+
+
+# The layout and table models are loaded lazily and cached per process; loading them
+# up front keeps the first PDF of every worker from paying for it.
+def _load_models(kwargs):
+    if kwargs.get("strategy") != "hi_res":
+        return
+    from unstructured_inference.models.base import get_model
+    get_model()
+    if kwargs.get("infer_table_structure"):
+        from unstructured_inference.models.tables import load_agent
+        load_agent()
+
+
+def _worker(worker_id, tasks, results, kwargs):
+    _load_models(kwargs)
+    results.put(("ready", worker_id, None, None, None))
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        index, pdf_path = task
+        try:
+            chunks, error = partition_file(pdf_path, **kwargs), None
+        except Exception as e:
+            chunks, error = None, f"{type(e).__name__}: {e}"
+        results.put(("done", worker_id, index, chunks, error))
+
+
+# Partitions PDFs in worker processes and yields each result as soon as it is finished,
+# so the caller can summarize and embed one PDF while the others are still partitioned.
+# Every worker gets its next PDF from the parent, which therefore knows what each worker
+# is doing: a worker exceeding the per-file timeout or crashing is replaced and its PDF
+# is reported with an error instead of blocking the run.
+# With a PartitionCache, PDFs partitioned before with the same parameters are yielded
+# from the cache without starting a worker for them, new results are added to it.
+class PartitionPool:
+    def __init__(self, workers=None, timeout=None, partition_kwargs=None, poll_interval=1.0, cache=None):
+        self.workers = workers or os.cpu_count()
+        self.timeout = timeout
+        self.kwargs = dict(PARTITION_KWARGS if partition_kwargs is None else partition_kwargs)
+        self.poll_interval = poll_interval
+        self.cache = cache
+        # spawn: workers must not inherit database connections or torch state of the caller
+        self._context = multiprocessing.get_context("spawn")
+
+    def _start_worker(self, worker_id, results):
+        tasks = self._context.Queue()
+        process = self._context.Process(target=_worker, args=(worker_id, tasks, results, self.kwargs), daemon=True)
+        process.start()
+        return process, tasks
+
+    # pdf_paths may be any iterable, e.g. a queue fed by another thread: it is consumed
+    # lazily, whenever a worker needs its next PDF. An item is a path or a (path, sha256)
+    # pair; with the SHA-256 of the file the cache key is computed without reading it again.
+    def partition(self, pdf_paths):
+        pdf_paths = iter(pdf_paths)
+        indices = itertools.count()
+        paths, keys = {}, {}  # index -> path, cache key
+        waiting = deque()  # PDFs found for workers that are still starting
+        exhausted = False
+
+        # Takes one PDF from pdf_paths: a Partitioned result for a cache hit, an
+        # (index, path) task for a PDF to partition, None once pdf_paths is exhausted
+        def next_item():
+            nonlocal exhausted
+            item = next(pdf_paths, None)
+            if item is None:
+                exhausted = True
+                return None
+            pdf_path, sha256 = item if isinstance(item, tuple) else (item, None)
+            index = next(indices)
+            if self.cache is not None:
+                key = self.cache.key(pdf_path, self.kwargs, sha256)
+                chunks = self.cache.load(key)
+                if chunks is not None:
+                    return Partitioned(pdf_path, chunks, None)
+                keys[index] = key
+            paths[index] = pdf_path
+            return index, pdf_path
+
+        # Yields the cache hits in front of the next PDF to partition and returns that
+        # task (None once pdf_paths is exhausted). Every hit is yielded before the next
+        # PDF is taken, so a caller that stops consuming also stops discovery and a run
+        # of hits never accumulates in memory.
+        def next_task():
+            while True:
+                item = next_item()
+                if not isinstance(item, Partitioned):
+                    return item
+                yield item
+
+        results = self._context.Queue()
+        worker_ids = itertools.count()
+        workers = {}  # worker_id -> (process, task queue)
+        assigned = {}  # worker_id -> (index, start time)
+        ready = set()
+
+        def start_worker():
+            worker_id = next(worker_ids)
+            workers[worker_id] = self._start_worker(worker_id, results)
+
+        # The next PDF is handed out before a result is yielded, so workers keep going
+        # while the caller processes the result; cache hits on the way are yielded
+        def dispatch(worker_id):
+            tasks = workers[worker_id][1]
+            task = waiting.popleft() if waiting else (yield from next_task())
+            if task is not None:
+                tasks.put(task)
+                assigned[worker_id] = (task[0], time.monotonic())
+            else:
+                tasks.put(None)
+
+        def discard_worker(worker_id):
+            process, _ = workers.pop(worker_id)
+            if process.is_alive():
+                process.terminate()
+            ready.discard(worker_id)
+            if waiting or not exhausted:
+                start_worker()
+
+        try:
+            # One worker per PDF to partition, up to self.workers
+            # (workers are loading their models while cache hits are yielded)
+            while len(workers) < self.workers:
+                task = yield from next_task()
+                if task is None:
+                    break
+                waiting.append(task)
+                start_worker()
+
+            while assigned or waiting or not exhausted:
+                finished = []
+                try:
+                    state, worker_id, index, chunks, error = results.get(timeout=self.poll_interval)
+                    if worker_id in workers:
+                        ready.add(worker_id)
+                        if state == "done":
+                            del assigned[worker_id]
+                            key = keys.pop(index, None)
+                            if key is not None and error is None:
+                                self.cache.store(key, chunks)
+                            finished.append(Partitioned(paths.pop(index), chunks, error))
+                        yield from dispatch(worker_id)
+                except queue.Empty:
+                    pass
+
+                now = time.monotonic()
+                for worker_id, (index, started) in list(assigned.items()):
+                    if self.timeout and now - started > self.timeout:
+                        del assigned[worker_id]
+                        discard_worker(worker_id)
+                        finished.append(Partitioned(paths.pop(index), None, f"timeout after {self.timeout}s"))
+
+                for worker_id, (process, _) in list(workers.items()):
+                    if process.is_alive():
+                        continue
+                    if worker_id not in ready:
+                        raise RuntimeError(f"Partition worker exited with code {process.exitcode} before loading its models")
+                    discard_worker(worker_id)
+                    if worker_id in assigned:
+                        index, _ = assigned.pop(worker_id)
+                        finished.append(Partitioned(paths.pop(index), None, f"worker exited with code {process.exitcode}"))
+
+                for partitioned in finished:
+                    yield partitioned
+        finally:
+            for process, _ in workers.values():
+                if process.is_alive():
+                    process.terminate()
+                process.join()
@@ -0,0 +1,140 @@
+import queue
+import threading
+import time
+
+_DONE = object()
+
+
+class _Aborted(Exception):
+    pass
+
+
+# Counters of one stage; waiting for input means the stage is starved by the stage
+# before it, waiting for output means it is held back by the stage after it
+class StageStats:
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.started = None
+        self.finished = None
+        self.thread_time = 0.0
+        self.waiting_input = 0.0
+        self.waiting_output = 0.0
+
+    def __str__(self):
+        elapsed = (self.finished or time.monotonic()) - (self.started or time.monotonic())
+        rate = self.items / elapsed if elapsed > 0 else 0.0
+        thread_time = self.thread_time or 1e-9
+        busy = max(0.0, thread_time - self.waiting_input - self.waiting_output) / thread_time
+        return (
+            f"{self.name:<10} {self.items:>6} items  {elapsed:8.1f}s  {rate:7.2f}/s  busy {busy:4.0%}  "
+            f"waiting for input {self.waiting_input / thread_time:4.0%}, for output {self.waiting_output / thread_time:4.0%}"
+        )
+
+
+# Stages connected by bounded queues, every stage running in its own thread(s), so CPU
+# bound partitioning (in the worker processes of the PartitionPool), LLM requests and
+# database writes overlap. A stage is a function that takes an iterator over the items
+# of the previous stage (the first stage takes no argument) and yields its own items.
+# Full queues block the stage before them, which keeps the number of PDFs in memory at
+# roughly queue_size per stage, whatever the speed of the stages.
+# If a stage raises, all other stages stop at their next queue operation and run()
+# re-raises the exception.
+class Pipeline:
+    def __init__(self, queue_size=4, poll_interval=0.1):
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.stages = []  # (stats, func)
+        self._lock = threading.Lock()
+        self._failed = threading.Event()
+        self._error = None
+
+    # workers > 1 runs the function in several threads reading from the same queue
+    def stage(self, name, func, workers=1):
+        self.stages.append((StageStats(name, workers), func))
+        return self
+
+    def run(self):
+        inboxes = [None] + [queue.Queue(self.queue_size) for _ in self.stages[1:]]
+        outboxes = inboxes[1:] + [None]
+        remaining = [stats.workers for stats, _ in self.stages]
+        threads = [
+            threading.Thread(target=self._work, args=(index, func, inboxes[index], outboxes[index], remaining), daemon=True)
+            for index, (stats, func) in enumerate(self.stages)
+            for _ in range(stats.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+        return [stats for stats, _ in self.stages]
+
+    def _work(self, index, func, inbox, outbox, remaining):
+        stats = self.stages[index][0]
+        started = time.monotonic()
+        with self._lock:
+            if stats.started is None:
+                stats.started = started
+        try:
+            items = func(self._receive(inbox, stats)) if inbox is not None else func()
+            for item in items or ():
+                with self._lock:
+                    stats.items += 1
+                if outbox is not None:
+                    self._put(outbox, item, stats)
+        except _Aborted:
+            pass
+        except BaseException as e:
+            with self._lock:
+                if self._error is None:
+                    self._error = e
+            self._failed.set()
+        finally:
+            with self._lock:
+                stats.thread_time += time.monotonic() - started
+                stats.finished = time.monotonic()
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last and outbox is not None:
+                try:
+                    self._put(outbox, _DONE, None)
+                except _Aborted:
+                    pass
+
+    def _receive(self, inbox, stats):
+        while True:
+            waiting = time.monotonic()
+            item = self._get(inbox)
+            with self._lock:
+                stats.waiting_input += time.monotonic() - waiting
+            if item is _DONE:
+                # Pass the end marker on to the other threads of this stage
+                inbox.put(_DONE)
+                return
+            yield item
+
+    def _get(self, inbox):
+        while True:
+            if self._failed.is_set():
+                raise _Aborted()
+            try:
+                return inbox.get(timeout=self.poll_interval)
+            except queue.Empty:
+                pass
+
+    def _put(self, outbox, item, stats):
+        waiting = time.monotonic()
+        while True:
+            if self._failed.is_set():
+                raise _Aborted()
+            try:
+                outbox.put(item, timeout=self.poll_interval)
+                break
+            except queue.Full:
+                pass
+        if stats is not None:
+            with self._lock:
+                stats.waiting_output += time.monotonic() - waiting
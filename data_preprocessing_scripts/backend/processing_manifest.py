@@ -0,0 +1,107 @@
+import hashlib
+import json
+from collections import namedtuple
+
+# Checksums of one PDF; sha1 and sha512 are the ones OParl publishes for files
+Digests = namedtuple("Digests", ["sha256", "sha1", "sha512"])
+
+
+# Hash over everything that changes the output of the pipeline for the same PDF
+# (partition parameters, prompt, model names); a new value reprocesses every PDF
+def pipeline_key(**config):
+    payload = json.dumps(config, sort_keys=True, separators=(",", ":"), default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Hash of the metadata a PDF is processed with (the columns of the formatted table, as
+# {column: value}); a PDF whose metadata changed is reprocessed even if its bytes did not
+def metadata_hash(metadata):
+    payload = json.dumps(metadata, sort_keys=True, separators=(",", ":"), default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_digests(path, block_size=1 << 20):
+    sha256, sha1, sha512 = hashlib.sha256(), hashlib.sha1(), hashlib.sha512()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha256.update(block)
+            sha1.update(block)
+            sha512.update(block)
+    return Digests(sha256.hexdigest(), sha1.hexdigest(), sha512.hexdigest())
+
+
+# PDFs that went through the whole pipeline, stored next to the vectors and chunks. One
+# row per content, configuration and pdf_name: the chunks of a PDF are stored under its
+# name, so the same bytes under another name are processed again.
+def create_manifest_table(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS pdf_processing_manifest (
+        sha256 CHAR(64) NOT NULL,
+        pipeline_key CHAR(64) NOT NULL,
+        pdf_name VARCHAR(255) NOT NULL,
+        sha1 CHAR(40) NOT NULL,
+        sha512 CHAR(128) NOT NULL,
+        metadata_hash CHAR(64),
+        chunks INTEGER NOT NULL,
+        processed_at TIMESTAMPTZ DEFAULT now(),
+        PRIMARY KEY (sha256, pipeline_key, pdf_name)
+    );
+    -- rows written before the metadata was recorded have none and are processed once more
+    ALTER TABLE pdf_processing_manifest ADD COLUMN IF NOT EXISTS metadata_hash CHAR(64);
+    """)
+    # The primary key used to be (sha256, pipeline_key)
+    cur.execute("""
+    SELECT count(*)
+    FROM pg_index
+    JOIN pg_attribute ON pg_attribute.attrelid = pg_index.indrelid AND pg_attribute.attnum = ANY(pg_index.indkey)
+    WHERE pg_index.indrelid = 'pdf_processing_manifest'::regclass AND pg_index.indisprimary
+    """)
+    if cur.fetchone()[0] == 2:
+        cur.execute("""
+        ALTER TABLE pdf_processing_manifest
+            DROP CONSTRAINT pdf_processing_manifest_pkey,
+            ADD PRIMARY KEY (sha256, pipeline_key, pdf_name)
+        """)
+
+
+# Returns the (sha256, pdf_name, metadata_hash) triples already processed with this
+# pipeline configuration
+def processed_entries(cur, key):
+    cur.execute(
+        "SELECT sha256, pdf_name, metadata_hash FROM pdf_processing_manifest WHERE pipeline_key = %s", (key,)
+    )
+    return set(cur.fetchall())
+
+
+# Meant to run after the PDF's summaries and chunks are written, in the same transaction
+def record_processed(cur, pdf_name, digests, key, chunks, metadata_hash):
+    cur.execute("""
+    INSERT INTO pdf_processing_manifest (sha256, pipeline_key, pdf_name, sha1, sha512, metadata_hash, chunks, processed_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, now())
+    ON CONFLICT (sha256, pipeline_key, pdf_name) DO UPDATE
+    SET metadata_hash = EXCLUDED.metadata_hash, chunks = EXCLUDED.chunks, processed_at = now()
+    """, (digests.sha256, key, pdf_name, digests.sha1, digests.sha512, metadata_hash, chunks))
+
+
+# PDFs of the harvested file table whose published checksum is not in the manifest yet
+# under the same file name, so only those need to be downloaded. Files without any
+# checksum are always listed. Metadata changes are only seen by the pipeline itself.
+def unprocessed_files(structured_cur, manifest_cur, key):
+    manifest_cur.execute("SELECT pdf_name, sha1, sha512 FROM pdf_processing_manifest WHERE pipeline_key = %s", (key,))
+    rows = manifest_cur.fetchall()
+    pdf_names = [row[0] for row in rows]
+    sha1 = [row[1] for row in rows]
+    sha512 = [row[2] for row in rows]
+    structured_cur.execute("""
+    SELECT file_name, download_url
+    FROM file
+    WHERE file_name ILIKE '%%.pdf'
+      AND NOT EXISTS (
+          SELECT 1
+          FROM unnest(%s::TEXT[], %s::TEXT[], %s::TEXT[]) AS processed (pdf_name, sha1, sha512)
+          WHERE processed.pdf_name = file.file_name
+            AND (processed.sha512 = lower(file.sha512_checksum) OR processed.sha1 = lower(file.sha1_checksum))
+      )
+    ORDER BY file_name
+    """, (pdf_names, sha1, sha512))
+    return structured_cur.fetchall()
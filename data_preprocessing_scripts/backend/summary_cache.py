@@ -0,0 +1,122 @@
+import hashlib
+import json
+import threading
+
+
+# Summaries of the LLM chain stored in PostgreSQL, keyed on the hash of the prompt
+# template, the model, the temperature and the prompt variables (metadata and element).
+# Identical chunks are summarized once, reruns over an unchanged corpus make no LLM calls.
+# Entries not used for max_age_days or beyond the newest max_entries are evicted.
+# summarize() is called from several pipeline workers at once: every thread gets its own
+# connection from connect (opened on first use, closed by close()), and no transaction
+# stays open while the chain runs.
+class SummaryCache:
+    def __init__(self, connect, prompt_template, model, temperature, max_entries=None, max_age_days=None):
+        self.connect = connect
+        self.prompt_template = prompt_template
+        self.model = model
+        self.temperature = temperature
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.connect()
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def create_table(self):
+        with self.conn.cursor() as cur:
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS summary_cache (
+                key CHAR(64) PRIMARY KEY,
+                model VARCHAR(255) NOT NULL,
+                summary TEXT NOT NULL,
+                created_at TIMESTAMPTZ DEFAULT now(),
+                last_used_at TIMESTAMPTZ DEFAULT now()
+            );
+            CREATE INDEX IF NOT EXISTS summary_cache_last_used_at_idx ON summary_cache (last_used_at);
+            """)
+        self.conn.commit()
+
+    def key(self, inputs):
+        payload = json.dumps(
+            [self.prompt_template, self.model, self.temperature, inputs],
+            sort_keys=True, separators=(",", ":"), default=str, ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # Drop-in for chain.batch(inputs, config): only inputs without a cached summary are
+    # sent to the chain, each distinct input once. The lookup is committed before the chain
+    # runs, new summaries are committed right away.
+    def summarize(self, chain, inputs, config=None):
+        if not inputs:
+            return []
+        keys = [self.key(item) for item in inputs]
+        conn = self.conn
+        with conn.cursor() as cur:
+            cur.execute("SELECT key, summary FROM summary_cache WHERE key = ANY(%s)", (list(set(keys)),))
+            summaries = dict(cur.fetchall())
+            if summaries:
+                cur.execute("UPDATE summary_cache SET last_used_at = now() WHERE key = ANY(%s)", (list(summaries),))
+        conn.commit()
+
+        missing = {}
+        for key, item in zip(keys, inputs):
+            if key not in summaries:
+                missing.setdefault(key, item)
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            results = chain.batch(list(missing.values()), config)
+            new = dict(zip(missing, results))
+            with conn.cursor() as cur:
+                cur.executemany("""
+                INSERT INTO summary_cache (key, model, summary)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (key) DO UPDATE SET summary = EXCLUDED.summary, last_used_at = now()
+                """, [(key, self.model, summary) for key, summary in new.items()])
+            conn.commit()
+            summaries.update(new)
+        return [summaries[key] for key in keys]
+
+    # Returns the number of evicted entries
+    def evict(self):
+        evicted = 0
+        with self.conn.cursor() as cur:
+            if self.max_age_days is not None:
+                cur.execute(
+                    "DELETE FROM summary_cache WHERE last_used_at < now() - make_interval(days => %s)",
+                    (self.max_age_days,),
+                )
+                evicted += cur.rowcount
+            if self.max_entries is not None:
+                cur.execute("""
+                DELETE FROM summary_cache WHERE key IN (
+                    SELECT key FROM summary_cache ORDER BY last_used_at DESC OFFSET %s
+                )
+                """, (self.max_entries,))
+                evicted += cur.rowcount
+        self.conn.commit()
+        return evicted
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"summary cache: {self.hits} hits, {self.misses} misses ({rate:.0%} hit rate)"
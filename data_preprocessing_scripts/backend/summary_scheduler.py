@@ -0,0 +1,179 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+# Responses worth another attempt; 429 additionally lowers the concurrency
+RETRY_STATUS = {429, 500, 502, 503, 504}
+RETRY_ERRORS = {"APITimeoutError", "APIConnectionError", "TimeoutError", "ConnectionError"}
+
+
+# HTTP status of an exception raised by the OpenAI client (or any client exposing a response)
+def _status(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After") or ""
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+# Rough token count of one request: prompt variables at ~4 characters per token plus the
+# prompt template and the expected answer
+def estimate_tokens(inputs, overhead=700):
+    return sum(len(str(value)) for value in inputs.values()) // 4 + overhead
+
+
+# Requests and tokens sent within the last minute
+class _RateWindow:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.events = deque()  # (time, tokens)
+        self.tokens = 0
+
+    def _expire(self, now):
+        while self.events and self.events[0][0] <= now - 60:
+            self.tokens -= self.events.popleft()[1]
+
+    # Seconds until a request with this many tokens fits into both budgets
+    def delay(self, tokens, now):
+        self._expire(now)
+        wait = 0.0
+        if self.requests_per_minute and len(self.events) >= self.requests_per_minute:
+            wait = self.events[len(self.events) - self.requests_per_minute][0] + 60 - now
+        if self.tokens_per_minute and self.events and self.tokens + tokens > self.tokens_per_minute:
+            freed = 0
+            for sent, sent_tokens in self.events:
+                freed += sent_tokens
+                if self.tokens - freed + tokens <= self.tokens_per_minute:
+                    wait = max(wait, sent + 60 - now)
+                    break
+        return max(wait, 0.0)
+
+    def record(self, tokens, now):
+        self.events.append((now, tokens))
+        self.tokens += tokens
+
+
+# Runs the summarization chain for all PDFs of a run on one event loop in a background
+# thread, so requests of several files share one pipe and one set of limits.
+# Concurrency follows AIMD: +1 per window of successful requests while the latency stays
+# below latency_target, halved on 429 (with a pause for Retry-After) and reduced by 10 %
+# when the latency exceeds the target. Requests are additionally held back to stay
+# within requests_per_minute and tokens_per_minute.
+class SummaryScheduler:
+    def __init__(self, chain, requests_per_minute=None, tokens_per_minute=None, initial_concurrency=4,
+                 min_concurrency=1, max_concurrency=64, latency_target=None, max_retries=6,
+                 backoff_base=1.0, backoff_max=60.0, token_estimate=estimate_tokens):
+        self.chain = chain
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.token_estimate = token_estimate
+        self.concurrency = float(initial_concurrency)
+        self._window = _RateWindow(requests_per_minute, tokens_per_minute)
+        self._in_flight = 0
+        self._cooldown_until = 0.0
+        self._latency = None  # exponentially weighted moving average in seconds
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.peak_concurrency = self.concurrency
+
+        self._loop = asyncio.new_event_loop()
+        self._changed = asyncio.Condition()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    async def _acquire(self, tokens):
+        async with self._changed:
+            while True:
+                now = time.monotonic()
+                wait = max(self._cooldown_until - now, self._window.delay(tokens, now))
+                if wait <= 0 and self._in_flight < int(self.concurrency):
+                    self._in_flight += 1
+                    self._window.record(tokens, now)
+                    return
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=wait if wait > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _release(self, latency=None, rate_limited_for=None):
+        async with self._changed:
+            self._in_flight -= 1
+            if rate_limited_for is not None:
+                self.rate_limited += 1
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                self._cooldown_until = max(self._cooldown_until, time.monotonic() + rate_limited_for)
+            elif latency is not None:
+                self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+                if self.latency_target and self._latency > self.latency_target:
+                    self.concurrency = max(self.min_concurrency, self.concurrency * 0.9)
+                else:
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+                self.peak_concurrency = max(self.peak_concurrency, self.concurrency)
+            self._changed.notify_all()
+
+    def _backoff(self, attempt):
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def _run(self, inputs, config):
+        tokens = self.token_estimate(inputs)
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(tokens)
+            self.requests += 1
+            started = time.monotonic()
+            try:
+                result = await self.chain.ainvoke(inputs, config)
+            except Exception as exc:
+                status = _status(exc)
+                retry = status in RETRY_STATUS or type(exc).__name__ in RETRY_ERRORS
+                if not retry or attempt == self.max_retries:
+                    await self._release()
+                    raise
+                self.retries += 1
+                delay = _retry_after(exc) or self._backoff(attempt)
+                if status == 429:
+                    # The cooldown holds back every request, not only this one
+                    await self._release(rate_limited_for=min(delay, self.backoff_max))
+                else:
+                    await self._release()
+                    await asyncio.sleep(delay)
+                continue
+            await self._release(latency=time.monotonic() - started)
+            return result
+
+    # Schedules one chain input; returns a concurrent.futures.Future with the summary
+    def submit(self, inputs, config=None):
+        return asyncio.run_coroutine_threadsafe(self._run(inputs, config), self._loop)
+
+    # Same interface as chain.batch; max_concurrency in config is superseded by the scheduler
+    def batch(self, inputs, config=None):
+        futures = [self.submit(item, config) for item in inputs]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def stats(self):
+        latency = f"{self._latency:.2f}s" if self._latency is not None else "-"
+        return (
+            f"summaries: {self.requests} requests, {self.retries} retries, {self.rate_limited} rate limited, "
+            f"concurrency {self.concurrency:.1f} (peak {self.peak_concurrency:.1f}), latency {latency}"
+        )
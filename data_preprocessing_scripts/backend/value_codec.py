@@ -0,0 +1,229 @@
+import datetime
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+
+import orjson
+from langchain_core.documents import Document
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for compressed values
+    zstandard = None
+
+try:
+    import xxhash
+except ImportError:  # optional, only needed for the xxh3 fingerprint
+    xxhash = None
+
+# Encoding of the values of PostgresByteStore. Every encoded value starts with a format byte,
+# so rows written with different codecs can live in the same table and every codec reads
+# all of them:
+#   0x01  JSON (orjson) of the value
+#   0x02  zstd-compressed JSON
+#   0x80  pickle (the first byte of every pickle since protocol 2; rows written before the
+#         codecs existed). Loading a pickle can run arbitrary code, so it is only done with
+#         allow_pickle, e.g. by the migration in doc_store_migrate.py.
+# A Document is stored as {"type": "Document", "page_content", "metadata"[, "id"]}, any other
+# value as {"type": "value", "value": ...}; values must be JSON serializable. Dates and times
+# (e.g. meeting_date of the metadata) are stored tagged, {"__date__": "2025-01-29"},
+# {"__datetime__": ...} or {"__time__": ...}, and decoded to date, datetime and time again.
+# Any other type (Decimal, dataclasses, custom objects) raises TypeError instead of being
+# stored as something it does not decode to; orjson itself writes UUIDs as strings.
+# Encoding is split into canonical() (the uncompressed bytes, dict keys sorted while
+# serializing) and pack() (format byte, compression), so the doc store can fingerprint the
+# canonical bytes and pack only the values it actually writes.
+FORMAT_JSON = 0x01
+FORMAT_JSON_ZSTD = 0x02
+FORMAT_PICKLE = 0x80
+
+JSON_OPTIONS = (
+    orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+)
+
+# Tag of each date/time type; datetime first, it is a subclass of date
+DATE_TAGS = (
+    ("__datetime__", datetime.datetime),
+    ("__date__", datetime.date),
+    ("__time__", datetime.time),
+)
+_TAG_TYPES = dict(DATE_TAGS)
+
+# zstd (de)compressors are expensive to create and cannot be shared between threads
+_zstd = threading.local()
+
+
+def _compressor(level):
+    compressors = _zstd.__dict__.setdefault("compressors", {})
+    if level not in compressors:
+        compressors[level] = zstandard.ZstdCompressor(level=level)
+    return compressors[level]
+
+
+def _decompressor():
+    if not hasattr(_zstd, "decompressor"):
+        _zstd.decompressor = zstandard.ZstdDecompressor()
+    return _zstd.decompressor
+
+
+def _payload(value):
+    if isinstance(value, Document):
+        payload = {"type": "Document", "page_content": value.page_content, "metadata": value.metadata}
+        if value.id is not None:
+            payload["id"] = value.id
+        return payload
+    return {"type": "value", "value": value}
+
+
+# orjson passes dates and times (OPT_PASSTHROUGH_DATETIME), dataclasses
+# (OPT_PASSTHROUGH_DATACLASS) and every type it cannot serialize here
+def _default(obj):
+    for tag, cls in DATE_TAGS:
+        if isinstance(obj, cls):
+            return {tag: obj.isoformat()}
+    raise TypeError(f"{type(obj).__name__} values cannot be stored with the JSON codec")
+
+
+def _untag(obj):
+    if isinstance(obj, dict):
+        if len(obj) == 1:
+            tag, value = next(iter(obj.items()))
+            if tag in _TAG_TYPES and isinstance(value, str):
+                return _TAG_TYPES[tag].fromisoformat(value)
+        return {key: _untag(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_untag(value) for value in obj]
+    return obj
+
+
+# Parses JSON; only payloads whose bytes (raw) may contain a tag are walked
+def _loads(data, raw):
+    payload = orjson.loads(data)
+    if b'{"__' in raw:
+        payload = _untag(payload)
+    return payload
+
+
+def _value(payload):
+    if payload["type"] == "Document":
+        return Document(page_content=payload["page_content"], metadata=payload["metadata"], id=payload.get("id"))
+    return payload["value"]
+
+
+class PickleDecodeError(ValueError):
+    pass
+
+
+class JsonCodec:
+    name = "json"
+    formats = (FORMAT_JSON,)
+
+    # compression_level: zstd level, None for uncompressed values. Values that do not get
+    # smaller (short chunks) are stored uncompressed either way.
+    def __init__(self, compression_level=None):
+        if compression_level is not None and zstandard is None:
+            raise ImportError("zstd compression needs the zstandard package (pip install zstandard)")
+        self.compression_level = compression_level
+        if compression_level is not None:
+            self.name = "json+zstd"
+            self.formats = (FORMAT_JSON, FORMAT_JSON_ZSTD)
+
+    def canonical(self, value):
+        return orjson.dumps(_payload(value), default=_default, option=JSON_OPTIONS)
+
+    def pack(self, data):
+        if self.compression_level is not None:
+            compressed = _compressor(self.compression_level).compress(data)
+            if len(compressed) < len(data):
+                return bytes((FORMAT_JSON_ZSTD,)) + compressed
+        return bytes((FORMAT_JSON,)) + data
+
+    def encode(self, value):
+        return self.pack(self.canonical(value))
+
+    def decode(self, data, allow_pickle=False):
+        return decode(data, allow_pickle)
+
+
+# The serialization used before the codecs (pickle of a copy with sorted dicts); for the
+# comparison in benchmarks/bench_value_codec.py and for readers that cannot be updated yet.
+# The metadata of a Document is pickled in insertion order, so these bytes are no canonical
+# form; use it with the "content-sha256" hashing of the doc store.
+class PickleCodec:
+    name = "pickle"
+    formats = (FORMAT_PICKLE,)
+
+    def canonical(self, value):
+        return pickle.dumps(_sorted_copy(value))
+
+    def pack(self, data):
+        return data
+
+    def encode(self, value):
+        return self.canonical(value)
+
+    def decode(self, data, allow_pickle=True):
+        return decode(data, allow_pickle)
+
+
+def _sorted_copy(obj):
+    if isinstance(obj, dict):
+        return OrderedDict((k, _sorted_copy(v)) for k, v in sorted(obj.items()))
+    elif isinstance(obj, list):
+        return [_sorted_copy(v) for v in obj]
+    else:
+        return obj
+
+
+# Decodes a value of any format; the payload is read through a memoryview, without copying
+# it out of the row first
+def decode(data, allow_pickle=False):
+    view = memoryview(data)
+    fmt = view[0]
+    if fmt == FORMAT_JSON:
+        return _value(_loads(view[1:], data if isinstance(data, bytes) else bytes(data)))
+    if fmt == FORMAT_JSON_ZSTD:
+        if zstandard is None:
+            raise ImportError("Value is zstd-compressed, install the zstandard package to read it")
+        decompressed = _decompressor().decompress(view[1:])
+        return _value(_loads(decompressed, decompressed))
+    if fmt == FORMAT_PICKLE:
+        if not allow_pickle:
+            raise PickleDecodeError("Value is pickled; re-encode the collection with doc_store_migrate.py")
+        return pickle.loads(data)
+    raise ValueError(f"Unknown value format {fmt:#04x}")
+
+
+CODECS = {
+    "json": lambda: JsonCodec(),
+    "json+zstd": lambda: JsonCodec(compression_level=3),
+    "pickle": lambda: PickleCodec(),
+}
+
+
+def codec_by_name(name):
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec {name!r}, expected one of {', '.join(CODECS)}")
+    return CODECS[name]()
+
+
+# Fingerprints of the canonical bytes, i.e. of content and metadata, for the value_hash
+# column; the prefix names the algorithm, so hashes of different algorithms never match
+def _blake2b(data):
+    return "blake2b:" + hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _xxh3(data):
+    return "xxh3:" + xxhash.xxh3_128_hexdigest(data)
+
+
+FINGERPRINTS = {"blake2b": _blake2b, "xxh3": _xxh3}
+
+
+def fingerprint_by_name(name):
+    if name not in FINGERPRINTS:
+        raise ValueError(f"Unknown fingerprint {name!r}, expected one of {', '.join(FINGERPRINTS)}")
+    if name == "xxh3" and xxhash is None:
+        raise ImportError("The xxh3 fingerprint needs the xxhash package (pip install xxhash)")
+    return FINGERPRINTS[name]
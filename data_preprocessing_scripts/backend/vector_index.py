@@ -0,0 +1,190 @@
+import json
+import math
+
+from backend.ingest_writer import collection_uuid
+
+# Approximate nearest neighbour index over the summary vectors of one collection.
+# langchain_postgres stores all collections in langchain_pg_embedding with an embedding
+# column without dimensions, which pgvector cannot index directly; the index is therefore
+# an expression index on the column cast to the collection's dimensions, partial on the
+# collection. pgvector indexes at most 2000 dimensions as vector, so larger embeddings
+# (text-embedding-3-large: 3072) are indexed as halfvec (pgvector 0.7 or newer).
+# Only queries using the same expression can use the index, see search() and
+# backend/indexed_vector_store.py for the retriever side.
+# Indexes are built and dropped CONCURRENTLY, so inserts into langchain_pg_embedding are
+# not blocked during a build; this needs a connection in autocommit mode of its own.
+# The state of every index (parameters, rows at build time) is kept in vector_index_state;
+# the index is rebuilt when the collection has grown by rebuild_growth since the last
+# build, because IVFFlat lists and the HNSW parameters are derived from its size.
+MAX_VECTOR_DIMENSIONS = 2000
+MAX_HALFVEC_DIMENSIONS = 4000
+
+OPERATORS = {"cosine": "<=>", "l2": "<->", "inner": "<#>"}
+OPERATOR_CLASSES = {"cosine": "cosine_ops", "l2": "l2_ops", "inner": "ip_ops"}
+
+
+def create_index_state_table(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS vector_index_state (
+        index_name VARCHAR(63) PRIMARY KEY,
+        collection_name VARCHAR(255) NOT NULL,
+        method VARCHAR(16) NOT NULL,
+        params JSONB NOT NULL,
+        rows_at_build BIGINT NOT NULL,
+        built_at TIMESTAMPTZ DEFAULT now()
+    )
+    """)
+
+
+# At most 59 characters, so the temporary "<name>_new" during a rebuild stays within the 63
+# characters of a PostgreSQL identifier
+def index_name(collection_name, method):
+    return f"langchain_pg_embedding_{collection_name}_{method}_idx"[:59]
+
+
+# Rows and dimensions of a collection (dimensions of its first vector; PGVector writes one
+# embedding model per collection)
+def collection_size(cur, collection_id):
+    cur.execute("SELECT count(*) FROM langchain_pg_embedding WHERE collection_id = %s", (collection_id,))
+    rows = cur.fetchone()[0]
+    cur.execute(
+        "SELECT vector_dims(embedding) FROM langchain_pg_embedding WHERE collection_id = %s LIMIT 1",
+        (collection_id,),
+    )
+    row = cur.fetchone()
+    return rows, row[0] if row else None
+
+
+def _pgvector_version(cur):
+    cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+    row = cur.fetchone()
+    return tuple(int(part) for part in row[0].split(".")[:2]) if row else (0, 0)
+
+
+# Type the column is cast to in the index and in search(): vector(d), or halfvec(d) above
+# the 2000 dimensions pgvector can index as vector; None if neither fits
+def vector_type(cur, dimensions):
+    if dimensions <= MAX_VECTOR_DIMENSIONS:
+        return f"vector({dimensions})"
+    if dimensions <= MAX_HALFVEC_DIMENSIONS and _pgvector_version(cur) >= (0, 7):
+        return f"halfvec({dimensions})"
+    return None
+
+
+# Build parameters for a collection of the given size, following the pgvector
+# recommendations; explicitly given values take precedence
+def index_params(method, rows, m=None, ef_construction=None, lists=None):
+    if method == "hnsw":
+        m = m or (16 if rows < 1_000_000 else 32)
+        return {"m": m, "ef_construction": ef_construction or max(64, 4 * m)}
+    if method == "ivfflat":
+        return {"lists": lists or max(10, rows // 1000 if rows <= 1_000_000 else int(math.sqrt(rows)))}
+    raise ValueError(f"Unknown vector index method {method!r}")
+
+
+def _require_autocommit(cur):
+    if not cur.connection.autocommit:
+        raise ValueError("Vector indexes are built CONCURRENTLY and need a connection in autocommit mode")
+
+
+# Creates the index if it is missing, rebuilds it if the collection has grown by
+# rebuild_growth since the last build or explicitly given parameters (or the dimensions or
+# distance) changed, and leaves it
+# alone otherwise. Collections below min_rows are not indexed (an exact scan is fast
+# enough). The new index is built next to the old one, which is dropped afterwards, so
+# searches keep working during the build. A build that failed half way leaves an invalid
+# "<name>_new", which the next call drops. Returns a short description of what was done.
+def ensure_vector_index(cur, collection_name, method="hnsw", distance="cosine", m=None,
+                        ef_construction=None, lists=None, rebuild_growth=2.0, min_rows=10_000,
+                        maintenance_work_mem=None):
+    _require_autocommit(cur)
+    create_index_state_table(cur)
+    collection_id = collection_uuid(cur, collection_name)
+    rows, dimensions = collection_size(cur, collection_id)
+    name = index_name(collection_name, method)
+    if rows < min_rows:
+        return f"{name}: skipped, {rows} rows (< {min_rows})"
+    cast = vector_type(cur, dimensions)
+    if cast is None:
+        return f"{name}: skipped, {dimensions} dimensions need pgvector >= 0.7 (halfvec)"
+
+    params = index_params(method, rows, m, ef_construction, lists)
+    cur.execute(
+        "SELECT params, rows_at_build FROM vector_index_state WHERE index_name = %s",
+        (name,),
+    )
+    state = cur.fetchone()
+    cur.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s", (name,))
+    exists = cur.fetchone() is not None
+    if exists and state is not None:
+        built_params, rows_at_build = state
+        explicit = {"m": m, "ef_construction": ef_construction, "lists": lists}
+        changed = any(value is not None and built_params.get(key) != value for key, value in explicit.items())
+        same_layout = built_params.get("type") == cast and built_params.get("distance") == distance
+        if not changed and same_layout and rows < rows_at_build * rebuild_growth:
+            return f"{name}: unchanged ({rows} rows, built at {rows_at_build})"
+
+    options = ", ".join(f"{key} = {int(value)}" for key, value in params.items())
+    operator_class = f"{cast.split('(')[0]}_{OPERATOR_CLASSES[distance]}"
+    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}_new")
+    if maintenance_work_mem:
+        cur.execute("SELECT set_config('maintenance_work_mem', %s, false)", (maintenance_work_mem,))
+    try:
+        cur.execute(f"""
+        CREATE INDEX CONCURRENTLY {name}_new ON langchain_pg_embedding
+        USING {method} ((embedding::{cast}) {operator_class})
+        WITH ({options})
+        WHERE collection_id = '{collection_id}'
+        """)
+    finally:
+        if maintenance_work_mem:
+            cur.execute("RESET maintenance_work_mem")
+    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    cur.execute(f"ALTER INDEX {name}_new RENAME TO {name}")
+    # An index of the other method is superseded by this one
+    drop_vector_indexes(cur, collection_name, exclude=method)
+
+    params.update(type=cast, distance=distance)
+    cur.execute("""
+    INSERT INTO vector_index_state (index_name, collection_name, method, params, rows_at_build, built_at)
+    VALUES (%s, %s, %s, %s, %s, now())
+    ON CONFLICT (index_name) DO UPDATE
+    SET params = EXCLUDED.params, rows_at_build = EXCLUDED.rows_at_build, built_at = EXCLUDED.built_at
+    """, (name, collection_name, method, json.dumps(params), rows))
+    return f"{name}: {'rebuilt' if exists else 'created'} for {rows} rows with {options}"
+
+
+def drop_vector_indexes(cur, collection_name, exclude=None):
+    _require_autocommit(cur)
+    create_index_state_table(cur)
+    for method in ("hnsw", "ivfflat"):
+        if method != exclude:
+            name = index_name(collection_name, method)
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            cur.execute("DELETE FROM vector_index_state WHERE index_name = %s", (name,))
+
+
+# k nearest summaries of a collection as (id, document, cmetadata, distance), written so that
+# the index of ensure_vector_index can serve it. exact=True disables index scans for the rest
+# of the transaction (the reference for recall). ef_search (HNSW) and probes (IVFFlat) trade
+# latency for recall.
+def search(cur, collection_id, dimensions, query_vector, k=4, distance="cosine", exact=False,
+           ef_search=None, probes=None):
+    cast = vector_type(cur, dimensions)
+    expression, query_type = (f"embedding::{cast}", cast) if cast else ("embedding", "vector")
+    if exact:
+        cur.execute("SELECT set_config('enable_indexscan', 'off', true)")
+    if ef_search:
+        cur.execute("SELECT set_config('hnsw.ef_search', %s, true)", (str(ef_search),))
+    if probes:
+        cur.execute("SELECT set_config('ivfflat.probes', %s, true)", (str(probes),))
+    literal = "[" + ",".join(repr(float(value)) for value in query_vector) + "]"
+    # The collection is inlined, so the partial index matches with any driver and plan cache
+    cur.execute(f"""
+    SELECT id, document, cmetadata, {expression} {OPERATORS[distance]} %s::{query_type} AS distance
+    FROM langchain_pg_embedding
+    WHERE collection_id = '{collection_id}'
+    ORDER BY distance
+    LIMIT %s
+    """, (literal, k))
+    return cur.fetchall()
@@ -0,0 +1,115 @@
+# Rows/sec of the former per-row INSERT loop against the COPY based bulk_upsert.
+# Needs a PostgreSQL database (credentials from .env like the extraction script); the
+# benchmark works on a scratch table that is dropped afterwards:
+#   python -m benchmarks.bench_bulk_load --dbname ratsinformationssystem_bench --rows 20000 --page-size 100
+import argparse
+import os
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+from backend.bulk_loader import bulk_upsert, upsert_clause
+
+load_dotenv()
+
+COLUMNS = "paper_id, type_id, name, reference, date, auxiliary_file_id, consultation_id, keyword, created, modified, deleted"
+
+DDL = """
+DROP TABLE IF EXISTS bench_paper;
+CREATE TABLE bench_paper (
+    paper_id VARCHAR(255) PRIMARY KEY,
+    type_id VARCHAR(255) NOT NULL,
+    name VARCHAR(255),
+    reference VARCHAR(255),
+    date DATE,
+    auxiliary_file_id TEXT[],
+    consultation_id TEXT[],
+    keyword TEXT[],
+    created TIMESTAMPTZ,
+    modified TIMESTAMPTZ,
+    deleted BOOLEAN DEFAULT FALSE,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+
+def synthetic_rows(count, modified="2025-01-29T10:00:00+01:00"):
+    base = "https://web1.karlsruhe.de/ris/oparl/bodies/0001"
+    return [
+        (
+            f"{base}/papers/{i}",
+            "https://schema.oparl.org/1.1/Paper",
+            f"Vorlage {i}: Turmbergbahn, Verlängerung der Bergstation",
+            f"2025/{i:05d}",
+            "2025-01-29",
+            [f"{base}/files/{i}-{j}" for j in range(3)],
+            [f"{base}/consultations/{i}-{j}" for j in range(2)],
+            [],
+            "2025-01-01T10:00:00+01:00",
+            modified,
+            False,
+        )
+        for i in range(count)
+    ]
+
+
+def per_row(cur, conn, pages):
+    query = f"""
+    INSERT INTO bench_paper ({COLUMNS}) VALUES (
+        %s, %s, %s, %s, %s, %s::TEXT[], %s::TEXT[], %s::TEXT[], %s, %s, %s
+    ) {upsert_clause("bench_paper", "paper_id", COLUMNS)}
+    """
+    for page in pages:
+        for row in page:
+            cur.execute(query, row)
+        conn.commit()
+
+
+def bulk(cur, conn, pages):
+    for page in pages:
+        bulk_upsert(cur, "bench_paper", "paper_id", COLUMNS, page)
+        conn.commit()
+
+
+def run(label, loader, cur, conn, rows, page_size):
+    cur.execute(DDL)
+    conn.commit()
+    pages = [rows[i:i + page_size] for i in range(0, len(rows), page_size)]
+    start = time.perf_counter()
+    loader(cur, conn, pages)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {len(rows):>8} rows  {elapsed:7.2f}s  {len(rows) / elapsed:10.0f} rows/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dbname", required=True)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=args.host,
+        dbname=args.dbname,
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        port="5432"
+    )
+    cur = conn.cursor()
+    rows = synthetic_rows(args.rows)
+    try:
+        baseline = run("per-row", per_row, cur, conn, rows, args.page_size)
+        elapsed = run("copy+merge", bulk, cur, conn, rows, args.page_size)
+        print(f"speedup {baseline / elapsed:.1f}x")
+    finally:
+        cur.execute("DROP TABLE IF EXISTS bench_paper")
+        conn.commit()
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
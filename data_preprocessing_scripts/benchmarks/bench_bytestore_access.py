@@ -0,0 +1,158 @@
+# Latency and query plan of every access path of PostgresByteStore on a bytestore table of
+# the layout before the schema migrations (primary key (collection_name, key, filename), no
+# other index) and after migrate_schema(), at several table sizes. The benchmark drops and
+# recreates bytestore, so it needs a database of its own:
+#   python -m benchmarks.bench_bytestore_access --dbname bench --sizes 1000000,10000000
+import argparse
+import hashlib
+import os
+import random
+import statistics
+import time
+import uuid
+
+import psycopg
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+from backend.doc_store import migrate_schema
+
+load_dotenv()
+
+COLLECTION = "bench_access"
+ROWS_PER_FILE = 20
+
+OLD_LAYOUT = """
+DROP TABLE IF EXISTS bytestore, bytestore_schema;
+CREATE TABLE bytestore (
+    collection_name VARCHAR NOT NULL,
+    key VARCHAR NOT NULL,
+    value BYTEA,
+    value_hash VARCHAR,
+    filename VARCHAR NOT NULL,
+    PRIMARY KEY (collection_name, key, filename)
+);
+"""
+
+# Keys like the UUIDs of backend/chunk_ids.py, 20 rows per file, small values (the value
+# size does not change the access paths)
+LOAD = """
+INSERT INTO bytestore (collection_name, key, value, value_hash, filename)
+SELECT %(collection)s, md5(i::text)::uuid::text, convert_to(repeat(md5(i::text), 3), 'UTF8'),
+       md5(i::text), 'file-' || (i / 20) || '.pdf'
+FROM generate_series(%(start)s::bigint, %(stop)s::bigint) i
+"""
+
+# The statements of PostgresByteStore for each access path
+ACCESS_PATHS = {
+    "get": ("SELECT value FROM bytestore WHERE collection_name = %s AND key = %s", "key"),
+    "mget (20 keys)": ("SELECT key, value FROM bytestore WHERE collection_name = %s AND key = ANY(%s)", "keys"),
+    "mdelete (20 keys)": ("DELETE FROM bytestore WHERE collection_name = %s AND key = ANY(%s)", "keys"),
+    "rows of a file": ("SELECT key, value_hash FROM bytestore WHERE collection_name = %s AND filename = %s", "filename"),
+    "yield_keys(prefix)": ("SELECT key FROM bytestore WHERE collection_name = %s AND key LIKE %s", "prefix"),
+}
+
+
+def argument(kind, rng, size):
+    index = rng.randrange(size)
+    if kind == "key":
+        return md5_uuid(index)
+    if kind == "keys":
+        return [md5_uuid(rng.randrange(size)) for _ in range(ROWS_PER_FILE)]
+    if kind == "filename":
+        return f"file-{index // ROWS_PER_FILE}.pdf"
+    return md5_uuid(index)[:4] + "%"
+
+
+# md5(i::text)::uuid::text of LOAD
+def md5_uuid(index):
+    return str(uuid.UUID(hashlib.md5(str(index).encode()).hexdigest()))
+
+
+# Scan nodes of the plan, e.g. "Index Scan bytestore_pkey"
+def scans(node):
+    found = []
+    if "Scan" in node["Node Type"]:
+        found.append(f"{node['Node Type']} {node.get('Index Name', '')}".strip())
+    for child in node.get("Plans", []):
+        found.extend(scans(child))
+    return found
+
+
+# Median latency of a statement with random arguments (rolled back); slow statements are
+# run at least three times and for about max_seconds
+def measure(conn, statement, kind, size, runs, max_seconds):
+    rng = random.Random(1)
+    cur = conn.cursor()
+    cur.execute("EXPLAIN (FORMAT JSON) " + statement, (COLLECTION, argument(kind, rng, size)))
+    plan = ", ".join(scans(cur.fetchone()[0][0]["Plan"]))
+    conn.rollback()
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < runs and (len(latencies) < 3 or time.perf_counter() - started < max_seconds):
+        value = argument(kind, rng, size)
+        start = time.perf_counter()
+        cur.execute(statement, (COLLECTION, value))
+        if cur.description:
+            cur.fetchall()
+        latencies.append(time.perf_counter() - start)
+        conn.rollback()
+    return statistics.median(latencies) * 1000, plan
+
+
+def report(conn, size, runs, max_seconds):
+    for name, (statement, kind) in ACCESS_PATHS.items():
+        ms, plan = measure(conn, statement, kind, size, runs, max_seconds)
+        print(f"  {name:<20} {ms:10.2f} ms  {plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dbname", required=True)
+    parser.add_argument("--host", default=os.environ.get("DB_HOST", "localhost"))
+    parser.add_argument("--sizes", default="1000000,10000000")
+    parser.add_argument("--runs", type=int, default=200, help="queries per access path")
+    parser.add_argument("--max-seconds", type=float, default=5.0, help="time limit per access path")
+    args = parser.parse_args()
+
+    user, password = os.environ.get("DB_USER", ""), os.environ.get("DB_PASSWORD", "")
+    conn = psycopg.connect(host=args.host, dbname=args.dbname, user=user, password=password, port="5432")
+    credentials = f"{user}:{password}@" if password else f"{user}@"
+    engine = create_engine(f"postgresql+psycopg://{credentials}/{args.dbname}?host={args.host}")
+
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('bytestore') IS NOT NULL")
+    if cur.fetchone()[0]:
+        cur.execute("SELECT 1 FROM bytestore WHERE collection_name <> %s LIMIT 1", (COLLECTION,))
+        if cur.fetchone():
+            raise SystemExit(f"bytestore of {args.dbname} holds other collections; use a database of its own")
+    cur.execute("SELECT datcollate FROM pg_database WHERE datname = current_database()")
+    print(f"collation {cur.fetchone()[0]}")
+    conn.rollback()
+
+    try:
+        for size in (int(value) for value in args.sizes.split(",")):
+            start = time.perf_counter()
+            cur.execute(OLD_LAYOUT)
+            for offset in range(0, size, 1_000_000):
+                cur.execute(LOAD, {"collection": COLLECTION, "start": offset, "stop": min(offset + 1_000_000, size) - 1})
+            cur.execute("ANALYZE bytestore")
+            conn.commit()
+            print(f"\n{size} rows loaded in {time.perf_counter() - start:.0f}s, layout before the migrations:")
+            report(conn, size, args.runs, args.max_seconds)
+
+            start = time.perf_counter()
+            applied = migrate_schema(engine)
+            print(f"migrate_schema ({', '.join(applied)}) in {time.perf_counter() - start:.1f}s, after:")
+            cur.execute("ANALYZE bytestore")
+            conn.commit()
+            report(conn, size, args.runs, args.max_seconds)
+    finally:
+        conn.rollback()
+        cur.execute("DROP TABLE IF EXISTS bytestore, bytestore_schema")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# Per-file latency of PostgresByteStore.conditional_mset (and aconditional_mset) while the
+# collection grows, against the previous implementation that loaded the whole collection.
+# Rows are added with generate_series to a scratch collection that is deleted afterwards:
+#   python -m benchmarks.bench_conditional_mset --dbname bench --sizes 10000,100000,1000000,3000000
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from sqlalchemy import delete, select, text
+
+from backend.doc_store import ByteStore, PostgresByteStore
+
+load_dotenv()
+
+COLLECTION = "bench_conditional_mset"
+
+
+# conditional_mset as it was before the rewrite
+def legacy_conditional_mset(store, items):
+    modified_keys = []
+    with store.Session() as session:
+        existing_keys = session.execute(
+            select(ByteStore.key).where(
+                ByteStore.collection_name == store.collection_name,
+                ByteStore.filename == items[0][2]
+            )
+        ).scalars().all()
+
+        keys_to_delete = set(existing_keys) - {key for key, _, _ in items}
+        if keys_to_delete:
+            session.execute(
+                delete(ByteStore).where(
+                    ByteStore.collection_name == store.collection_name,
+                    ByteStore.filename == items[0][2],
+                    ByteStore.key.in_(keys_to_delete)
+                )
+            )
+            modified_keys.extend([(key, 'DEL') for key in keys_to_delete])
+        session.commit()
+
+        existing_records = session.execute(select(ByteStore).filter_by(collection_name=store.collection_name)).scalars().all()
+        existing_record_map = {(record.key, record.filename): record for record in existing_records}
+
+        for key, value, filename in items:
+            serialized_value = store.serialize_value(value)
+            new_hash = store.compute_hash(store.extract_hashable_content(value))
+            if (key, filename) in existing_record_map:
+                if existing_record_map[(key, filename)].value_hash == new_hash:
+                    modified_keys.append((key, 'SKIP'))
+                else:
+                    session.merge(ByteStore(collection_name=store.collection_name, key=key, value=serialized_value, value_hash=new_hash, filename=filename))
+                    modified_keys.append((key, 'UPD'))
+            else:
+                session.add(ByteStore(collection_name=store.collection_name, key=key, value=serialized_value, value_hash=new_hash, filename=filename))
+                modified_keys.append((key, 'INS'))
+        session.commit()
+    return modified_keys
+
+
+# Grows the collection to size rows of ~2 KB, 20 per file
+def grow(store, size):
+    with store.engine.begin() as conn:
+        current = conn.execute(text("SELECT count(*) FROM bytestore WHERE collection_name = :c"), {"c": COLLECTION}).scalar()
+        conn.execute(text("""
+        INSERT INTO bytestore (collection_name, key, value, value_hash, filename)
+        SELECT :c, 'key-' || i, convert_to(repeat(md5(i::text), 64), 'UTF8'), md5(i::text), 'file-' || (i / 20) || '.pdf'
+        FROM generate_series(CAST(:start AS bigint), CAST(:stop AS bigint)) i
+        """), {"c": COLLECTION, "start": current, "stop": size - 1})
+        conn.execute(text("ANALYZE bytestore"))
+
+
+# One re-processed PDF with 20 stored chunks: 15 unchanged, 3 changed, 2 dropped, 2 new
+def file_items(store, round_number):
+    filename = f"bench-{round_number}.pdf"
+    keys = [f"bench-{round_number}-{i}" for i in range(20)]
+    store.mset([(key, Document(page_content=f"chunk {key}"), filename) for key in keys])
+    items = [(key, Document(page_content=f"chunk {key}"), filename) for key in keys[:15]]
+    items += [(key, Document(page_content=f"changed {key}"), filename) for key in keys[15:18]]
+    items += [(f"bench-{round_number}-new-{i}", Document(page_content=f"new {i}"), filename) for i in range(2)]
+    return items
+
+
+def timed(function, store, rounds, offset):
+    latencies = []
+    for round_number in range(offset, offset + rounds):
+        items = file_items(store, round_number)
+        start = time.perf_counter()
+        function(items)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+async def timed_async(function, store, rounds, offset):
+    latencies = []
+    for round_number in range(offset, offset + rounds):
+        items = file_items(store, round_number)
+        start = time.perf_counter()
+        await function(items)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dbname", required=True)
+    parser.add_argument("--host", default=os.environ.get("DB_HOST", "localhost"))
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--rounds", type=int, default=20, help="files written per size and variant")
+    parser.add_argument("--legacy-max", type=int, default=200000, help="largest size the old implementation is run at")
+    args = parser.parse_args()
+
+    user, password = os.environ.get("DB_USER", ""), os.environ.get("DB_PASSWORD", "")
+    credentials = f"{user}:{password}@" if password else f"{user}@"
+    # Content hashes like the previous implementation, so both do the same writes
+    store = PostgresByteStore(f"postgresql+psycopg://{credentials}/{args.dbname}?host={args.host}", COLLECTION,
+                              hashing="content-sha256")
+    # One event loop for all async calls; the async engine's connections belong to it
+    loop = asyncio.new_event_loop()
+    with store.engine.begin() as conn:
+        conn.execute(text("DELETE FROM bytestore WHERE collection_name = :c"), {"c": COLLECTION})
+    try:
+        print(f"{'rows':>10}  {'legacy':>10}  {'set-based':>10}  {'async':>10}  (median ms per file)")
+        offset = 0
+        for size in (int(value) for value in args.sizes.split(",")):
+            grow(store, size)
+            legacy = "-"
+            if size <= args.legacy_max:
+                legacy = f"{timed(lambda items: legacy_conditional_mset(store, items), store, args.rounds, offset):10.1f}"
+                offset += args.rounds
+            current = timed(store.conditional_mset, store, args.rounds, offset)
+            offset += args.rounds
+            async_current = loop.run_until_complete(timed_async(store.aconditional_mset, store, args.rounds, offset))
+            offset += args.rounds
+            print(f"{size:>10}  {legacy:>10}  {current:10.1f}  {async_current:10.1f}")
+    finally:
+        loop.close()
+        with store.engine.begin() as conn:
+            conn.execute(text("DELETE FROM bytestore WHERE collection_name = :c"), {"c": COLLECTION})
+
+
+if __name__ == "__main__":
+    main()
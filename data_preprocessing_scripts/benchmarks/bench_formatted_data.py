@@ -0,0 +1,201 @@
+# EXPLAIN ANALYZE of the metadata query on a synthetic OParl dataset: the original
+# query with "= ANY(array)" joins against backend.formatted_data.SOURCE_QUERY, with the
+# indexes and link tables declared in backend.oparl_schema. Runs in a scratch schema that is dropped
+# afterwards (credentials from .env like the extraction script):
+#   python -m benchmarks.bench_formatted_data --dbname ratsinformationssystem_bench --files 1000000
+import argparse
+import os
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+from backend.formatted_data import SOURCE_QUERY
+from backend.oparl_schema import backfill_links, schema_ddl
+
+load_dotenv()
+
+SCHEMA = "bench_formatted_data"
+
+# The query as it was before the rewrite, branch for branch
+LEGACY_QUERY = """
+    SELECT 'paper_file' AS file_type, file.file_name AS pdf_name, file.name AS file_title, file.access_url AS access_url,
+        paper.reference AS reference, paper.paper_type AS paper_type, ARRAY_AGG(consultation.role) AS role,
+        ARRAY_AGG(organization.name) AS organization_name, paper.name AS agenda_item, ARRAY_AGG(agenda_item.result) AS result,
+        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date) AS meeting_date,
+        STRING_AGG(organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', ') AS sitzungen
+    FROM file
+    LEFT JOIN paper ON file.paper_id[1] = paper.paper_id
+    LEFT JOIN consultation ON paper.paper_id = consultation.paper_id
+    LEFT JOIN organization ON consultation.organization_id[1] = organization.organization_id
+    LEFT JOIN agenda_item ON consultation.agenda_item_id = agenda_item.agenda_item_id
+    LEFT JOIN meeting ON agenda_item.meeting_id = meeting.meeting_id
+    WHERE paper.paper_id IS NOT NULL
+    GROUP BY file.file_name, file.name, file.access_url, paper.reference, paper.paper_type, paper.name
+    UNION
+    SELECT 'agenda_item_auxiliary_file', file.file_name, file.name, file.access_url, NULL, NULL, NULL,
+        ARRAY_AGG(organization.name), agenda_item.name, ARRAY_AGG(agenda_item.result),
+        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date),
+        STRING_AGG(organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', ')
+    FROM file
+    LEFT JOIN agenda_item ON file.file_id = ANY(agenda_item.auxiliary_file_id)
+    LEFT JOIN meeting ON agenda_item.meeting_id = meeting.meeting_id
+    LEFT JOIN organization ON meeting.organization[1] = organization.organization_id
+    WHERE agenda_item.auxiliary_file_id IS NOT NULL
+    GROUP BY file.file_name, file.name, file.access_url, agenda_item.name
+    UNION
+    SELECT 'meeting_auxiliary_file', file.file_name, file.name, file.access_url, NULL, NULL, NULL,
+        ARRAY_AGG(organization.name), NULL, NULL,
+        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date),
+        STRING_AGG(organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', ')
+    FROM file
+    LEFT JOIN meeting ON file.file_id = ANY(meeting.auxiliary_file)
+    LEFT JOIN organization ON meeting.organization[1] = organization.organization_id
+    WHERE meeting.auxiliary_file IS NOT NULL
+    GROUP BY file.file_name, file.name, file.access_url
+    UNION
+    SELECT 'verbatim_protocol_file', file.file_name, file.name, file.access_url, NULL, NULL, NULL,
+        ARRAY_AGG(organization.name), NULL, NULL,
+        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date),
+        STRING_AGG(organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', ')
+    FROM file
+    LEFT JOIN meeting ON file.file_id = meeting.verbatim_protocol_id
+    LEFT JOIN organization ON meeting.organization[1] = organization.organization_id
+    WHERE meeting.verbatim_protocol_id IS NOT NULL
+    GROUP BY file.file_name, file.name, file.access_url
+    UNION
+    SELECT 'results_protocol_file', file.file_name, file.name, file.access_url, NULL, NULL, NULL,
+        ARRAY_AGG(organization.name), NULL, NULL,
+        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date),
+        STRING_AGG(organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', ')
+    FROM file
+    LEFT JOIN meeting ON file.file_id = meeting.results_protocol_id
+    LEFT JOIN organization ON meeting.organization[1] = organization.organization_id
+    WHERE meeting.results_protocol_id IS NOT NULL
+    GROUP BY file.file_name, file.name, file.access_url
+    UNION
+    SELECT 'invitation_file', file.file_name, file.name, file.access_url, NULL, NULL, NULL,
+        ARRAY_AGG(organization.name), NULL, NULL,
+        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date),
+        STRING_AGG(organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', ')
+    FROM file
+    LEFT JOIN meeting ON file.file_id = meeting.invitation_id
+    LEFT JOIN organization ON meeting.organization[1] = organization.organization_id
+    WHERE meeting.invitation_id IS NOT NULL
+    GROUP BY file.file_name, file.name, file.access_url
+"""
+
+# 60 % paper files (two per paper), 20 % auxiliary files of agenda items (two per item),
+# 10 % auxiliary files of meetings, the rest invitations, protocols or unreferenced files.
+# Every paper has two consultations in different agenda items.
+SYNTHETIC_DATA = """
+INSERT INTO organization (organization_id, type_id, body_id, name, modified)
+SELECT 'o' || i, 'Organization', 'b', 'Gremium ' || i, now() FROM generate_series(1, 50) i;
+
+INSERT INTO meeting (meeting_id, type_id, start, organization, auxiliary_file,
+                     invitation_id, results_protocol_id, verbatim_protocol_id, modified)
+SELECT 'm' || k, 'Meeting', timestamp '2015-01-01' + k * interval '4 hours', ARRAY['o' || (k %% 50 + 1)],
+       ARRAY(SELECT 'f' || g FROM generate_series(%(m_aux_start)s + (k - 1) * %(m_aux_per)s + 1,
+                                                   %(m_aux_start)s + k * %(m_aux_per)s) g),
+       'f' || (%(proto_start)s + 3 * k - 2), 'f' || (%(proto_start)s + 3 * k - 1), 'f' || (%(proto_start)s + 3 * k),
+       now()
+FROM generate_series(1, %(meetings)s) k;
+
+INSERT INTO agenda_item (agenda_item_id, type_id, meeting_id, name, result, auxiliary_file_id, modified)
+SELECT 'a' || j, 'AgendaItem', 'm' || (j %% %(meetings)s + 1), 'TOP ' || j, 'angenommen',
+       ARRAY['f' || (%(a_aux_start)s + 2 * j - 1), 'f' || (%(a_aux_start)s + 2 * j)], now()
+FROM generate_series(1, %(agenda_items)s) j;
+
+INSERT INTO paper (paper_id, type_id, name, reference, paper_type, modified)
+SELECT 'p' || i, 'Paper', 'Vorlage ' || i, '2025/' || i, 'Beschlussvorlage', now()
+FROM generate_series(1, %(papers)s) i;
+
+INSERT INTO consultation (consultation_id, type_id, paper_id, agenda_item_id, organization_id, role, modified)
+SELECT 'c' || i || '-' || n, 'Consultation', 'p' || i, 'a' || ((i * 7 + n) %% %(agenda_items)s + 1),
+       ARRAY['o' || ((i + n) %% 50 + 1)], 'Beschlussfassung', now()
+FROM generate_series(1, %(papers)s) i, generate_series(1, 2) n;
+
+INSERT INTO file (file_id, type_id, name, file_name, access_url, paper_id, modified)
+SELECT 'f' || i, 'File', 'Datei ' || i, i || '.pdf', 'https://example.org/files/' || i,
+       CASE WHEN i <= %(paper_files)s THEN ARRAY['p' || ((i + 1) / 2)] END, now()
+FROM generate_series(1, %(files)s) i;
+"""
+
+
+def dataset_params(files):
+    paper_files = files * 6 // 10
+    agenda_files = files * 2 // 10
+    meeting_aux_files = files // 10
+    meetings = max(files // 100, 1)
+    return {
+        "files": files,
+        "paper_files": paper_files,
+        "papers": paper_files // 2,
+        "a_aux_start": paper_files,
+        "agenda_items": agenda_files // 2,
+        "m_aux_start": paper_files + agenda_files,
+        "m_aux_per": max(meeting_aux_files // meetings, 1),
+        "proto_start": paper_files + agenda_files + meeting_aux_files,
+        "meetings": meetings,
+    }
+
+
+def plan_nodes(plan, nodes=None):
+    nodes = [] if nodes is None else nodes
+    node = plan["Node Type"]
+    if "Index Name" in plan:
+        node += f" ({plan['Index Name']})"
+    nodes.append(node)
+    for child in plan.get("Plans", []):
+        plan_nodes(child, nodes)
+    return nodes
+
+
+def explain(cur, label, query):
+    cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) SELECT count(*) FROM ({query}) formatted")
+    result = cur.fetchone()[0][0]
+    nodes = plan_nodes(result["Plan"])
+    joins = sorted({node for node in nodes if "Join" in node or "Nested Loop" in node or "Index" in node})
+    print(f"{label:<10} execution {result['Execution Time'] / 1000:8.2f}s  planning {result['Planning Time']:.1f}ms")
+    print(f"{'':<10} join/index nodes: {', '.join(joins)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dbname", required=True)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--files", type=int, default=1_000_000)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=args.host,
+        dbname=args.dbname,
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        port="5432"
+    )
+    cur = conn.cursor()
+    try:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}; SET search_path TO {SCHEMA}")
+        cur.execute(schema_ddl())
+        start = time.perf_counter()
+        cur.execute(SYNTHETIC_DATA, dataset_params(args.files))
+        backfill_links(cur)
+        cur.execute("ANALYZE")
+        conn.commit()
+        print(f"synthetic dataset with {args.files} files loaded in {time.perf_counter() - start:.1f}s")
+
+        explain(cur, "legacy", LEGACY_QUERY)
+        explain(cur, "rewritten", SOURCE_QUERY)
+    finally:
+        conn.rollback()
+        if not args.keep:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            conn.commit()
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
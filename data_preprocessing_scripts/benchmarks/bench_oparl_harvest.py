@@ -0,0 +1,107 @@
+# Benchmark of the sequential page loop against the concurrent OParl harvester.
+# Runs against a local stand-in OParl server, no database or network access needed:
+#   python -m benchmarks.bench_oparl_harvest --pages 30 --latency 0.05 --insert-delay 0.02
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from backend.oparl_harvester import OParlHarvester
+
+ENDPOINTS = [
+    "people", "memberships", "organizations", "meetings", "agendaItems",
+    "consultations", "papers", "files", "locations", "legislativeTerms",
+]
+
+
+# Serves every endpoint as a paged OParl list with an artificial response latency
+def make_handler(pages, page_size, latency):
+    class StandInOParlHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; avoid Nagle delays on keep-alive connections
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            endpoint = parts.path.rsplit("/", 1)[-1]
+            page = int(parse_qs(parts.query).get("page", ["1"])[0])
+            time.sleep(latency)
+
+            base = f"http://{self.headers['Host']}/bodies/0001/{endpoint}"
+            body = {
+                "data": [
+                    {"id": f"{base}/{page}-{i}", "type": endpoint, "modified": "2025-01-29T00:00:00+01:00"}
+                    for i in range(page_size)
+                ],
+                "links": {"next": f"{base}?page={page + 1}"} if page < pages else {},
+            }
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandInOParlHandler
+
+
+# The loop used before the harvester: one endpoint after the other, one request per page
+def sequential(links, insert_delay):
+    for url in links.values():
+        while url:
+            data = requests.get(url).json()
+            time.sleep(insert_delay)
+            url = data["links"].get("next")
+
+
+def concurrent(links, insert_delay, max_per_host):
+    harvester = OParlHarvester(max_per_host=max_per_host)
+    try:
+        for _ in harvester.harvest(links):
+            time.sleep(insert_delay)
+    finally:
+        harvester.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=30, help="pages per endpoint")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="server latency per request in seconds")
+    parser.add_argument("--insert-delay", type=float, default=0.02, help="simulated insert time per page in seconds")
+    parser.add_argument("--max-per-host", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.pages, args.page_size, args.latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    links = {endpoint: f"http://{host}:{port}/bodies/0001/{endpoint}" for endpoint in ENDPOINTS}
+    total_pages = args.pages * len(ENDPOINTS)
+
+    try:
+        start = time.perf_counter()
+        sequential(links, args.insert_delay)
+        baseline = time.perf_counter() - start
+        print(f"sequential:            {baseline:7.2f}s  {total_pages / baseline:8.1f} pages/s")
+
+        for max_per_host in args.max_per_host:
+            start = time.perf_counter()
+            concurrent(links, args.insert_delay, max_per_host)
+            elapsed = time.perf_counter() - start
+            print(
+                f"harvester max/host={max_per_host:<3} {elapsed:7.2f}s  {total_pages / elapsed:8.1f} pages/s"
+                f"  speedup {baseline / elapsed:5.2f}x"
+            )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# PDFs/min of the former sequential partition_pdf loop against the PartitionPool, on the
+# PDFs in raw_data/ (hi_res with table structure, the settings of the pipeline):
+#   python -m benchmarks.bench_partition --workers 8 --limit 20
+import argparse
+import os
+import time
+
+from backend.pdf_partitioning import PARTITION_KWARGS, PartitionPool, partition_file
+
+RAW_DATA = os.path.join(os.path.dirname(__file__), "..", "..", "raw_data")
+
+
+def sequential(pdf_paths, timeout):
+    for pdf_path in pdf_paths:
+        partition_file(pdf_path, **PARTITION_KWARGS)
+
+
+def pool(workers):
+    def run(pdf_paths, timeout):
+        failed = [p for p in PartitionPool(workers=workers, timeout=timeout).partition(pdf_paths) if p.error]
+        for partitioned in failed:
+            print(f"  {os.path.basename(partitioned.pdf_path)}: {partitioned.error}")
+    return run
+
+
+def run(label, partition, pdf_paths, timeout):
+    start = time.perf_counter()
+    partition(pdf_paths, timeout)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {len(pdf_paths):>4} PDFs  {elapsed:8.1f}s  {len(pdf_paths) / elapsed * 60:8.1f} PDFs/min")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=RAW_DATA)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--timeout", type=int, default=900)
+    parser.add_argument("--limit", type=int, help="only the first N PDFs")
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    pdf_paths = sorted(
+        os.path.join(args.path, f) for f in os.listdir(args.path) if f.lower().endswith(".pdf")
+    )[:args.limit]
+
+    elapsed = run(f"pool x{args.workers}", pool(args.workers), pdf_paths, args.timeout)
+    if not args.skip_sequential:
+        baseline = run("sequential", sequential, pdf_paths, args.timeout)
+        print(f"speedup {baseline / elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# Latency of PostgresByteStore.mget/amget with and without the ReadCache, for lookups like
+# those of the MultiVectorRetriever: the k chunk IDs of the top hits per question, questions
+# drawn from a skewed popularity distribution (a few topics, like the Turmbergbahn decision
+# papers, are asked about much more often than the rest). The chunks
+# are written to a scratch collection that is deleted afterwards:
+#   python -m benchmarks.bench_read_cache --dbname bench --chunks 50000 --questions 2000
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from sqlalchemy import text
+
+from backend.doc_store import PostgresByteStore, ReadCache
+
+load_dotenv()
+
+COLLECTION = "bench_read_cache"
+
+
+# Chunk IDs of every question; distinct questions with k random chunks each, question i is
+# asked with a weight of 1 / (i + 1) ** skew
+def questions(chunks, count, distinct, k, skew, seed=1):
+    rng = random.Random(seed)
+    pool = [[f"chunk-{rng.randrange(chunks)}" for _ in range(k)] for _ in range(distinct)]
+    weights = [1 / (i + 1) ** skew for i in range(distinct)]
+    return rng.choices(pool, weights, k=count)
+
+
+def timed(mget, lookups):
+    latencies = []
+    for keys in lookups:
+        start = time.perf_counter()
+        mget(keys)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def timed_async(amget, lookups):
+    latencies = []
+    for keys in lookups:
+        start = time.perf_counter()
+        await amget(keys)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(label, latencies, cache=None):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    print(f"{label:<14} p50 {p50:7.2f} ms  p95 {p95:7.2f} ms  total {sum(latencies):6.2f}s")
+    if cache is not None:
+        print(f"{'':<14} {cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dbname", required=True)
+    parser.add_argument("--host", default=os.environ.get("DB_HOST", "localhost"))
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--distinct-questions", type=int, default=2000)
+    parser.add_argument("-k", type=int, default=4, help="chunks per question (top-k of the retriever)")
+    parser.add_argument("--skew", type=float, default=1.0, help="exponent of the popularity distribution")
+    parser.add_argument("--cache-mb", type=float, default=64)
+    parser.add_argument("--ttl", type=float, default=300)
+    args = parser.parse_args()
+
+    user, password = os.environ.get("DB_USER", ""), os.environ.get("DB_PASSWORD", "")
+    credentials = f"{user}:{password}@" if password else f"{user}@"
+    conninfo = f"postgresql+psycopg://{credentials}/{args.dbname}?host={args.host}"
+    store = PostgresByteStore(conninfo, COLLECTION)
+    rng = random.Random(2)
+    words = "Gemeinderat Turmbergbahn Beschluss Vorlage Sitzung Antrag Haushalt Durlach Bergstation".split()
+    for start in range(0, args.chunks, 5000):
+        store.mset([
+            (f"chunk-{i}", Document(
+                page_content=" ".join(rng.choice(words) for _ in range(200)),
+                metadata={"filename": f"{i // 20}.pdf", "reference": f"2024/{i // 20:04d}"},
+            ), f"{i // 20}.pdf")
+            for i in range(start, min(start + 5000, args.chunks))
+        ])
+    with store.engine.begin() as conn:
+        conn.execute(text("ANALYZE bytestore"))
+    lookups = questions(args.chunks, args.questions, args.distinct_questions, args.k, args.skew)
+    print(f"{args.chunks} chunks, {args.questions} questions ({args.distinct_questions} distinct) with k={args.k}, skew {args.skew}")
+
+    try:
+        report("no cache", timed(store.mget, lookups))
+        store.cache = ReadCache(max_bytes=int(args.cache_mb * 1e6), ttl=args.ttl)
+        report("cache", timed(store.mget, lookups), store.cache)
+
+        # Both async runs in one event loop; the async engine's connections belong to it
+        async def run():
+            store.cache = None
+            uncached = await timed_async(store.amget, lookups)
+            store.cache = ReadCache(max_bytes=int(args.cache_mb * 1e6), ttl=args.ttl)
+            return uncached, await timed_async(store.amget, lookups)
+
+        uncached, cached = asyncio.run(run())
+        report("async no cache", uncached)
+        report("async cache", cached, store.cache)
+    finally:
+        with store.engine.begin() as conn:
+            conn.execute(text("DELETE FROM bytestore WHERE collection_name = :c"), {"c": COLLECTION})
+
+
+if __name__ == "__main__":
+    main()
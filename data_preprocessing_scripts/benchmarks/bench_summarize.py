@@ -0,0 +1,88 @@
+# Summarization throughput of the former per-file chain.batch(max_concurrency=3) against
+# the SummaryScheduler, against the local mock LLM server (no API key or network needed):
+#   python -m benchmarks.bench_summarize --files 40 --rpm 600 --tpm 400000 --latency 0.8
+import argparse
+import random
+import time
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+
+from backend.summary_scheduler import SummaryScheduler
+from benchmarks.mock_llm_server import start_server
+
+PROMPT = "Fasse den folgenden Abschnitt aus dem Ratsinformationssystem zusammen:\n\n{element}"
+
+
+# Chunk inputs per synthetic PDF; sizes vary like in the corpus (a few large, many small PDFs)
+def synthetic_files(count, seed=1):
+    rng = random.Random(seed)
+    return [
+        [{"element": f"Datei {i}, Abschnitt {j}: " + "Turmbergbahn Bergstation Verlängerung. " * rng.randint(20, 100)}
+         for j in range(rng.choice([1, 2, 2, 3, 5, 8, 15, 30]))]
+        for i in range(count)
+    ]
+
+
+def make_chain(base_url, max_retries):
+    model = ChatOpenAI(model="gpt-4o-mini", temperature=0, base_url=base_url, api_key="mock", max_retries=max_retries)
+    return ChatPromptTemplate.from_template(PROMPT) | model | StrOutputParser()
+
+
+def fixed_batches(chain, files, args):
+    for inputs in files:
+        chain.batch(inputs, {"max_concurrency": 3})
+
+
+def scheduler_per_file(chain, files, args):
+    scheduler = SummaryScheduler(chain, requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    try:
+        for inputs in files:
+            scheduler.batch(inputs)
+    finally:
+        scheduler.close()
+    print(f"  {scheduler.stats()}")
+
+
+def scheduler_across_files(chain, files, args):
+    scheduler = SummaryScheduler(chain, requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    try:
+        futures = [scheduler.submit(item) for inputs in files for item in inputs]
+        for future in futures:
+            future.result()
+    finally:
+        scheduler.close()
+    print(f"  {scheduler.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--rpm", type=int, default=600)
+    parser.add_argument("--tpm", type=int, default=400000)
+    parser.add_argument("--latency", type=float, default=0.8)
+    parser.add_argument("--capacity", type=int, default=32, help="concurrent requests before the mock slows down")
+    args = parser.parse_args()
+
+    files = synthetic_files(args.files)
+    total = sum(len(inputs) for inputs in files)
+    for label, run, max_retries in [
+        ("fixed x3", fixed_batches, 2),
+        ("scheduler", scheduler_per_file, 0),
+        ("scheduler*", scheduler_across_files, 0),
+    ]:
+        # Fresh server per run, so every run starts with empty rate limit windows
+        server, stats = start_server(rpm=args.rpm, tpm=args.tpm, latency=args.latency, capacity=args.capacity)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        start = time.perf_counter()
+        run(make_chain(base_url, max_retries), files, args)
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+        print(f"{label:<11} {total:>5} summaries  {elapsed:7.1f}s  {total / elapsed:6.1f}/s  "
+              f"{stats['rate_limited']} x 429")
+    print("scheduler: per file as in the script, scheduler*: all files submitted at once")
+
+
+if __name__ == "__main__":
+    main()
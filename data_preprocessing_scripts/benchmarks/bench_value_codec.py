@@ -0,0 +1,126 @@
+# Bytes per row and encode/decode throughput of the doc store codecs (backend/value_codec.py)
+# against pickle, and the cost of value plus value_hash per row for each hashing (the
+# previous pickle with SHA-256 of page_content, fingerprints of the canonical bytes), on
+# synthetic chunks with the metadata of the PDF pipeline:
+#   python -m benchmarks.bench_value_codec
+# or on a sample of the stored chunks of a doc store collection (credentials from .env):
+#   python -m benchmarks.bench_value_codec --dbname production_turmbergbahn_large_embed_metadata
+import argparse
+import datetime
+import hashlib
+import os
+import random
+import time
+
+import psycopg
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from backend.value_codec import CODECS, FINGERPRINTS, codec_by_name, decode, fingerprint_by_name, xxhash
+
+load_dotenv()
+
+WORDS = (
+    "der die das und Gemeinderat Stadt Karlsruhe Turmbergbahn Beschluss Vorlage Sitzung Antrag "
+    "Haushalt Verwaltung Ausschuss Stellungnahme Verlängerung Durlach Bergstation Kosten Euro "
+    "Planung Bürgerinnen Bürger Fraktion Tagesordnung wird werden zur mit von für im auf über"
+).split()
+
+
+def synthetic_documents(count, seed=1):
+    rng = random.Random(seed)
+    documents = []
+    for i in range(count):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(80, 400)))
+        documents.append(Document(page_content=text, metadata={
+            "url": f"https://web1.karlsruhe.de/ris/oparl/bodies/0001/downloadfiles/a/{i // 20}.pdf",
+            "filename": f"{i // 20}.pdf",
+            "file_title": "Verlängerung der Turmbergbahn",
+            "reference": f"2024/{i // 20:04d}",
+            "paper_type": "Beschlussvorlage",
+            "role": None,
+            "organization_name": "Gemeinderat",
+            "agenda_item": f"TOP {i % 30}",
+            "result": "beschlossen",
+            "meeting_date": datetime.date(2024, 1 + i % 12, 1 + i % 28).isoformat(),
+            "sitzungen": "Gemeinderat",
+            "file_type": "application/pdf",
+        }))
+    return documents
+
+
+def stored_documents(args):
+    conn = psycopg.connect(
+        host=args.host,
+        dbname=args.dbname,
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        port="5432"
+    )
+    with conn, conn.cursor() as cur:
+        cur.execute("""
+        SELECT value FROM bytestore WHERE collection_name = %s AND value IS NOT NULL
+        ORDER BY md5(key) LIMIT %s
+        """, (args.collection, args.rows))
+        return [decode(value, allow_pickle=True) for value, in cur.fetchall()]
+
+
+def best_of(repeat, function):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dbname", help="sample the stored chunks of this database instead of synthetic ones")
+    parser.add_argument("--host", default=os.environ.get("DB_HOST", "localhost"))
+    parser.add_argument("--collection", default="original_chunks")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    documents = stored_documents(args) if args.dbname else synthetic_documents(args.rows)
+    text_bytes = sum(len(document.page_content.encode()) for document in documents)
+    print(f"{len(documents)} documents, {text_bytes / len(documents):.0f} bytes of text on average")
+    print(f"{'codec':<10} {'bytes/row':>10} {'encode rows/s':>14} {'encode MB/s':>12} {'decode rows/s':>14}")
+    for name in CODECS:
+        codec = codec_by_name(name)
+        encoded = [codec.encode(document) for document in documents]
+        assert all(codec.decode(data) == document for data, document in zip(encoded, documents))
+        size = sum(len(data) for data in encoded) / len(encoded)
+        encode = best_of(args.repeat, lambda: [codec.encode(document) for document in documents])
+        decode_time = best_of(args.repeat, lambda: [codec.decode(data) for data in encoded])
+        print(f"{name:<10} {size:10.0f} {len(documents) / encode:14.0f} "
+              f"{text_bytes / encode / 1e6:12.1f} {len(documents) / decode_time:14.0f}")
+
+    print(f"\n{'value + value_hash':<28} {'rows/s':>10}")
+    pickle_codec = codec_by_name("pickle")
+    variants = {
+        "pickle, content-sha256": lambda document: (
+            pickle_codec.encode(document), hashlib.sha256(document.page_content.encode("utf-8")).hexdigest()
+        ),
+    }
+    for codec_name in ("json", "json+zstd"):
+        for hashing in FINGERPRINTS:
+            if hashing == "xxh3" and xxhash is None:
+                continue
+            variants[f"{codec_name}, {hashing}"] = single_pass(codec_by_name(codec_name), fingerprint_by_name(hashing))
+    for label, function in variants.items():
+        elapsed = best_of(args.repeat, lambda: [function(document) for document in documents])
+        print(f"{label:<28} {len(documents) / elapsed:10.0f}")
+
+
+# As PostgresByteStore.encode and row: canonical bytes once, fingerprint and pack them
+def single_pass(codec, fingerprint):
+    def encode(document):
+        canonical = codec.canonical(document)
+        return codec.pack(canonical), fingerprint(canonical)
+    return encode
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# Recall and latency of ANN search (backend.vector_index) against the exact scan, on the
+# summaries of the vector database (credentials from .env like the PDF script):
+#   python -m benchmarks.bench_vector_index --dbname production_turmbergbahn_large_embed_metadata
+# or on a synthetic clustered collection "bench_summaries" that is deleted afterwards:
+#   python -m benchmarks.bench_vector_index --dbname bench --synthetic 200000 --dims 256
+# Queries are stored vectors with some noise added, like a question close to a summary.
+import argparse
+import os
+import random
+import statistics
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+from backend.ingest_writer import collection_uuid
+from backend.vector_index import (
+    collection_size, drop_vector_indexes, ensure_vector_index, index_name, search, vector_type,
+)
+
+load_dotenv()
+
+SYNTHETIC_COLLECTION = "bench_summaries"
+
+# Tables as created by langchain_postgres, for databases without them
+LANGCHAIN_TABLES = """
+CREATE EXTENSION IF NOT EXISTS vector;
+CREATE TABLE IF NOT EXISTS langchain_pg_collection (
+    uuid UUID PRIMARY KEY,
+    name VARCHAR NOT NULL UNIQUE,
+    cmetadata JSON
+);
+CREATE TABLE IF NOT EXISTS langchain_pg_embedding (
+    id VARCHAR PRIMARY KEY,
+    collection_id UUID REFERENCES langchain_pg_collection (uuid) ON DELETE CASCADE,
+    embedding VECTOR,
+    document VARCHAR,
+    cmetadata JSONB
+);
+"""
+
+# Vectors around 200 random centers; cosine distance only looks at the direction
+SYNTHETIC_DATA = """
+CREATE TEMP TABLE bench_centers AS
+SELECT center, dim, random() - 0.5 AS value
+FROM generate_series(0, 199) center, generate_series(1, %(dims)s) dim;
+
+INSERT INTO langchain_pg_embedding (id, collection_id, embedding, document, cmetadata)
+SELECT 'bench-' || i, %(collection_id)s,
+       (SELECT array_agg(value + (random() - 0.5) * 0.3 ORDER BY dim) FROM bench_centers WHERE center = i %% 200)::vector,
+       'synthetic summary ' || i, jsonb_build_object('doc_id', 'bench-' || i)
+FROM generate_series(1, %(rows)s) i;
+"""
+
+
+def create_synthetic_collection(cur, rows, dims):
+    cur.execute(LANGCHAIN_TABLES)
+    cur.execute("DELETE FROM langchain_pg_collection WHERE name = %s", (SYNTHETIC_COLLECTION,))
+    cur.execute("INSERT INTO langchain_pg_collection (uuid, name) VALUES (gen_random_uuid(), %s) RETURNING uuid",
+                (SYNTHETIC_COLLECTION,))
+    collection_id = cur.fetchone()[0]
+    cur.execute(SYNTHETIC_DATA, {"collection_id": collection_id, "rows": rows, "dims": dims})
+    cur.execute("ANALYZE langchain_pg_embedding")
+
+
+def query_vectors(cur, collection_id, count, noise, seed=1):
+    cur.execute("""
+    SELECT embedding::text FROM langchain_pg_embedding
+    WHERE collection_id = %s ORDER BY md5(id || %s) LIMIT %s
+    """, (collection_id, str(seed), count))
+    rng = random.Random(seed)
+    return [
+        [float(value) + rng.gauss(0, noise) for value in text.strip("[]").split(",")]
+        for text, in cur.fetchall()
+    ]
+
+
+# Runs every query in its own transaction (search() sets its options transaction-local)
+def run_queries(conn, collection_id, dims, queries, k, **options):
+    cur = conn.cursor()
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        rows = search(cur, collection_id, dims, query, k=k, **options)
+        latencies.append(time.perf_counter() - start)
+        conn.rollback()
+        results.append({row[0] for row in rows})
+    return latencies, results
+
+
+def report(label, latencies, results=None, exact=None, k=None):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    recall = ""
+    if exact is not None:
+        recall = f"  recall@{k} {statistics.mean(len(r & e) / k for r, e in zip(results, exact)):.3f}"
+    print(f"{label:<22} p50 {p50:8.2f} ms  p95 {p95:8.2f} ms{recall}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dbname", required=True)
+    parser.add_argument("--host", default=os.environ.get("DB_HOST", "localhost"))
+    parser.add_argument("--collection", default="summaries")
+    parser.add_argument("--synthetic", type=int, metavar="ROWS", help="benchmark a synthetic collection of ROWS vectors")
+    parser.add_argument("--dims", type=int, default=256, help="dimensions of the synthetic vectors")
+    parser.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.02, help="standard deviation added to the query vectors")
+    parser.add_argument("--ef-search", default="40,100,200", help="HNSW ef_search values to compare")
+    parser.add_argument("--probes", default="1,10,30", help="IVFFlat probes values to compare")
+    parser.add_argument("--keep", action="store_true", help="keep the index (and the synthetic collection)")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=args.host,
+        dbname=args.dbname,
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        port="5432"
+    )
+    cur = conn.cursor()
+    collection = args.collection
+    if args.synthetic:
+        collection = SYNTHETIC_COLLECTION
+        start = time.perf_counter()
+        create_synthetic_collection(cur, args.synthetic, args.dims)
+        conn.commit()
+        print(f"synthetic collection with {args.synthetic} vectors loaded in {time.perf_counter() - start:.1f}s")
+
+    try:
+        collection_id = collection_uuid(cur, collection)
+        rows, dims = collection_size(cur, collection_id)
+        queries = query_vectors(cur, collection_id, args.queries, args.noise)
+        conn.rollback()
+        print(f"collection {collection}: {rows} vectors with {dims} dimensions, {len(queries)} queries, k={args.k}")
+
+        latencies, exact = run_queries(conn, collection_id, dims, queries, args.k, exact=True)
+        report("exact scan", latencies)
+
+        # the index is built CONCURRENTLY, outside a transaction
+        start = time.perf_counter()
+        conn.autocommit = True
+        print(ensure_vector_index(cur, collection, method=args.method, min_rows=0))
+        conn.autocommit = False
+        print(f"index built in {time.perf_counter() - start:.1f}s")
+
+        cast = vector_type(cur, dims)
+        cur.execute("EXPLAIN " + cur.mogrify(
+            f"SELECT id FROM langchain_pg_embedding WHERE collection_id = '{collection_id}' "
+            f"ORDER BY embedding::{cast} <=> %s::{cast} LIMIT %s", (str(queries[0]), args.k)
+        ).decode())
+        plan = "\n".join(line for line, in cur.fetchall())
+        conn.rollback()
+        if index_name(collection, args.method) not in plan:
+            print("warning: the index is not used by the search query:\n" + plan)
+
+        values = args.ef_search if args.method == "hnsw" else args.probes
+        option = "ef_search" if args.method == "hnsw" else "probes"
+        for value in (int(v) for v in values.split(",")):
+            latencies, results = run_queries(conn, collection_id, dims, queries, args.k, **{option: value})
+            report(f"{args.method} {option}={value}", latencies, results, exact, args.k)
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+        if not args.keep:
+            drop_vector_indexes(cur, collection)
+            if args.synthetic:
+                cur.execute("DELETE FROM langchain_pg_collection WHERE name = %s", (SYNTHETIC_COLLECTION,))
+            conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
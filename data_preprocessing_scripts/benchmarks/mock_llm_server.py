@@ -0,0 +1,133 @@
+# Local stand-in for the OpenAI chat completions API with configurable latency and rate
+# limits, for benchmarking the summarization offline. Answers 429 with Retry-After like
+# the real API once the requests or tokens of the last minute exceed the limits, and gets
+# slower when more than --capacity requests run at once. Standalone:
+#   python -m benchmarks.mock_llm_server --port 8099 --rpm 500 --tpm 200000 --latency 0.8
+# and point the OpenAI client at it with OPENAI_BASE_URL=http://localhost:8099/v1
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.events = deque()
+        self.tokens = 0
+        self.lock = threading.Lock()
+
+    # Returns 0 if the request is admitted, otherwise the seconds until it would fit
+    def admit(self, tokens):
+        with self.lock:
+            now = time.monotonic()
+            while self.events and self.events[0][0] <= now - 60:
+                self.tokens -= self.events.popleft()[1]
+            if self.requests_per_minute and len(self.events) >= self.requests_per_minute:
+                return self.events[0][0] + 60 - now
+            if self.tokens_per_minute and self.tokens + tokens > self.tokens_per_minute:
+                return self.events[0][0] + 60 - now if self.events else 1.0
+            self.events.append((now, tokens))
+            self.tokens += tokens
+            return 0
+
+
+def make_handler(limiter, latency, latency_per_token, capacity, answer_tokens, stats):
+    class MockChatCompletionsHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def _send(self, status, body, headers=()):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 4
+            wait = limiter.admit(prompt_tokens + answer_tokens)
+            if wait:
+                with stats["lock"]:
+                    stats["rate_limited"] += 1
+                self._send(429, {"error": {
+                    "message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded",
+                }}, [("Retry-After", str(max(1, math.ceil(wait))))])
+                return
+
+            with stats["lock"]:
+                stats["in_flight"] += 1
+                stats["requests"] += 1
+                load = max(1.0, stats["in_flight"] / capacity) if capacity else 1.0
+            try:
+                time.sleep((latency + latency_per_token * answer_tokens) * load * random.uniform(0.8, 1.2))
+            finally:
+                with stats["lock"]:
+                    stats["in_flight"] -= 1
+            self._send(200, {
+                "id": f"chatcmpl-mock-{time.monotonic_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "Zusammenfassung. " * (answer_tokens // 4)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": answer_tokens,
+                    "total_tokens": prompt_tokens + answer_tokens,
+                },
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockChatCompletionsHandler
+
+
+# Starts the server in a background thread; returns (server, stats)
+def start_server(port=0, rpm=500, tpm=200000, latency=0.8, latency_per_token=0.0, capacity=0, answer_tokens=200):
+    stats = {"lock": threading.Lock(), "requests": 0, "rate_limited": 0, "in_flight": 0}
+    handler = make_handler(RateLimiter(rpm, tpm), latency, latency_per_token, capacity, answer_tokens, stats)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--rpm", type=int, default=500, help="requests per minute before 429")
+    parser.add_argument("--tpm", type=int, default=200000, help="tokens per minute before 429")
+    parser.add_argument("--latency", type=float, default=0.8, help="base latency per request in seconds")
+    parser.add_argument("--latency-per-token", type=float, default=0.0)
+    parser.add_argument("--capacity", type=int, default=0, help="concurrent requests before latency grows (0: unlimited)")
+    parser.add_argument("--answer-tokens", type=int, default=200)
+    args = parser.parse_args()
+
+    server, stats = start_server(
+        args.port, args.rpm, args.tpm, args.latency, args.latency_per_token, args.capacity, args.answer_tokens
+    )
+    print(f"mock LLM server on http://127.0.0.1:{server.server_address[1]}/v1")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"{stats['requests']} requests, {stats['rate_limited']} rate limited")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
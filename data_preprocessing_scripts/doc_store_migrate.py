@@ -0,0 +1,32 @@
+import argparse
+import os
+import time
+from dotenv import load_dotenv
+
+from backend.doc_store import PostgresByteStore
+from backend.value_codec import CODECS, FINGERPRINTS, codec_by_name
+
+load_dotenv()
+
+parser = argparse.ArgumentParser(description="Werte im Dokumentspeicher (Tabelle bytestore) in ein anderes Format umschreiben, z.B. Pickle nach JSON")
+parser.add_argument("--dbname", default="production_turmbergbahn_large_embed_metadata", help="Vektordatenbank")
+parser.add_argument("--collection", default="original_chunks", help="Collection im Dokumentspeicher")
+parser.add_argument("--codec", choices=list(CODECS), default="json", help="Zielformat der Werte")
+parser.add_argument("--hashing", choices=[*FINGERPRINTS, "content-sha256"], default="blake2b", help="Prüfsumme, mit der value_hash der umgeschriebenen Einträge neu berechnet wird")
+parser.add_argument("--batch-size", type=int, default=1000, help="Anzahl Einträge pro Transaktion")
+args = parser.parse_args()
+
+connection_string = (
+    f"postgresql+psycopg://{os.getenv('DB_USER')}:"
+    f"{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/{args.dbname}"
+)
+store = PostgresByteStore(connection_string, args.collection, codec=codec_by_name(args.codec), hashing=args.hashing)
+
+# Nur Einträge, die noch nicht im Zielformat sind, werden gelesen und geschrieben; ein
+# abgebrochener Lauf kann einfach erneut gestartet werden
+start = time.perf_counter()
+total = 0
+for count in store.reencode_values(batch_size=args.batch_size):
+    total += count
+    print(f"{total} Einträge umgeschrieben ({total / (time.perf_counter() - start):.0f}/s)")
+print(f"Fertig: {total} Einträge der Collection {args.collection} im Format {args.codec}")
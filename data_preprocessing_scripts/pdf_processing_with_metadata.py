@@ -1,48 +1,59 @@
+import argparse
 import os
-import uuid
 import psycopg
 from dotenv import load_dotenv
 from typing import Any
 from pydantic import BaseModel
 
-# unstructured
-from unstructured.partition.pdf import partition_pdf
-
 # langchain (or your library equivalents)
 from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_postgres import PGVector
-from langchain_postgres.vectorstores import PGVector
-from langchain.retrievers.multi_vector import MultiVectorRetriever
 from langchain_core.stores import InMemoryStore
 
 # your custom imports
+from backend.chunk_ids import chunk_id
 from backend.doc_store import PostgresByteStore
+from backend.embedding_cache import CachedEmbeddings
+from backend.formatted_data import fetch_metadata
+from backend.indexed_vector_store import IndexedPGVector
+from backend.ingest_writer import IngestWriter
+from backend.partition_cache import PartitionCache
+from backend.pdf_partitioning import PARTITION_KWARGS, PartitionPool
+from backend.pipeline import Pipeline
+from backend.summary_cache import SummaryCache
+from backend.summary_scheduler import SummaryScheduler
+from backend.value_codec import CODECS, FINGERPRINTS, codec_by_name
+from backend.vector_index import drop_vector_indexes, ensure_vector_index
+from backend.processing_manifest import (
+    create_manifest_table,
+    file_digests,
+    metadata_hash,
+    pipeline_key,
+    processed_entries,
+    record_processed,
+    unprocessed_files,
+)
 
 load_dotenv()
 
 # Database connection
+VECTOR_DB = "production_turmbergbahn_large_embed_metadata"
 CONNECTION_STRING = (
     f"postgresql+psycopg://{os.getenv('DB_USER')}:"
-    f"{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/production_turmbergbahn_large_embed_metadata"
+    f"{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/{VECTOR_DB}"
 )
 
+CHAT_MODEL = "gpt-4o-mini"
+CHAT_TEMPERATURE = 0
+EMBEDDING_MODEL = "text-embedding-3-large"
+
 # Connection for the database with additional structured metadata
 # CONNECTION_STRING_STRUCTURED = (
 #     f"postgresql+psycopg://{os.getenv('DB_USER')}:"
 #     f"{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/ratsinformationssystem_structured_250129"
 # )
-structured_conn = psycopg.connect(
-    dbname="ratsinformationssystem_structured_250129",
-    user=os.getenv('DB_USER'),
-    password=os.getenv('DB_PASSWORD'),
-    host="localhost",
-    port="5432"
-)
-
-structured_cursor = structured_conn.cursor()
 
 # Folder containing PDFs
 path = r"C:\Users\mamac\Documents\Uni\8_Semester\Bachelorarbeit\Coding\Evaluation_Data\pdf_files\turmbergbahn_merged"
@@ -52,28 +63,13 @@ class Element(BaseModel):
     type: str
     text: Any
 
-# Initialize model and embeddings only once (outside the loop)
-model = ChatOpenAI(temperature=0, model="gpt-4o-mini")
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-
-# Create Vector Store and Doc Store once
-vector_store = PGVector(
-    embeddings=embeddings,
-    collection_name="summaries",
-    connection=CONNECTION_STRING
-)
-store = PostgresByteStore(CONNECTION_STRING, "original_chunks")
-
-# Create the MultiVectorRetriever
-id_key = "doc_id"
-retriever = MultiVectorRetriever(
-    vectorstore=vector_store,
-    docstore=store,
-    id_key=id_key,
-    search_type="similarity",
+# Columns of formatted_data_v2_turmbergbahn_extended added to the prompt and to the chunk metadata
+METADATA_FIELDS = (
+    "file_title", "reference", "paper_type", "role", "organization_name",
+    "agenda_item", "result", "meeting_date", "sitzungen", "file_type",
 )
 
-# Prepare the summarization chain
+# Prompt of the summarization chain
 prompt_text = """
 Du bist ein Assistent, der Tabellen und Texte unter Berücksichtigung von Metadaten zusammenfassen soll. Die Daten stammen aus einem Ratsinformationssystem.
 Du kannst folgenden Metadaten als Kontext für die Zusammenfassung verwenden. Falls eine Variable nicht verfügbar oder NULL ist, vernachlässige sie einfach.:
@@ -98,235 +94,311 @@ Antworte nur mit der Zusammenfassung, ohne zusätzlichen Kommentar.
 Beginne deine Nachricht nicht mit den Worten „Hier ist eine Zusammenfassung“ oder ähnlichem.
 Die Länge sollte optimalerweise 8 Sätze sein. Sollte der Text oder die Tabelle weniger Informationen enthalten, dann gib einfach so viele Sätze wieder, wie nötig sind.
 """
-prompt = ChatPromptTemplate.from_template(prompt_text)
-summarize_chain = prompt | model | StrOutputParser()
-
-# Get a list of all PDF files in the directory
-pdf_files = [f for f in os.listdir(path) if f.lower().endswith(".pdf")]
-
-print("Starting to process PDFs...")
-
-for pdf_file in pdf_files:
-    pdf_path = os.path.join(path, pdf_file)
-    print(f"\nProcessing file: {pdf_file}")
-
-    # Partition/Chunk the PDF
-    chunks = partition_pdf(
-        filename=pdf_path,
-        extract_images_in_pdf=False,
-        infer_table_structure=True,
-        chunking_strategy="by_title",
-        strategy="hi_res",
-        max_characters=4000,
-        new_after_n_chars=3800,
-        combine_text_under_n_chars=2000,
-        image_output_dir_path=path,
+
+# Everything that changes the result for the same PDF; part of the key of the processing manifest
+PIPELINE_KEY = pipeline_key(
+    partition=PARTITION_KWARGS, prompt=prompt_text, chat_model=CHAT_MODEL, chat_temperature=CHAT_TEMPERATURE,
+    embedding_model=EMBEDDING_MODEL
+)
+
+parser = argparse.ArgumentParser(description="PDFs partitionieren, zusammenfassen und mit Metadaten in den Vektor- und Dokumentspeicher schreiben")
+parser.add_argument("--path", default=path, help="Ordner mit den PDF-Dateien")
+parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Anzahl der Prozesse für das Partitionieren")
+parser.add_argument("--timeout", type=int, default=900, help="Maximale Sekunden für das Partitionieren einer PDF")
+parser.add_argument("--partition-cache", default="partition_cache", help="Ordner für die zwischengespeicherten Partitionierungsergebnisse (leer: kein Cache)")
+parser.add_argument("--summary-cache-max-entries", type=int, default=500000, help="Maximale Anzahl zwischengespeicherter Zusammenfassungen")
+parser.add_argument("--summary-cache-max-age", type=int, default=180, help="Zusammenfassungen, die so viele Tage nicht verwendet wurden, aus dem Cache löschen")
+parser.add_argument("--embedding-batch-size", type=int, default=500, help="Anzahl Zusammenfassungen (aus mehreren PDFs), die gemeinsam eingebettet und gespeichert werden")
+parser.add_argument("--rpm", type=int, default=500, help="Anfragen pro Minute an das Chat-Modell (Rate Limit des API-Kontos)")
+parser.add_argument("--tpm", type=int, default=200000, help="Tokens pro Minute an das Chat-Modell (Rate Limit des API-Kontos)")
+parser.add_argument("--max-concurrency", type=int, default=64, help="Obergrenze gleichzeitiger Anfragen für die Zusammenfassungen")
+parser.add_argument("--latency-target", type=float, default=20.0, help="Sekunden pro Zusammenfassung, ab denen die Parallelität gesenkt wird (gleitender Mittelwert; 0: kein Ziel)")
+parser.add_argument("--summary-workers", type=int, default=8, help="Anzahl PDFs, die gleichzeitig zusammengefasst werden")
+parser.add_argument("--queue-size", type=int, default=4, help="Maximale Anzahl PDFs in jeder Warteschlange zwischen zwei Verarbeitungsschritten")
+parser.add_argument("--vector-index", choices=["hnsw", "ivfflat", "none"], default="hnsw", help="ANN-Index über die Vektoren der Zusammenfassungen (none: Index löschen, exakte Suche)")
+parser.add_argument("--hnsw-m", type=int, help="HNSW-Parameter m (Standard: abhängig von der Anzahl Vektoren)")
+parser.add_argument("--hnsw-ef-construction", type=int, help="HNSW-Parameter ef_construction (Standard: abhängig von m)")
+parser.add_argument("--ivfflat-lists", type=int, help="IVFFlat-Parameter lists (Standard: abhängig von der Anzahl Vektoren)")
+parser.add_argument("--index-rebuild-growth", type=float, default=2.0, help="Index neu aufbauen, wenn die Anzahl Vektoren seit dem letzten Aufbau um diesen Faktor gewachsen ist")
+parser.add_argument("--docstore-codec", choices=list(CODECS), default="json", help="Format der Chunks im Dokumentspeicher (json+zstd: komprimiert, benötigt zstandard; pickle: bisheriges Format)")
+parser.add_argument("--docstore-hashing", choices=[*FINGERPRINTS, "content-sha256"], default="blake2b", help="Prüfsumme der Chunks im Dokumentspeicher (blake2b/xxh3: über Inhalt und Metadaten; content-sha256: nur über den Inhalt, bisheriges Verhalten)")
+parser.add_argument("--force", action="store_true", help="Auch bereits verarbeitete PDFs erneut verarbeiten")
+parser.add_argument("--list-new", action="store_true", help="Nur die noch nicht verarbeiteten PDFs der Tabelle 'file' anzeigen (anhand der OParl-Prüfsummen)")
+
+
+# Every pipeline stage writing to the vector database gets its own connection, so the
+# transactions of the stages do not interfere
+def connect_vector_db(autocommit=False):
+    return psycopg.connect(
+        dbname=VECTOR_DB,
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        host=os.getenv('DB_HOST'),
+        port="5432",
+        autocommit=autocommit,
     )
-    
-    # Fetch additional metadata from the structured database
-    structured_cursor.execute(
-        """
-        SELECT file_title, reference, paper_type, role, organization_name, 
-               agenda_item, result, meeting_date, sitzungen, file_type
-        FROM formatted_data_v2_turmbergbahn_extended
-        WHERE pdf_name = %s
-        LIMIT 1
-        """,
-        (pdf_file,)  # oder (pdf_file.replace('.pdf', ''),) wenn in DB ohne .pdf gespeichert
+
+
+def main():
+    args = parser.parse_args()
+
+    structured_conn = psycopg.connect(
+        dbname="ratsinformationssystem_structured_250129",
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        host="localhost",
+        port="5432"
+    )
+
+    structured_cursor = structured_conn.cursor()
+
+    # Processing manifest in the vector database: PDFs (by SHA-256) already processed with this configuration
+    manifest_conn = connect_vector_db()
+    manifest_cursor = manifest_conn.cursor()
+    create_manifest_table(manifest_cursor)
+    manifest_conn.commit()
+
+    if args.list_new:
+        for file_name, download_url in unprocessed_files(structured_cursor, manifest_cursor, PIPELINE_KEY):
+            print(f"{file_name}\t{download_url}")
+        return
+
+    # Initialize model and embeddings only once (outside the loop)
+    # Retries happen in the scheduler, which also lowers the concurrency on 429
+    model = ChatOpenAI(temperature=CHAT_TEMPERATURE, model=CHAT_MODEL, max_retries=0)
+    # Embeddings of summaries embedded before (same text and model) come from the cache
+    embedding_conn = connect_vector_db()
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(model=EMBEDDING_MODEL), embedding_conn, EMBEDDING_MODEL)
+    embeddings.create_table()
+
+    # Create Vector Store and Doc Store once (creates their tables and the collection); they
+    # are read by the MultiVectorRetriever of the assistant with id_key "doc_id", which has
+    # to use IndexedPGVector as well for its searches to use the ANN index
+    IndexedPGVector(
+        embeddings=embeddings,
+        collection_name="summaries",
+        connection=CONNECTION_STRING
+    )
+    store = PostgresByteStore(CONNECTION_STRING, "original_chunks", codec=codec_by_name(args.docstore_codec),
+                              hashing=args.docstore_hashing)
+    id_key = "doc_id"
+
+    # Prepare the summarization chain
+    prompt = ChatPromptTemplate.from_template(prompt_text)
+    summarize_chain = prompt | model | StrOutputParser()
+    scheduler = SummaryScheduler(
+        summarize_chain, requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+        max_concurrency=args.max_concurrency, latency_target=args.latency_target or None,
     )
-    structured_row = structured_cursor.fetchone()
+
+    # Summaries of identical chunks (same prompt, metadata, content and model) come from the cache
+    summary_cache = SummaryCache(
+        connect_vector_db, prompt_text, CHAT_MODEL, CHAT_TEMPERATURE,
+        max_entries=args.summary_cache_max_entries, max_age_days=args.summary_cache_max_age,
+    )
+    summary_cache.create_table()
+    print(f"Evicted {summary_cache.evict()} cached summaries")
+
+    # Staged pipeline: discover -> partition -> metadata -> summarize -> embed -> store.
+    # The stages run concurrently and pass PDFs on through bounded queues (see backend/pipeline.py)
+
+    # Metadata of all PDFs in the folder, fetched from the structured database in one query
+    pdf_names = [f for f in os.listdir(args.path) if f.lower().endswith(".pdf")]
+    metadata_by_pdf = fetch_metadata(structured_cursor, pdf_names, METADATA_FIELDS)
+    structured_conn.commit()
+    print(f"Metadata found for {len(metadata_by_pdf)} of {len(pdf_names)} PDFs")
 
     # structured_row kann None sein, wenn kein Treffer in DB
-    file_title = None
-    reference = None
-    paper_type = None
-    role = None
-    organization_name = None
-    agenda_item = None
-    result = None
-    meeting_date = None
-
-    if structured_row:
-        (
-            file_title, 
-            reference, 
-            paper_type, 
-            role, 
-            organization_name, 
-            agenda_item, 
-            result, 
-            meeting_date,
-            sitzungen,
-            file_type
-        ) = structured_row
-
-    # Explicitly ensure all values are strings
-    # metadata = {
-    #     "file_title": str(file_title),
-    #     "reference": str(reference),
-    #     "paper_type": str(paper_type),
-    #     "role": str(role),
-    #     "organization_name": str(organization_name),
-    #     "agenda_item": str(agenda_item),
-    #     "result": str(result),
-    #     "meeting_date": str(meeting_date),
-    #     "sitzungen": str(sitzungen),
-    #     "file_type": str(file_type),
-    # }
-    # # Debugging print to check metadata before summarization
-    # print("\nDEBUG: Metadata for", pdf_file)
-    # print(metadata)
-
-
-    # Set a synthetic URL (if needed) for each chunk
-    for chunk in chunks:
-        # Adjust URL, or store any metadata you want
-        chunk.metadata.url = (
-            "https://web1.karlsruhe.de/ris/oparl/bodies/0001/downloadfiles/a/"
-            f"{pdf_file}"
-        )
-        # Also keep track of the actual filename for reference
-        chunk.metadata.filename = pdf_file
-
-    # Separate tables from texts
-    tables, texts = [], []
-    for chunk in chunks:
-        chunk_type = str(type(chunk))
-        if "Table" in chunk_type:
-            tables.append(chunk)
-        elif "CompositeElement" in chunk_type:
-            texts.append(chunk)
-
-    # Summarize text chunks
-    if texts:
-        text_summaries = summarize_chain.batch(
-            [
-                {
-                    "element": text.text,
-                    "file_title": file_title or "",
-                    "reference": reference or "",
-                    "paper_type": paper_type or "",
-                    "role": role or "",
-                    "organization_name": organization_name or "",
-                    "agenda_item": agenda_item or "",
-                    "result": result or "",
-                    "meeting_date": meeting_date or "",
-                    "sitzungen": sitzungen or "",
-                    "file_type": file_type or "",
-                }
-                for text in texts
-            ],
-            {"max_concurrency": 3}  # Tuning je nach Bedarf
-        )
-    else:
-        text_summaries = []
-
-
-    # Summarize table chunks
-    if tables:
-        table_summaries = summarize_chain.batch(
-            [
-                {
-                    "element": table.metadata.text_as_html,
-                    "file_title": file_title or "",
-                    "reference": reference or "",
-                    "paper_type": paper_type or "",
-                    "role": role or "",
-                    "organization_name": organization_name or "",
-                    "agenda_item": agenda_item or "",
-                    "result": result or "",
-                    "meeting_date": meeting_date or "",
-                    "sitzungen": sitzungen or "",
-                    "file_type": file_type or "",
-                }
-                for table in tables
-            ],
-            {"max_concurrency": 3}
-        )
-    else:
-        table_summaries = []
-
-
-    # Convert text chunks into Documents
-    text_documents = [
-        Document(
-            page_content=text.text,
-            metadata={
-                "url": text.metadata.url,
-                "filename": text.metadata.filename,
-                "file_title": file_title,
-                "reference": reference,
-                "paper_type": paper_type,
-                "role": role,
-                "organization_name": organization_name,
-                "agenda_item": agenda_item,
-                "result": result,
-                "meeting_date": meeting_date,
-                "sitzungen": sitzungen,
-                "file_type": file_type,
-            },
-        )
-        for text in texts
-    ]
-
-    # Convert table chunks into Documents
-    table_documents = [
-        Document(
-            page_content=table.metadata.text_as_html,
-            metadata={
-                "url": table.metadata.url,
-                "filename": table.metadata.filename,
-                "file_title": file_title,
-                "reference": reference,
-                "paper_type": paper_type,
-                "role": role,
-                "organization_name": organization_name,
-                "agenda_item": agenda_item,
-                "result": result,
-                "meeting_date": meeting_date,
-                "sitzungen": sitzungen,
-                "file_type": file_type,                
-            },
-        )
-        for table in tables
-    ]
-
-    # Insert summarized texts into the vector store + doc store
-    if text_documents:
-        doc_ids = [str(uuid.uuid4()) for _ in text_documents]
-        summary_text_docs = [
-            Document(page_content=summary, metadata={id_key: doc_ids[i]})
-            for i, summary in enumerate(text_summaries)
-        ]
-        # Add summary vectors
-        retriever.vectorstore.add_documents(summary_text_docs)
-        # Link doc IDs to original text documents
-        retriever.docstore.mset(
-            list(zip(doc_ids, text_documents, ["test"] * len(doc_ids)))
-        )
-
-    # Insert summarized tables into the vector store + doc store
-    if table_documents:
-        table_ids = [str(uuid.uuid4()) for _ in table_documents]
-        summary_table_docs = [
-            Document(page_content=summary, metadata={id_key: table_ids[i]})
-            for i, summary in enumerate(table_summaries)
-        ]
-        # Add summary vectors
-        retriever.vectorstore.add_documents(summary_table_docs)
-        # Link doc IDs to original table documents
-        retriever.docstore.mset(
-            list(zip(table_ids, table_documents, ["test"] * len(table_ids)))
-        )
-
-    print(f"Finished processing: {pdf_file}")
-
-
-# Bei größeren Datenmengen hier noch einen Index über die Vektoren erzeugen 
-
-
-
-structured_cursor.close()
-structured_conn.close()
-
-print("All PDFs processed.")
+    def pdf_metadata(pdf_file):
+        structured_row = metadata_by_pdf.get(pdf_file)
+        return dict(zip(METADATA_FIELDS, structured_row or (None,) * len(METADATA_FIELDS)))
+
+    # PDFs processed before with the same content, name, metadata and configuration are
+    # skipped; a metadata change goes through the whole pipeline again, since the
+    # summaries depend on it (unchanged chunks and summaries come from the caches)
+    processed = set() if args.force else processed_entries(manifest_cursor, PIPELINE_KEY)
+    digests = {}
+    skipped = 0
+
+    def discover():
+        nonlocal skipped
+        for pdf_file in sorted(os.listdir(args.path)):
+            if not pdf_file.lower().endswith(".pdf"):
+                continue
+            pdf_path = os.path.join(args.path, pdf_file)
+            file_digest = file_digests(pdf_path)
+            if (file_digest.sha256, pdf_file, metadata_hash(pdf_metadata(pdf_file))) in processed:
+                skipped += 1
+                continue
+            digests[pdf_path] = file_digest
+            # the digest goes along, so the partition cache does not hash the PDF again
+            yield pdf_path, file_digest.sha256
+
+    # Partition/Chunk the PDFs in worker processes; every PDF is passed on as soon as its chunks are ready
+    # Chunks of PDFs partitioned before with the same parameters are read from the cache instead
+    cache = PartitionCache(args.partition_cache) if args.partition_cache else None
+    pool = PartitionPool(workers=args.workers, timeout=args.timeout, cache=cache)
+
+    def partition(pdf_paths):
+        for partitioned in pool.partition(pdf_paths):
+            if partitioned.error:
+                print(f"Skipping file: {os.path.basename(partitioned.pdf_path)} ({partitioned.error})")
+                continue
+            yield partitioned
+
+    def join_metadata(partitioned_files):
+        for partitioned in partitioned_files:
+            pdf_file = os.path.basename(partitioned.pdf_path)
+            chunks = partitioned.chunks
+            metadata = pdf_metadata(pdf_file)
+
+            # Set a synthetic URL (if needed) for each chunk
+            for chunk in chunks:
+                # Adjust URL, or store any metadata you want
+                chunk.metadata.url = (
+                    "https://web1.karlsruhe.de/ris/oparl/bodies/0001/downloadfiles/a/"
+                    f"{pdf_file}"
+                )
+                # Also keep track of the actual filename for reference
+                chunk.metadata.filename = pdf_file
+
+            # Separate tables from texts
+            tables, texts = [], []
+            for chunk in chunks:
+                chunk_type = str(type(chunk))
+                if "Table" in chunk_type:
+                    tables.append(chunk)
+                elif "CompositeElement" in chunk_type:
+                    texts.append(chunk)
+
+            yield {"pdf_path": partitioned.pdf_path, "texts": texts, "tables": tables, "metadata": metadata}
+
+    # Several PDFs are summarized at the same time, so the scheduler always has requests
+    # of more than one PDF to send
+    def summarize(pdfs):
+        for pdf in pdfs:
+            metadata = pdf["metadata"]
+            texts, tables = pdf["texts"], pdf["tables"]
+            # Summarize text and table chunks in one batch; the scheduler sends as many requests
+            # at once as the rate limits allow
+            metadata_inputs = {field: value or "" for field, value in metadata.items()}
+            summaries = summary_cache.summarize(
+                scheduler,
+                [{"element": text.text, **metadata_inputs} for text in texts]
+                + [{"element": table.metadata.text_as_html, **metadata_inputs} for table in tables],
+            )
+
+            # Original text and table chunks as Documents for the doc store, summaries for the vector store
+            documents = [
+                Document(
+                    page_content=chunk.text if i < len(texts) else chunk.metadata.text_as_html,
+                    metadata={"url": chunk.metadata.url, "filename": chunk.metadata.filename, **metadata},
+                )
+                for i, chunk in enumerate(texts + tables)
+            ]
+            # Deterministic IDs: processing a PDF again overwrites its rows instead of adding copies
+            pdf_file = os.path.basename(pdf["pdf_path"])
+            doc_ids = [chunk_id(pdf_file, i, document.page_content) for i, document in enumerate(documents)]
+            pdf["summaries"] = [
+                Document(page_content=summary, metadata={id_key: doc_ids[i]})
+                for i, summary in enumerate(summaries)
+            ]
+            pdf["documents"] = list(zip(doc_ids, documents, [pdf_file] * len(doc_ids)))
+            del pdf["texts"], pdf["tables"]
+            yield pdf
+
+    # Summaries of several PDFs are embedded together, in batches of about --embedding-batch-size
+    def embed(pdfs):
+        batch, size = [], 0
+        for pdf in pdfs:
+            batch.append(pdf)
+            size += len(pdf["summaries"])
+            if size >= args.embedding_batch_size:
+                yield embed_batch(batch)
+                batch, size = [], 0
+        if batch:
+            yield embed_batch(batch)
+
+    def embed_batch(batch):
+        summaries = [summary for pdf in batch for summary in pdf["summaries"]]
+        vectors = embeddings.embed_documents([summary.page_content for summary in summaries])
+        return batch, summaries, vectors
+
+    # Chunks, summary vectors, removal of chunks of an earlier version of the PDF and the
+    # manifest entry are written in one transaction per PDF (see backend/ingest_writer.py)
+    ingest_writer = IngestWriter(manifest_cursor, store, "summaries", id_key=id_key)
+    manifest_conn.commit()
+
+    def store_files(batches):
+        for batch, summaries, vectors in batches:
+            offset = 0
+            for pdf in batch:
+                pdf_file = os.path.basename(pdf["pdf_path"])
+                count = len(pdf["summaries"])
+                try:
+                    stale = ingest_writer.write_file(
+                        manifest_cursor, pdf_file, pdf["documents"], pdf["summaries"], vectors[offset:offset + count]
+                    )
+                    record_processed(
+                        manifest_cursor, pdf_file, digests[pdf["pdf_path"]], PIPELINE_KEY, len(pdf["documents"]),
+                        metadata_hash(pdf["metadata"]),
+                    )
+                    manifest_conn.commit()
+                except Exception:
+                    manifest_conn.rollback()
+                    raise
+                offset += count
+                if stale:
+                    print(f"Removed {stale} stale chunks of {pdf_file}")
+                print(f"Finished processing: {pdf_file}")
+                yield pdf["pdf_path"]
+
+    print("Starting to process PDFs...")
+    pipeline = (
+        Pipeline(queue_size=args.queue_size)
+        .stage("discover", discover)
+        .stage("partition", partition)
+        .stage("metadata", join_metadata)
+        .stage("summarize", summarize, workers=args.summary_workers)
+        .stage("embed", embed)
+        .stage("store", store_files)
+    )
+    try:
+        stage_stats = pipeline.run()
+    finally:
+        scheduler.close()
+
+    manifest_conn.commit()
+
+    # ANN index over the summary vectors, created once the collection is large enough and
+    # rebuilt when it has grown by --index-rebuild-growth (see backend/vector_index.py).
+    # Built CONCURRENTLY on a connection of its own in autocommit mode, outside any write
+    # transaction, so the vector store stays writable during the build.
+    with connect_vector_db(autocommit=True) as index_conn, index_conn.cursor() as index_cursor:
+        if args.vector_index == "none":
+            drop_vector_indexes(index_cursor, "summaries")
+        else:
+            print(ensure_vector_index(
+                index_cursor, "summaries", method=args.vector_index, m=args.hnsw_m,
+                ef_construction=args.hnsw_ef_construction, lists=args.ivfflat_lists,
+                rebuild_growth=args.index_rebuild_growth,
+            ))
+
+    structured_cursor.close()
+    structured_conn.close()
+    manifest_cursor.close()
+    manifest_conn.close()
+    summary_cache.close()
+    embedding_conn.close()
+
+    print(f"{skipped} PDFs unchanged since the last run")
+    for stats in stage_stats:
+        print(stats)
+    print(scheduler.stats())
+    print(summary_cache.stats())
+    print(embeddings.stats())
+    print("All PDFs processed.")
+
+
+if __name__ == "__main__":
+    main()
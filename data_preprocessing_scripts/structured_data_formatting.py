@@ -1,10 +1,16 @@
+import argparse
 import psycopg2
-import json
 import os 
 from dotenv import load_dotenv
 
+from backend.formatted_data import create_formatted_table, refresh_formatted_table
+
 load_dotenv()
 
+parser = argparse.ArgumentParser(description="Metadaten-Tabelle aus den strukturierten OParl-Daten erstellen bzw. aktualisieren")
+parser.add_argument("--full", action="store_true", help="Tabelle vollständig neu aufbauen statt nur geänderte Dateien neu zu berechnen")
+args = parser.parse_args()
+
 # Verbindung zur PostgreSQL-Datenbank herstellen
 conn = psycopg2.connect(
     host="localhost",
@@ -16,152 +22,22 @@ conn = psycopg2.connect(
 
 cur = conn.cursor()
 
+# Erstellt die View mit der Abfrage, die Metadaten-Tabelle und die Tabelle mit dem Stand der letzten Aktualisierung
 def create_tables():
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS formatted_data_v2_turmbergbahn_extended AS
-    SELECT        
-        'paper_file' AS file_type,
-        file.file_name AS pdf_name,
-        file.name AS file_title,
-        file.access_url AS access_url,
-        paper.reference AS reference,
-        paper.paper_type AS paper_type,
-        ARRAY_AGG(consultation.role) AS role,
-        ARRAY_AGG(organization.name) AS organization_name,
-        paper.name AS agenda_item,
-        ARRAY_AGG(agenda_item.result) AS result,
-        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date) AS meeting_date,
-        STRING_AGG(
-            organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', '
-        ) AS sitzungen
-    FROM file
-    LEFT JOIN paper ON file.paper_id[1] = paper.paper_id
-    LEFT JOIN consultation ON paper.paper_id = consultation.paper_id
-    LEFT JOIN organization ON consultation.organization_id[1] = organization.organization_id
-    LEFT JOIN agenda_item ON consultation.agenda_item_id = agenda_item.agenda_item_id
-    LEFT JOIN meeting ON agenda_item.meeting_id = meeting.meeting_id
-    WHERE paper.paper_id IS NOT NULL
-    GROUP BY file.file_name, file.name, file.access_url, paper.reference, paper.paper_type, paper.name
-
-    UNION
-
-    SELECT        
-        'agenda_item_auxiliary_file' AS file_type,
-        file.file_name AS pdf_name,
-        file.name AS file_title,
-        file.access_url AS access_url,
-        NULL AS reference,
-        NULL AS paper_type,
-        NULL AS role,
-        ARRAY_AGG(organization.name) AS organization_name,
-        agenda_item.name AS agenda_item,
-        ARRAY_AGG(agenda_item.result) AS result,
-        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date) AS meeting_date,
-        STRING_AGG(
-            organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', '
-        ) AS sitzungen
-    FROM file
-    LEFT JOIN agenda_item ON file.file_id = ANY(agenda_item.auxiliary_file_id)  -- Array-Join
-    LEFT JOIN meeting ON agenda_item.meeting_id = meeting.meeting_id
-    LEFT JOIN organization ON meeting.organization[1] = organization.organization_id
-    WHERE agenda_item.auxiliary_file_id IS NOT NULL
-    GROUP BY file.file_name, file.name, file.access_url, agenda_item.name
-    
-    UNION
-
-    SELECT        
-        'meeting_auxiliary_file' AS file_type,
-        file.file_name AS pdf_name,
-        file.name AS file_title,
-        file.access_url AS access_url,
-        NULL AS reference,
-        NULL AS paper_type,
-        NULL AS role,
-        ARRAY_AGG(organization.name) AS organization_name,
-        NULL AS agenda_item,
-        NULL AS result,
-        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date) AS meeting_date,
-        STRING_AGG(
-            organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', '
-        ) AS sitzungen
-    FROM file
-    LEFT JOIN meeting ON file.file_id = ANY(meeting.auxiliary_file)  -- Array-Join
-    LEFT JOIN organization ON meeting.organization[1] = organization.organization_id
-    WHERE meeting.auxiliary_file IS NOT NULL 
-    GROUP BY file.file_name, file.name, file.access_url
-    
-    UNION
-
-    SELECT        
-        'verbatim_protocol_file' AS file_type,
-        file.file_name AS pdf_name,
-        file.name AS file_title,
-        file.access_url AS access_url,
-        NULL AS reference,
-        NULL AS paper_type,
-        NULL AS role,
-        ARRAY_AGG(organization.name) AS organization_name,
-        NULL AS agenda_item,
-        NULL AS result,
-        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date) AS meeting_date,
-        STRING_AGG(
-            organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', '
-        ) AS sitzungen
-    FROM file
-    LEFT JOIN meeting ON file.file_id = meeting.verbatim_protocol_id  -- Array-Join
-    LEFT JOIN organization ON meeting.organization[1] = organization.organization_id
-    WHERE meeting.verbatim_protocol_id IS NOT NULL 
-    GROUP BY file.file_name, file.name, file.access_url
-
-    UNION
-
-    SELECT        
-        'results_protocol_file' AS file_type,
-        file.file_name AS pdf_name,
-        file.name AS file_title,
-        file.access_url AS access_url,
-        NULL AS reference,
-        NULL AS paper_type,
-        NULL AS role,
-        ARRAY_AGG(organization.name) AS organization_name,
-        NULL AS agenda_item,
-        NULL AS result,
-        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date) AS meeting_date,
-        STRING_AGG(
-            organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', '
-        ) AS sitzungen
-    FROM file
-    LEFT JOIN meeting ON file.file_id = meeting.results_protocol_id  -- Array-Join
-    LEFT JOIN organization ON meeting.organization[1] = organization.organization_id
-    WHERE meeting.results_protocol_id IS NOT NULL 
-    GROUP BY file.file_name, file.name, file.access_url
-    
-    UNION
+    create_formatted_table(cur)
+    conn.commit()
+    print("Table created successfully")
 
-    SELECT        
-        'invitation_file' AS file_type,
-        file.file_name AS pdf_name,
-        file.name AS file_title,
-        file.access_url AS access_url,
-        NULL AS reference,
-        NULL AS paper_type,
-        NULL AS role,
-        ARRAY_AGG(organization.name) AS organization_name,
-        NULL AS agenda_item,
-        NULL AS result,
-        ARRAY_AGG(TO_TIMESTAMP(TO_CHAR(meeting.start, 'YYYY-MM-DD'), 'YYYY-MM-DD')::date) AS meeting_date,
-        STRING_AGG(
-            organization.name || ' (' || TO_CHAR(meeting.start, 'DD.MM.YYYY') || ')', ', '
-        ) AS sitzungen
-    FROM file
-    LEFT JOIN meeting ON file.file_id = meeting.invitation_id  -- Array-Join
-    LEFT JOIN organization ON meeting.organization[1] = organization.organization_id
-    WHERE meeting.invitation_id IS NOT NULL
-    GROUP BY file.file_name, file.name, file.access_url
 
-    """)
+# Aktualisiert nur die Zeilen der Dateien, deren Quelldaten sich seit der letzten Aktualisierung geändert haben.
+# Die Tabelle bleibt währenddessen lesbar, die Änderungen werden mit einem Commit sichtbar.
+def refresh_tables(full=False):
+    recomputed = refresh_formatted_table(cur, full=full)
     conn.commit()
-    print("Table created successfully")
+    if recomputed is None:
+        print("Table rebuilt completely")
+    else:
+        print(f"Table refreshed, {recomputed} files recomputed")
 
 
 def create_primary_key():
@@ -174,6 +50,7 @@ def create_primary_key():
     print("Primärschlüssel für 'formatted_data' hinzugefügt.")
 
 
-# Tabelle erstellen
+# Tabelle erstellen und aktualisieren
 create_tables()
+refresh_tables(full=args.full)
 # create_primary_key
\ No newline at end of file
@@ -0,0 +1,40 @@
+import os
+
+import psycopg2
+import pytest
+from psycopg.conninfo import conninfo_to_dict
+from sqlalchemy.engine import URL
+
+
+# Tests that need PostgreSQL run in a scratch schema of the database given by
+# TEST_DATABASE_URL (a libpq connection string, e.g. "dbname=ris_test user=postgres");
+# without it they are skipped
+@pytest.fixture
+def pg_cursor():
+    conninfo = os.environ.get("TEST_DATABASE_URL")
+    if not conninfo:
+        pytest.skip("TEST_DATABASE_URL not set")
+    conn = psycopg2.connect(conninfo)
+    cur = conn.cursor()
+    cur.execute("DROP SCHEMA IF EXISTS pytest_scratch CASCADE; CREATE SCHEMA pytest_scratch; SET search_path TO pytest_scratch")
+    conn.commit()
+    try:
+        yield cur
+    finally:
+        conn.rollback()
+        cur.execute("DROP SCHEMA IF EXISTS pytest_scratch CASCADE")
+        conn.commit()
+        cur.close()
+        conn.close()
+
+
+# SQLAlchemy URL (psycopg 3, usable by sync and async engines) of the same scratch schema
+@pytest.fixture
+def pg_url(pg_cursor):
+    params = conninfo_to_dict(os.environ["TEST_DATABASE_URL"])
+    query = {name: str(params[name]) for name in ("host", "port") if name in params}
+    query["options"] = "-csearch_path=pytest_scratch"
+    return URL.create(
+        "postgresql+psycopg", username=params.get("user"), password=params.get("password"),
+        database=params.get("dbname"), query=query,
+    )
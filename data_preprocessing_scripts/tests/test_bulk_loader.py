@@ -0,0 +1,51 @@
+from backend.bulk_loader import BulkUpsert
+
+COLUMNS = "paper_id, name, keyword, modified"
+
+
+def create_paper_table(cur):
+    cur.execute("""
+    CREATE TABLE paper (
+        paper_id VARCHAR(255) PRIMARY KEY,
+        name TEXT,
+        keyword TEXT[],
+        modified TIMESTAMPTZ,
+        loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """)
+
+
+def rows_with_versions(cur):
+    cur.execute("SELECT paper_id, name, keyword, xmin::TEXT, loaded_at FROM paper ORDER BY paper_id")
+    return {row[0]: row[1:] for row in cur.fetchall()}
+
+
+PAGE = [
+    ("p1", "Vorlage\t1\nmit Zeilenumbruch", ["Verkehr", 'Zitat "a"'], "2025-01-29T10:00:00+01:00"),
+    ("p2", "Vorlage C:\\Pfad", None, "2025-01-29T10:00:00+01:00"),
+    ("p3", None, ["Bau", None], "2025-01-29T10:00:00+01:00"),
+]
+
+
+# Loading the same page again only rewrites the row whose 'modified' changed; an object
+# listed twice in one batch is merged once, with its latest version
+def test_reloaded_page_only_updates_modified_rows(pg_cursor):
+    cur = pg_cursor
+    create_paper_table(cur)
+    upsert = BulkUpsert("paper", "paper_id", COLUMNS)
+    assert upsert(cur, PAGE) == 3
+    cur.connection.commit()
+    before = rows_with_versions(cur)
+    assert before["p1"][:2] == ("Vorlage\t1\nmit Zeilenumbruch", ["Verkehr", 'Zitat "a"'])
+    assert before["p2"][:2] == ("Vorlage C:\\Pfad", None)
+    assert before["p3"][:2] == (None, ["Bau", None])
+
+    changed = ("p2", "Vorlage 2 (geändert)", None, "2025-02-01T10:00:00+01:00")
+    outdated = ("p2", "Vorlage 2 (alt)", None, "2025-01-01T10:00:00+01:00")
+    assert upsert(cur, [PAGE[0], outdated, changed, PAGE[2]]) == 1
+    cur.connection.commit()
+    after = rows_with_versions(cur)
+    assert after["p1"] == before["p1"]
+    assert after["p3"] == before["p3"]
+    assert after["p2"][0] == "Vorlage 2 (geändert)"
+    assert after["p2"][3] > before["p2"][3]
@@ -0,0 +1,85 @@
+import asyncio
+
+from langchain_core.documents import Document
+
+from backend.doc_store import PostgresByteStore
+
+
+def chunk(text, page=1):
+    return Document(page_content=text, metadata={"filename": "anlage_1.pdf", "page_number": page})
+
+
+def store_at(url):
+    return PostgresByteStore(url.render_as_string(hide_password=False), "original_chunks")
+
+
+def close(store):
+    store.Session.remove()
+    store.engine.dispose()
+    asyncio.run(store.async_engine.dispose())
+
+
+def first_batch():
+    return [("c1", chunk("Text 1"), "anlage_1.pdf"), ("c2", chunk("Text 2"), "anlage_1.pdf"), ("c3", chunk("Text 3"), "anlage_1.pdf")]
+
+
+# The second version of anlage_1.pdf keeps c1, changes c2 (metadata only), drops c3 and
+# adds c4; the chunks of anlage_2.pdf are not touched
+def second_batch():
+    return [
+        ("c1", chunk("Text 1"), "anlage_1.pdf"),
+        ("c2", chunk("Text 2", page=2), "anlage_1.pdf"),
+        ("c4", chunk("Text 4"), "anlage_1.pdf"),
+    ]
+
+
+def check_second_version(store, report):
+    assert sorted(report) == [("c1", "SKIP"), ("c2", "UPD"), ("c3", "DEL"), ("c4", "INS")]
+    assert store.mget(["c1", "c2", "c3", "c4", "o1"]) == [
+        chunk("Text 1"), chunk("Text 2", page=2), None, chunk("Text 4"), chunk("Anderes"),
+    ]
+
+
+def test_conditional_mset_writes_only_changes(pg_url):
+    store = store_at(pg_url)
+    try:
+        store.mset([("o1", chunk("Anderes"), "anlage_2.pdf")])
+        assert sorted(store.conditional_mset(first_batch())) == [("c1", "INS"), ("c2", "INS"), ("c3", "INS")]
+        assert sorted(store.conditional_mset(first_batch())) == [("c1", "SKIP"), ("c2", "SKIP"), ("c3", "SKIP")]
+        check_second_version(store, store.conditional_mset(second_batch()))
+    finally:
+        close(store)
+
+
+def test_aconditional_mset_matches_conditional_mset(pg_url):
+    store = store_at(pg_url)
+
+    async def run():
+        first = await store.aconditional_mset(first_batch())
+        again = await store.aconditional_mset(first_batch())
+        return first, again, await store.aconditional_mset(second_batch())
+
+    try:
+        store.mset([("o1", chunk("Anderes"), "anlage_2.pdf")])
+        first, again, second = asyncio.run(run())
+        assert sorted(first) == [("c1", "INS"), ("c2", "INS"), ("c3", "INS")]
+        assert sorted(again) == [("c1", "SKIP"), ("c2", "SKIP"), ("c3", "SKIP")]
+        check_second_version(store, second)
+    finally:
+        close(store)
+
+
+# An unchanged value is not written: the row keeps its physical version
+def test_unchanged_value_is_not_rewritten(pg_cursor, pg_url):
+    store = store_at(pg_url)
+    try:
+        store.conditional_mset(first_batch())
+        pg_cursor.execute("SELECT key, xmin::TEXT FROM bytestore ORDER BY key")
+        before = pg_cursor.fetchall()
+        pg_cursor.connection.commit()
+        store.conditional_mset(first_batch())
+        pg_cursor.execute("SELECT key, xmin::TEXT FROM bytestore ORDER BY key")
+        assert pg_cursor.fetchall() == before
+        pg_cursor.connection.commit()
+    finally:
+        close(store)
@@ -0,0 +1,71 @@
+from backend.oparl_schema import AGENDA_ITEM, backfill_links, schema_ddl
+
+BASE = "https://web1.karlsruhe.de/ris/oparl/bodies/0001"
+
+
+def agenda_item(number, modified, auxiliary_files):
+    return {
+        "id": f"{BASE}/agendaitems/{number}",
+        "type": "https://schema.oparl.org/1.1/AgendaItem",
+        "name": f"Tagesordnungspunkt {number}",
+        "auxiliaryFile": [{"id": f"{BASE}/files/{file_number}"} for file_number in auxiliary_files],
+        "modified": modified,
+    }
+
+
+def page(modified_2="2025-01-29T10:00:00+01:00", files_2=(3, 4)):
+    return [
+        agenda_item(1, "2025-01-29T10:00:00+01:00", [1, 2]),
+        agenda_item(2, modified_2, files_2),
+    ]
+
+
+def versions(cur, table, columns):
+    cur.execute(f"SELECT {columns}, xmin::TEXT, loaded_at FROM {table} ORDER BY {columns}")
+    return cur.fetchall()
+
+
+def links(cur):
+    cur.execute("SELECT agenda_item_id, file_id, position FROM agenda_item_file ORDER BY agenda_item_id, position")
+    return [(item.rsplit("/", 1)[1], file.rsplit("/", 1)[1], position) for item, file, position in cur.fetchall()]
+
+
+# Loading the page again rewrites only the object whose 'modified' changed, together with
+# its link rows; the other object and its links keep their row versions and loaded_at
+def test_reloaded_page_only_replaces_links_of_modified_objects(pg_cursor):
+    cur = pg_cursor
+    cur.execute(schema_ddl())
+    assert AGENDA_ITEM.load(cur, page()) == 2
+    cur.connection.commit()
+    items = versions(cur, "agenda_item", "agenda_item_id")
+    item_links = versions(cur, "agenda_item_file", "agenda_item_id, file_id")
+    assert links(cur) == [("1", "1", 1), ("1", "2", 2), ("2", "3", 1), ("2", "4", 2)]
+
+    assert AGENDA_ITEM.load(cur, page()) == 0
+    cur.connection.commit()
+    assert versions(cur, "agenda_item", "agenda_item_id") == items
+    assert versions(cur, "agenda_item_file", "agenda_item_id, file_id") == item_links
+
+    assert AGENDA_ITEM.load(cur, page(modified_2="2025-02-01T10:00:00+01:00", files_2=[4, 5])) == 1
+    cur.connection.commit()
+    assert links(cur) == [("1", "1", 1), ("1", "2", 2), ("2", "4", 1), ("2", "5", 2)]
+    reloaded = versions(cur, "agenda_item", "agenda_item_id")
+    assert reloaded[0] == items[0]
+    assert reloaded[1][2] > items[1][2]
+    reloaded_links = versions(cur, "agenda_item_file", "agenda_item_id, file_id")
+    assert reloaded_links[:2] == item_links[:2]
+    assert all(link[3] > items[1][2] for link in reloaded_links[2:])
+
+
+# Tables loaded before the link tables existed get their links from the array columns
+def test_backfill_fills_empty_link_tables_only(pg_cursor):
+    cur = pg_cursor
+    cur.execute(schema_ddl())
+    AGENDA_ITEM.load(cur, page())
+    cur.execute("DELETE FROM agenda_item_file")
+    backfill_links(cur)
+    assert links(cur) == [("1", "1", 1), ("1", "2", 2), ("2", "3", 1), ("2", "4", 2)]
+
+    cur.execute("DELETE FROM agenda_item_file WHERE position = 2")
+    backfill_links(cur)
+    assert links(cur) == [("1", "1", 1), ("2", "3", 1)]
@@ -0,0 +1,73 @@
+import datetime
+
+from backend.processing_manifest import (
+    Digests,
+    create_manifest_table,
+    metadata_hash,
+    processed_entries,
+    record_processed,
+    unprocessed_files,
+)
+
+KEY = "k" * 64
+DIGESTS = Digests("a" * 64, "b" * 40, "c" * 128)
+M1 = metadata_hash({"file_title": "Anlage 1"})
+M2 = metadata_hash({"file_title": "Anlage 1 (neu)"})
+
+
+def test_metadata_hash_changes_with_the_metadata():
+    metadata = {"file_title": "Anlage 1", "meeting_date": [datetime.date(2025, 1, 29)]}
+    assert metadata_hash(metadata) == metadata_hash(dict(reversed(list(metadata.items()))))
+    assert metadata_hash(metadata) != metadata_hash({**metadata, "file_title": "Anlage 1 (neu)"})
+
+
+# The same bytes under a second name get their own entry instead of renaming the first
+def test_entries_are_kept_per_pdf_name_and_metadata(pg_cursor):
+    cur = pg_cursor
+    create_manifest_table(cur)
+    record_processed(cur, "anlage_1.pdf", DIGESTS, KEY, 3, M1)
+    record_processed(cur, "anlage_1_kopie.pdf", DIGESTS, KEY, 3, M1)
+    record_processed(cur, "anlage_1.pdf", DIGESTS, KEY, 4, M2)
+    assert processed_entries(cur, KEY) == {
+        (DIGESTS.sha256, "anlage_1.pdf", M2),
+        (DIGESTS.sha256, "anlage_1_kopie.pdf", M1),
+    }
+
+
+def test_legacy_primary_key_is_migrated(pg_cursor):
+    cur = pg_cursor
+    cur.execute("""
+    CREATE TABLE pdf_processing_manifest (
+        sha256 CHAR(64) NOT NULL,
+        pipeline_key CHAR(64) NOT NULL,
+        pdf_name VARCHAR(255) NOT NULL,
+        sha1 CHAR(40) NOT NULL,
+        sha512 CHAR(128) NOT NULL,
+        chunks INTEGER NOT NULL,
+        processed_at TIMESTAMPTZ DEFAULT now(),
+        PRIMARY KEY (sha256, pipeline_key)
+    )
+    """)
+    cur.execute("INSERT INTO pdf_processing_manifest VALUES (%s, %s, 'anlage_1.pdf', %s, %s, 3)",
+                (DIGESTS.sha256, KEY, DIGESTS.sha1, DIGESTS.sha512))
+    create_manifest_table(cur)
+    create_manifest_table(cur)
+    record_processed(cur, "anlage_1_kopie.pdf", DIGESTS, KEY, 3, M1)
+    assert processed_entries(cur, KEY) == {
+        (DIGESTS.sha256, "anlage_1.pdf", None),
+        (DIGESTS.sha256, "anlage_1_kopie.pdf", M1),
+    }
+
+
+def test_unprocessed_files_match_checksum_and_name(pg_cursor):
+    cur = pg_cursor
+    create_manifest_table(cur)
+    record_processed(cur, "anlage_1.pdf", DIGESTS, KEY, 3, M1)
+    cur.execute("""
+    CREATE TABLE file (file_name VARCHAR(255), download_url VARCHAR(255), sha1_checksum VARCHAR(40), sha512_checksum TEXT);
+    INSERT INTO file VALUES
+        ('anlage_1.pdf', 'https://example.org/1', NULL, %(sha512)s),
+        ('anlage_1_kopie.pdf', 'https://example.org/2', NULL, %(sha512)s),
+        ('anlage_2.pdf', 'https://example.org/3', NULL, NULL);
+    """, {"sha512": DIGESTS.sha512.upper()})
+    assert [name for name, _ in unprocessed_files(cur, cur, KEY)] == ["anlage_1_kopie.pdf", "anlage_2.pdf"]
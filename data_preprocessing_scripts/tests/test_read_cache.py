@@ -0,0 +1,62 @@
+import time
+
+from backend.doc_store import ReadCache
+
+
+def test_least_recently_used_entries_are_evicted_by_size():
+    cache = ReadCache(max_bytes=30, ttl=60)
+    _, generation = cache.lookup([])
+    cache.fill([("a", b"a" * 10, 10), ("b", b"b" * 10, 10), ("c", b"c" * 10, 10)], generation)
+    found, generation = cache.lookup(["a"])  # a becomes the most recently used
+    assert found == {"a": b"a" * 10}
+    cache.fill([("d", b"d" * 10, 10)], generation)
+    found, _ = cache.lookup(["a", "b", "c", "d"])
+    assert sorted(found) == ["a", "c", "d"]
+    assert cache.evictions == 1
+    assert cache.bytes == 30
+
+
+def test_values_larger_than_the_cache_are_not_cached():
+    cache = ReadCache(max_bytes=5, ttl=60)
+    _, generation = cache.lookup([])
+    cache.fill([("big", b"x" * 10, 10)], generation)
+    assert cache.lookup(["big"])[0] == {}
+    assert cache.bytes == 0
+
+
+def test_entries_expire_after_ttl():
+    cache = ReadCache(ttl=0.01)
+    _, generation = cache.lookup([])
+    cache.fill([("a", b"a", 1)], generation)
+    assert cache.lookup(["a"])[0] == {"a": b"a"}
+    time.sleep(0.02)
+    assert cache.lookup(["a"])[0] == {}
+    assert cache.expirations == 1
+    assert cache.bytes == 0
+
+
+# mset/mdelete invalidate their keys after the commit; a fill with values read before that
+# (older generation) must not bring the old values back
+def test_invalidation_drops_entries_and_older_fills():
+    cache = ReadCache(ttl=60)
+    _, generation = cache.lookup([])
+    cache.fill([("a", b"old", 3), ("b", b"b", 1)], generation)
+
+    _, generation = cache.lookup(["c"])
+    cache.invalidate(["a"])
+    cache.fill([("c", b"read before the write", 21)], generation)
+    found, generation = cache.lookup(["a", "b", "c"])
+    assert found == {"b": b"b"}
+    assert cache.invalidations == 1
+
+    cache.fill([("a", b"new", 3)], generation)
+    assert cache.lookup(["a"])[0] == {"a": b"new"}
+
+
+def test_clear_empties_the_cache():
+    cache = ReadCache(ttl=60)
+    _, generation = cache.lookup([])
+    cache.fill([("a", b"a", 1)], generation)
+    cache.clear()
+    assert cache.lookup(["a"])[0] == {}
+    assert cache.bytes == 0
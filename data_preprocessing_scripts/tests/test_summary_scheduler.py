@@ -0,0 +1,42 @@
+import asyncio
+
+from backend.summary_scheduler import SummaryScheduler
+
+
+# Chain whose answers take as long as the test says, like an API getting slower under load
+class FakeChain:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def ainvoke(self, inputs, config=None):
+        await asyncio.sleep(self.latency)
+        return f"summary of {inputs['element']}"
+
+
+def inputs(count):
+    return [{"element": f"chunk {i}"} for i in range(count)]
+
+
+def run_fast_then_slow(latency_target):
+    chain = FakeChain(latency=0.005)
+    scheduler = SummaryScheduler(chain, initial_concurrency=8, latency_target=latency_target)
+    try:
+        assert scheduler.batch(inputs(2)) == ["summary of chunk 0", "summary of chunk 1"]
+        scheduler.batch(inputs(200))
+        fast = scheduler.concurrency
+        chain.latency = 0.1
+        scheduler.batch(inputs(20))
+        return fast, scheduler.concurrency
+    finally:
+        scheduler.close()
+
+
+def test_concurrency_drops_when_latency_exceeds_target():
+    fast, slow = run_fast_then_slow(latency_target=0.05)
+    assert fast > 8
+    assert slow < fast / 2
+
+
+def test_concurrency_keeps_growing_without_latency_target():
+    fast, slow = run_fast_then_slow(latency_target=None)
+    assert slow > fast
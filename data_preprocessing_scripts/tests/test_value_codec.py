@@ -0,0 +1,43 @@
+import dataclasses
+import datetime
+import decimal
+import pickle
+
+import pytest
+from langchain_core.documents import Document
+
+from backend.value_codec import JsonCodec, PickleDecodeError, decode
+
+
+@pytest.mark.parametrize("codec", [JsonCodec(), JsonCodec(compression_level=3)])
+def test_dates_round_trip_as_their_types(codec):
+    document = Document(page_content="Turmbergbahn " * 20, metadata={
+        "meeting_date": [datetime.date(2025, 1, 29), None],
+        "created": datetime.datetime(2025, 1, 29, 10, 0, tzinfo=datetime.timezone.utc),
+        "start": datetime.time(18, 30),
+        "reference": "2025/00001",
+    })
+    decoded = codec.decode(codec.encode(document))
+    assert decoded == document
+    assert type(decoded.metadata["meeting_date"][0]) is datetime.date
+    assert type(decoded.metadata["created"]) is datetime.datetime
+
+
+@dataclasses.dataclass
+class Page:
+    number: int
+
+
+# Types the JSON codec would not decode to the same value fail instead of being stored
+@pytest.mark.parametrize("value", [decimal.Decimal("1.10"), Page(1), object()])
+def test_unsupported_types_are_rejected(value):
+    document = Document(page_content="Turmbergbahn", metadata={"value": value})
+    with pytest.raises(TypeError):
+        JsonCodec().encode(document)
+
+
+def test_pickle_is_only_read_when_allowed():
+    data = pickle.dumps({"page_content": "x"})
+    with pytest.raises(PickleDecodeError):
+        decode(data)
+    assert decode(data, allow_pickle=True) == {"page_content": "x"}
@@ -0,0 +1,34 @@
+import argparse
+import psycopg
+import os
+from dotenv import load_dotenv
+
+from backend.ingest_writer import collect_orphans
+
+load_dotenv()
+
+parser = argparse.ArgumentParser(description="Verwaiste Einträge im Vektor- und Dokumentspeicher finden und löschen")
+parser.add_argument("--dbname", default="production_turmbergbahn_large_embed_metadata", help="Vektordatenbank")
+parser.add_argument("--collection", default="summaries", help="Collection der Zusammenfassungen im Vektorspeicher")
+parser.add_argument("--docstore-collection", default="original_chunks", help="Collection der Original-Chunks im Dokumentspeicher")
+parser.add_argument("--dry-run", action="store_true", help="Verwaiste Einträge nur zählen, nicht löschen")
+args = parser.parse_args()
+
+# Verbindung zur Vektordatenbank herstellen
+conn = psycopg.connect(
+    dbname=args.dbname,
+    user=os.getenv('DB_USER'),
+    password=os.getenv('DB_PASSWORD'),
+    host=os.getenv('DB_HOST'),
+    port="5432"
+)
+
+# Zusammenfassungen, deren doc_id im Dokumentspeicher fehlt, und Chunks ohne Zusammenfassung
+# werden in einer Transaktion gelöscht (je ein Anti-Join statt Abfragen pro Eintrag)
+with conn.cursor() as cur:
+    vectors, chunks = collect_orphans(cur, args.collection, args.docstore_collection, dry_run=args.dry_run)
+conn.commit()
+conn.close()
+
+action = "gefunden" if args.dry_run else "gelöscht"
+print(f"{vectors} verwaiste Zusammenfassungen und {chunks} verwaiste Chunks {action}")